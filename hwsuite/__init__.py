@@ -15,6 +15,7 @@ CFG_CACHE_DISABLED = False
 _CACHE = {}
 _KEY_CFG = 'config'
 BUILD_DIR_BASENAME = 'cmake-build-debug'
+CACHE_DIR_BASENAME = '.hwcache'
 _LOG_LEVEL_CHOICES = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
 
 
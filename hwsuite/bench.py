@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+"""
+    bench.py measures check throughput on a synthetic project.
+
+    A project with a configurable number of questions and generated test cases
+    is created, and then check is run under a grid of settings. Cases per second
+    and case latency percentiles are reported, optionally compared with a
+    stored baseline. No network access is required.
+"""
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from typing import List, Dict, Any, NamedTuple, Optional, Sequence
+
+import hwsuite
+import hwsuite.init
+import hwsuite.question
+from hwsuite import check
+from hwsuite.history import percentile
+
+_log = logging.getLogger(__name__)
+_DEFAULT_SEED = 12345
+_DEFAULT_THREADS = (1, 4)
+_DEFAULT_PAUSES = (0.05, 0.5)
+_DEFAULT_BACKENDS = ('auto', 'never')
+
+_INTERACTIVE_MAIN_CPP = """\
+#include <iostream>
+using namespace std;
+int main() {
+    int a, b;
+    cout << "Enter two numbers: ";
+    cin >> a;
+    cin >> b;
+    cout << "Sum = " << (a + b) << endl;
+    return 0;
+}
+"""
+
+_NONINTERACTIVE_MAIN_CPP = """\
+#include <iostream>
+#include <cstdlib>
+using namespace std;
+int main(int argc, char* argv[]) {
+    long total = 0;
+    for (int i = 1; i < argc; i++) {
+        total += atol(argv[i]);
+    }
+    cout << "Total = " << total << endl;
+    return 0;
+}
+"""
+
+
+class BenchConfig(NamedTuple):
+
+    threads: int
+    pause: float
+    backend: str
+
+    def key(self) -> str:
+        return f"threads={self.threads},pause={self.pause},backend={self.backend}"
+
+
+class BenchResult(NamedTuple):
+
+    config: BenchConfig
+    num_cases: int
+    elapsed: float
+    latencies: List[float]
+    exit_code: int
+
+    def cases_per_second(self) -> float:
+        return self.num_cases / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'cases': self.num_cases,
+            'cases_per_second': round(self.cases_per_second(), 3),
+            'p50_ms': round(percentile(self.latencies, 50) * 1000, 3),
+            'p95_ms': round(percentile(self.latencies, 95) * 1000, 3),
+        }
+
+
+def _write_text(text: str, pathname: str):
+    with open(pathname, 'w') as ofile:
+        ofile.write(text)
+
+
+def _generate_interactive(q_dir: str, num_cases: int, rng: random.Random):
+    _write_text(_INTERACTIVE_MAIN_CPP, os.path.join(q_dir, 'main.cpp'))
+    cases = []
+    for _ in range(num_cases):
+        a, b = rng.randint(-1000, 1000), rng.randint(-1000, 1000)
+        cases.append([a, b, a + b])
+    test_cases = {
+        'input': "{a} {b}\n",
+        'expected': "Enter two numbers: {a} {b}\nSum = {c}\n",
+        'param_names': ['a', 'b', 'c'],
+        'test_cases': cases,
+    }
+    _write_text(json.dumps(test_cases, indent=2), os.path.join(q_dir, 'test-cases.json'))
+
+
+def _generate_noninteractive(q_dir: str, num_cases: int, rng: random.Random):
+    _write_text(_NONINTERACTIVE_MAIN_CPP, os.path.join(q_dir, 'main.cpp'))
+    cases_dir = os.path.join(q_dir, 'test-cases')
+    os.makedirs(cases_dir, exist_ok=True)
+    precision = 1 + int(math.log10(max(num_cases, 1)))
+    for i in range(num_cases):
+        values = [rng.randint(-1000, 1000) for _ in range(rng.randint(1, 5))]
+        case_id = ("{0:0" + str(precision) + "d}").format(i + 1)
+        _write_text("".join(f"{v}\n" for v in values), os.path.join(cases_dir, f"{case_id}-args.txt"))
+        _write_text(f"Total = {sum(values)}\n", os.path.join(cases_dir, f"{case_id}-expected.txt"))
+
+
+def generate_project(proj_dir: str, num_questions: int, num_cases: int, interactive_ratio: float=0.5,
+                     seed: int=_DEFAULT_SEED) -> List[str]:
+    """Creates a synthetic project and returns the list of question directories.
+
+    The first round(num_questions * interactive_ratio) questions read input from
+    standard input and the rest take their input as command line arguments."""
+    hwsuite.init.do_init(proj_dir, 'ignore', {'question_model': {'project_name': 'bench'}})
+    rng = random.Random(seed)
+    num_interactive = int(round(num_questions * interactive_ratio))
+    q_dirs = []
+    for i in range(num_questions):
+        q_dir = os.path.join(proj_dir, f"q{i + 1}")
+        if not os.path.isdir(q_dir):
+            hwsuite.question._main_raw(proj_dir, os.path.basename(q_dir), excludes='question,testcases')
+        if i < num_interactive:
+            _generate_interactive(q_dir, num_cases, rng)
+        else:
+            _generate_noninteractive(q_dir, num_cases, rng)
+        q_dirs.append(q_dir)
+    return q_dirs
+
+
+def run_config(proj_dir: str, config: BenchConfig) -> BenchResult:
+    """Runs check on the project with the given settings and measures the case spans it traces."""
+    with tempfile.TemporaryDirectory() as tempdir:
+        trace_file = os.path.join(tempdir, 'trace.json')
+        args = check._create_arg_parser().parse_args([
+            '--project-dir', proj_dir,
+            '--threads', str(config.threads),
+            '--pause', str(config.pause),
+            '--require-screen', config.backend,
+            '--valgrind', 'applicability=never',
+            '--report', 'none',
+            '--trace', trace_file,
+        ])
+        start = time.perf_counter()
+        exit_code = check._main(args)
+        elapsed = time.perf_counter() - start
+        with open(trace_file, 'r') as ifile:
+            trace = json.load(ifile)
+    latencies = [e['dur'] / 1000000.0 for e in trace['traceEvents'] if e.get('ph') == 'X' and e['name'] == 'case']
+    return BenchResult(config, len(latencies), elapsed, latencies, exit_code)
+
+
+def load_baseline(pathname: str) -> Dict[str, Dict[str, float]]:
+    try:
+        with open(pathname, 'r') as ifile:
+            return json.load(ifile).get('results', {})
+    except FileNotFoundError:
+        _log.info("baseline %s not found", pathname)
+        return {}
+
+
+def store_baseline(results: Dict[str, Dict[str, float]], pathname: str):
+    with open(pathname, 'w') as ofile:
+        json.dump({'results': results}, ofile, indent=2)
+    _log.info("baseline written to %s", pathname)
+
+
+def _relative_change(current: float, baseline: Optional[float]) -> str:
+    if not baseline:
+        return ''
+    return "{0:+.1f}%".format((current - baseline) / baseline * 100)
+
+
+def compare_to_baseline(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+                        metrics: Sequence[str], ofile=sys.stdout):
+    """Prints a table of metrics per benchmark, with the change relative to the baseline where available."""
+    for key in sorted(results.keys()):
+        current, previous = results[key], baseline.get(key, {})
+        cells = []
+        for metric in metrics:
+            change = _relative_change(current[metric], previous.get(metric, None))
+            cells.append(f"{metric}={current[metric]}" + (f" ({change})" if change else ''))
+        print(f"{key}: " + "  ".join(cells), file=ofile)
+
+
+def _parse_list(listing: str, parse) -> List[Any]:
+    return [parse(item.strip()) for item in listing.split(',') if item.strip()]
+
+
+def main():
+    parser = ArgumentParser(description="Measure check throughput on a synthetic project.")
+    hwsuite.add_logging_options(parser)
+    parser.add_argument("-n", "--questions", type=int, default=2, metavar="N", help="number of questions to generate")
+    parser.add_argument("-m", "--cases", type=int, default=10, metavar="M", help="number of test cases per question")
+    parser.add_argument("--interactive-ratio", type=float, default=0.5, metavar="R", help="fraction of questions whose programs read standard input")
+    parser.add_argument("--threads", default=','.join(map(str, _DEFAULT_THREADS)), metavar="LIST", help="comma-separated concurrency levels to measure")
+    parser.add_argument("--pause", default=','.join(map(str, _DEFAULT_PAUSES)), metavar="LIST", help="comma-separated pause durations to measure")
+    parser.add_argument("--backends", default=','.join(_DEFAULT_BACKENDS), metavar="LIST", help="comma-separated --require-screen settings to measure")
+    parser.add_argument("--seed", type=int, default=_DEFAULT_SEED, help="random seed for generated test cases")
+    parser.add_argument("--project-dir", metavar="DIR", help="generate the project here instead of a temporary directory")
+    parser.add_argument("--baseline", metavar="FILE", help="compare results to baseline stored in FILE")
+    parser.add_argument("--save-baseline", action='store_true', help="store results in the baseline file")
+    args = parser.parse_args()
+    hwsuite.configure_logging(args)
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline requires --baseline")
+    configs = []
+    for threads in _parse_list(args.threads, int):
+        for pause in _parse_list(args.pause, float):
+            for backend in _parse_list(args.backends, str):
+                configs.append(BenchConfig(threads, pause, backend))
+    try:
+        with tempfile.TemporaryDirectory() as tempdir:
+            proj_dir = os.path.abspath(args.project_dir or os.path.join(tempdir, 'bench'))
+            generate_project(proj_dir, args.questions, args.cases, args.interactive_ratio, args.seed)
+            results = {}
+            for config in configs:
+                result = run_config(proj_dir, config)
+                if result.exit_code != 0:
+                    _log.warning("%s: check exited with code %s", config.key(), result.exit_code)
+                results[config.key()] = result.summary()
+    except hwsuite.MessageworthyException as ex:
+        print(f"{__name__}: {type(ex).__name__}: {ex}", file=sys.stderr)
+        return 1
+    baseline = load_baseline(args.baseline) if args.baseline else {}
+    compare_to_baseline(results, baseline, ('cases_per_second', 'p50_ms', 'p95_ms'))
+    if args.save_baseline:
+        store_baseline(results, args.baseline)
+    return 0
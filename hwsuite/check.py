@@ -7,6 +7,8 @@
 """
 import argparse
 import difflib
+import io
+import json
 import fnmatch
 import multiprocessing
 import urllib.parse
@@ -19,20 +21,43 @@ import tempfile
 import os.path
 import subprocess
 import time
-from hwsuite import testcases
+import queue
+import contextlib
+import signal
+import hashlib
+import shutil
+from hwsuite import testcases, tracing
+from hwsuite.history import RunHistory, TimeoutPolicy, DEFAULT_TIMEOUT_POLICY
+from hwsuite.resources import ResourceUsage, UsageLimits, Watchdog
+from hwsuite.sandbox import SandboxPool
+import hwsuite.corpus
+import hwsuite.sandbox
+import hwsuite.resources
+import hwsuite.history
+import hwsuite.shard
+import hwsuite.stress
+from hwsuite.stress import StressSpec
+from hwsuite.shard import Shard, CaseResult, write_results
 from subprocess import PIPE
 from argparse import ArgumentParser
-from typing import List, Tuple, Optional, NamedTuple, Dict, FrozenSet, Callable, Sequence
+from typing import List, Tuple, Optional, NamedTuple, Dict, FrozenSet, Callable, Sequence, Any, Generator, Union, Iterator, Hashable, Set
 import hwsuite.build
 
 
 _log = logging.getLogger(__name__)
 _DEFAULT_PAUSE_DURATION_SECONDS = 0.5
 _DEFAULT_PROCESSING_TIMEOUT_SECONDS = 5
+_SCREEN_QUIT_GRACE_SECONDS = 1.0
+_DISCOVERY_INDEX_BASENAME = 'discovery.json'
+_SCHEDULE_CHOICES = ('sorted', 'history')
+CANCELLED = 'cancelled'
+_DISCOVERY_INDEX_VERSION = 3
+FIXTURES_BASENAME = 'fixtures'
 _REPORT_CHOICES = ('diff', 'full', 'repr', 'none')
-_TEST_CASES_CHOICES = ('auto', 'require', 'existing')
+_TEST_CASES_CHOICES = ('auto', 'require', 'existing', 'virtual')
 _ERR_TEST_CASE_FAILURES = 3
 _STUFF_MODES = ('auto', 'strict')
+INPUT_MODES = ('screen', 'stdin')
 
 # Some characters have special meaning for the GNU screen 'stuff' command.
 # For some, we can octal-escape them, and others require different handling.
@@ -67,27 +92,134 @@ def read_file_lines(pathname: str, rstrip: Optional[str]=None) -> List[str]:
         return list(map(xform, ifile.readlines()))
 
 
+def stream_file_lines(pathname: Optional[str], rstrip: Optional[str]=None) -> Generator[str, None, None]:
+    """Yields lines of a file one at a time, or nothing if pathname is None.
+
+    The file is closed when the generator is exhausted or closed."""
+    if pathname is None:
+        return
+    with open(pathname, 'r') as ifile:
+        for line in ifile:
+            yield line if rstrip is None else line.rstrip(rstrip)
+
+
 class TestCase(NamedTuple):
+    """Test case defined by files, or a virtual test case that carries its input and expected text.
+
+    Virtual test cases are rendered from a definitions file without writing files;
+    they have a name instead of an expected output filename. Their texts are rendered
+    when they are requested, from the definitions file and the index of the case,
+    which is one less than its name, the case ID. Test cases packed in a
+    corpus also have a name, and their texts are read from the corpus on request.
+    Stress test cases have a name and a spec that says how their input is generated
+    and how their output is checked."""
 
     input_file: Optional[str]
     expected_file: Optional[str]
     env: Optional[FrozenSet[Tuple[str, str]]]
     args: Tuple[str, ...]
     exit_code: int
+    fixtures: Tuple[str, ...] = ()
+    name: Optional[str] = None
+    input_text: Optional[str] = None
+    expected_text: Optional[str] = None
+    corpus_file: Optional[str] = None
+    stress: Optional[StressSpec] = None
+    definitions_file: Optional[str] = None
 
     def env_dict(self) -> Optional[Dict[str, str]]:
         return None if self.env is None else dict(self.env)
 
     @staticmethod
     def create(input_file: Optional[str], expected_file: Optional[str], env: Optional[Dict[str, str]]=None,
-               args: Optional[Sequence[str]]=None, exit_code=0):
+               args: Optional[Sequence[str]]=None, exit_code=0, fixtures: Optional[Sequence[str]]=None):
         if env is not None:
             if isinstance(env, dict):
                 env = frozenset(env.items())
             else:
                 env = frozenset(env)
         args = tuple() if args is None else tuple(args)
-        return TestCase(input_file, expected_file, env, args, exit_code)
+        fixtures = tuple() if fixtures is None else tuple(fixtures)
+        return TestCase(input_file, expected_file, env, args, exit_code, fixtures)
+
+    @staticmethod
+    def create_virtual(name: str, input_text: Optional[str], expected_text: Optional[str], env: Optional[Dict[str, str]]=None,
+                       args: Optional[Sequence[str]]=None, exit_code=0, fixtures: Optional[Sequence[str]]=None) -> 'TestCase':
+        test_case = TestCase.create(None, None, env, args, exit_code, fixtures)
+        return test_case._replace(name=name, input_text=input_text, expected_text=expected_text)
+
+    @staticmethod
+    def create_rendered(definitions_file: str, case_id: str, fixtures: Optional[Sequence[str]]=None) -> 'TestCase':
+        test_case = TestCase.create(None, None, fixtures=fixtures)
+        return test_case._replace(name=case_id, definitions_file=definitions_file)
+
+    @staticmethod
+    def create_packed(corpus_file: str, name: str, env: Optional[Dict[str, str]]=None, args: Optional[Sequence[str]]=None,
+                      exit_code=0, fixtures: Optional[Sequence[str]]=None) -> 'TestCase':
+        test_case = TestCase.create(None, None, env, args, exit_code, fixtures)
+        return test_case._replace(name=name, corpus_file=corpus_file)
+
+    @staticmethod
+    def create_stress(name: str, spec: StressSpec, env: Optional[Dict[str, str]]=None, args: Optional[Sequence[str]]=None,
+                      exit_code=0) -> 'TestCase':
+        return TestCase.create(None, None, env, args, exit_code)._replace(name=name, stress=spec)
+
+    def is_virtual(self) -> bool:
+        return self.name is not None
+
+    def is_stress(self) -> bool:
+        return self.stress is not None
+
+    def is_packed(self) -> bool:
+        return self.corpus_file is not None
+
+    def is_rendered(self) -> bool:
+        return self.definitions_file is not None
+
+    def _case_index(self) -> int:
+        return int(self.name) - 1
+
+    def has_input(self) -> bool:
+        if self.is_stress() or self.is_rendered():
+            return True
+        if self.is_packed():
+            return hwsuite.corpus.open_corpus(self.corpus_file).entry(self.name).input is not None
+        return self.input_file is not None or self.input_text is not None
+
+    def embedded_input_text(self) -> Optional[str]:
+        """Returns the input text of a test case whose input is not in a file of its own, or None."""
+        if self.is_packed():
+            return hwsuite.corpus.open_corpus(self.corpus_file).read_input(self.name)
+        if self.is_rendered():
+            return testcases.open_definitions(self.definitions_file).input_text_at(self._case_index())
+        return self.input_text
+
+    def embedded_expected_text(self) -> Optional[str]:
+        """Returns the expected text of a test case whose expected output is not in a file of its own, or None."""
+        if self.is_packed():
+            return hwsuite.corpus.open_corpus(self.corpus_file).read_expected(self.name)
+        if self.is_rendered():
+            return testcases.open_definitions(self.definitions_file).expected_text_at(self._case_index())
+        return self.expected_text
+
+    def input_name(self) -> Optional[str]:
+        """Returns a name for the input of this test case, suitable for log messages, or None if it has no input."""
+        if self.input_file is not None:
+            return os.path.basename(self.input_file)
+        if self.input_text is not None or self.is_stress() or self.is_rendered() or (self.is_packed() and self.has_input()):
+            return f"{self.name}-input"
+        return None
+
+    def input_lines(self) -> Iterator[str]:
+        input_text = self.embedded_input_text()
+        if input_text is not None:
+            return iter(io.StringIO(input_text))
+        return stream_file_lines(self.input_file)
+
+    def read_expected_text(self) -> Optional[str]:
+        if self.expected_file is None:
+            return self.embedded_expected_text()
+        return read_file_text(self.expected_file)
 
     # noinspection PyMethodMayBeStatic
     def check_exit_code(self, exit_code: int) -> bool:
@@ -95,10 +227,113 @@ class TestCase(NamedTuple):
         return exit_code == self.exit_code
 
     def filter_key(self):
+        if self.name is not None:
+            return self.name
         if not self.expected_file:
             return ''
         return _derive_counterparts(self.expected_file).identifier
 
+    def sort_key(self) -> Tuple[str, str, Tuple[str, ...]]:
+        # test cases without an input or expected file are not orderable by tuple comparison because None < str fails
+        return self.expected_file or self.name or '', self.input_file or '', self.args
+
+    def label(self) -> str:
+        """Returns a short name for this test case, suitable for log messages and annotations."""
+        try:
+            return self.filter_key()
+        except ValueError:
+            return os.path.basename(self.expected_file)
+
+    def content_digest(self) -> str:
+        """Returns a digest of everything that determines the outcome of this test case apart from the program.
+
+        Fixture directories contribute their pathnames, not their contents, so only
+        test cases that share fixture directories can have the same digest."""
+        h = hashlib.sha256()
+
+        def update(label: str, text: Optional[str]):
+            data = b'' if text is None else text.encode('utf8')
+            h.update(f"{label}:{-1 if text is None else len(data)}\n".encode('utf8'))
+            h.update(data)
+        if self.input_file is not None:
+            with open(self.input_file, 'rb') as ifile:
+                data = ifile.read()
+            h.update(f"input:{len(data)}\n".encode('utf8'))
+            h.update(data)
+        else:
+            update('input', self.embedded_input_text())
+        update('expected', self.read_expected_text())
+        update('meta', self.meta_text())
+        return h.hexdigest()
+
+    def meta_text(self) -> str:
+        """Returns a serialization of the settings of this test case other than its input and expected output."""
+        return json.dumps([None if self.env is None else sorted(self.env), list(self.args), self.exit_code, list(self.fixtures),
+                           None if self.stress is None else self.stress.to_model()])
+
+    def content_outline(self) -> Tuple[Hashable, bool]:
+        """Returns a key that test cases with the same content digest share, and whether the key alone implies the same digest.
+
+        The key is computed without reading or rendering input and expected texts.
+        Rendered test cases are keyed by their parameters, which determine their
+        texts; other test cases are keyed by the sizes of their texts."""
+        if self.is_rendered():
+            params = testcases.open_definitions(self.definitions_file).params_at(self._case_index())
+            return ('rendered', self.definitions_file, json.dumps(params, sort_keys=True, default=repr), self.meta_text()), True
+
+        def size(pathname: Optional[str], text: Optional[str]) -> Optional[int]:
+            if pathname is not None:
+                return os.stat(pathname).st_size
+            return None if text is None else len(text.encode('utf8'))
+        if self.is_packed():
+            entry = hwsuite.corpus.open_corpus(self.corpus_file).entry(self.name)
+            sizes = tuple(None if span is None else span[1] for span in (entry.input, entry.expected))
+        else:
+            sizes = size(self.input_file, self.input_text), size(self.expected_file, self.expected_text)
+        return ('sized',) + sizes + (self.meta_text(),), False
+
+
+def group_duplicates(test_cases: Sequence[TestCase],
+                     settings_key: Optional[Callable[[TestCase], Hashable]]=None) -> Tuple[List[TestCase], Dict[TestCase, List[TestCase]]]:
+    """Groups test cases by content digest and by the value of settings_key, if it is not None.
+
+    Returns the first test case of each group, in the order given, and a map of
+    each of those to the other test cases in its group, which are its aliases.
+    A test case whose files cannot be read is not grouped with any other. The
+    settings key separates test cases that are run differently, such as test
+    cases with their own usage limits. Texts are read only to compare test
+    cases whose outlines match, and rendered test cases are compared by their
+    parameters, so grouping does not render them."""
+    distinct: List[TestCase] = []
+    aliases: Dict[TestCase, List[TestCase]] = {}
+    candidates: Dict[Tuple[Hashable, Hashable], List[TestCase]] = {}
+    digests: Dict[TestCase, str] = {}
+
+    def digest(tc: TestCase) -> str:
+        if tc not in digests:
+            digests[tc] = tc.content_digest()
+        return digests[tc]
+    for test_case in test_cases:
+        try:
+            outline, exact = test_case.content_outline()
+            key = outline, None if settings_key is None else settings_key(test_case)
+            firsts = candidates.setdefault(key, [])
+            if exact:
+                first = firsts[0] if firsts else None
+            else:
+                first = next((f for f in firsts if digest(f) == digest(test_case)), None) if firsts else None
+        except (OSError, ValueError, LookupError, hwsuite.MessageworthyException) as e:
+            # the failure is reported when the test case runs
+            _log.debug("%s: not grouped with duplicates: %s", test_case.label(), e)
+            distinct.append(test_case)
+            continue
+        if first is None:
+            firsts.append(test_case)
+            distinct.append(test_case)
+        else:
+            aliases.setdefault(first, []).append(test_case)
+    return distinct, aliases
+
 
 def _read_env(env_file: str) -> Dict[str, str]:
     env = {}
@@ -120,6 +355,7 @@ class TestCaseFilenameSet(NamedTuple):
     input: str
     env: str
     args: str
+    fixtures: str
 
 
 def _derive_counterparts(expected_pathname: str) -> TestCaseFilenameSet:
@@ -128,12 +364,13 @@ def _derive_counterparts(expected_pathname: str) -> TestCaseFilenameSet:
     def _derive(token, suffix) -> TestCaseFilenameSet:
         if suffix:
             identifier = basename[:len(basename) - len(token)]
-            return TestCaseFilenameSet(identifier, basename, identifier + '-input.txt', identifier + '-env.txt', identifier + '-args.txt')
+            return TestCaseFilenameSet(identifier, basename, identifier + '-input.txt', identifier + '-env.txt', identifier + '-args.txt', identifier + '-fixtures')
         else:
             identifier = basename[len(token):]
-            return TestCaseFilenameSet(os.path.splitext(identifier)[0], basename, 'input-' + identifier, 'env-' + identifier, 'args-' + identifier)
+            stem = os.path.splitext(identifier)[0]
+            return TestCaseFilenameSet(stem, basename, 'input-' + identifier, 'env-' + identifier, 'args-' + identifier, 'fixtures-' + stem)
     if basename == 'expected.txt':
-        return TestCaseFilenameSet('', basename, 'input.txt', 'env.txt', 'args.txt')
+        return TestCaseFilenameSet('', basename, 'input.txt', 'env.txt', 'args.txt', FIXTURES_BASENAME)
     elif basename.endswith("-expected.txt"):
         return _derive("-expected.txt", True)
     elif basename.endswith("-expected-output.txt", True):
@@ -143,7 +380,22 @@ def _derive_counterparts(expected_pathname: str) -> TestCaseFilenameSet:
     raise ValueError("basename pattern not recognized; should be something like *-input.txt or *-expected.txt")
 
 
-def _create_test_case(expected_pathname: str) -> TestCase:
+def _detect_fixtures(parent: str, case_fixtures_dirname: str, q_dir: Optional[str]) -> Tuple[str, ...]:
+    """Returns the fixture directories of a test case, from most general to most specific.
+
+    These are the question's fixtures directory, the fixtures directory beside the
+    expected output file, and the directory named for the test case, such as
+    01-fixtures for 01-expected.txt."""
+    candidates = [] if q_dir is None else [os.path.join(q_dir, FIXTURES_BASENAME)]
+    candidates += [os.path.join(parent, FIXTURES_BASENAME), os.path.join(parent, case_fixtures_dirname)]
+    fixtures = []
+    for candidate in map(os.path.normpath, candidates):
+        if candidate not in fixtures and os.path.isdir(candidate):
+            fixtures.append(candidate)
+    return tuple(fixtures)
+
+
+def _create_test_case(expected_pathname: str, q_dir: Optional[str]=None) -> TestCase:
     basename = os.path.basename(expected_pathname)
     filenames: TestCaseFilenameSet = _derive_counterparts(basename)
     parent = os.path.dirname(expected_pathname)
@@ -158,17 +410,281 @@ def _create_test_case(expected_pathname: str) -> TestCase:
     args = tuple()
     if os.path.exists(args_file):
         args = tuple(read_file_lines(args_file, rstrip="\n"))
-    return TestCase.create(input_file, expected_pathname, env, args)
+    fixtures = _detect_fixtures(parent, filenames.fixtures, q_dir)
+    return TestCase.create(input_file, expected_pathname, env, args, fixtures=fixtures)
 
 
-def detect_test_case_files(q_dir: str) -> List[TestCase]:
+def _create_packed_test_cases(corpus_file: str, q_dir: Optional[str]=None) -> List[TestCase]:
+    """Returns the test cases in a corpus. A test case's own fixtures directory is named like NN-fixtures beside the corpus."""
+    parent = os.path.dirname(corpus_file)
+    test_cases = []
+    for entry in hwsuite.corpus.open_corpus(corpus_file).entries:
+        fixtures = _detect_fixtures(parent, f"{entry.name}-{FIXTURES_BASENAME}", q_dir)
+        test_cases.append(TestCase.create_packed(corpus_file, entry.name, entry.env, entry.args, entry.exit_code, fixtures))
+    return test_cases
+
+
+def _is_expected_filename(f: str) -> bool:
+    return f.startswith('expected-output') or f.endswith('-expected.txt') or f.endswith('-expected-output.txt') or f == 'expected.txt'
+
+
+def _fixtures_dirnames(q_dir: str, root: str, files: List[str]) -> Set[str]:
+    """Returns the names of the subdirectories of root that are fixture directories of test cases.
+
+    These are the fixtures directories named for test cases in root, and the
+    general fixtures directory if root has test cases or is the question directory."""
+    dirnames = set()
+    for f in files:
+        if _is_expected_filename(f):
+            dirnames.add(_derive_counterparts(f).fixtures)
+        elif hwsuite.corpus.is_corpus_filename(f):
+            dirnames.update(f"{entry.name}-{FIXTURES_BASENAME}" for entry in hwsuite.corpus.open_corpus(os.path.join(root, f)).entries)
+    if dirnames or os.path.normpath(root) == os.path.normpath(q_dir):
+        dirnames.add(FIXTURES_BASENAME)
+    return dirnames
+
+
+def _listed_files(q_dir: str, root: str, dirs: List[str], files: List[str]) -> List[str]:
+    """Prunes the subdirectories to be walked and returns the files to consider in a directory.
+
+    The cache directory and fixture directories are not walked. A directory of
+    generated test cases lists its files in a manifest, which is trusted instead
+    of the directory listing, so stale files are ignored."""
+    if testcases.MANIFEST_BASENAME in files:
+        manifest = testcases.read_manifest(root)
+        if manifest is not None:
+            dirs[:] = []
+            return manifest
+    skipped = _fixtures_dirnames(q_dir, root, files)
+    skipped.add(hwsuite.CACHE_DIR_BASENAME)
+    dirs[:] = [d for d in dirs if d not in skipped]
+    return files
+
+
+def _scan_test_case_files(q_dir: str) -> List[TestCase]:
     test_cases = []
     for root, dirs, files in os.walk(q_dir):
-        for f in files:
-            if f.startswith('expected-output') or f.endswith('-expected.txt') or f.endswith('-expected-output.txt') or f == 'expected.txt':
-                test_case = _create_test_case(os.path.join(root, f))
+        for f in _listed_files(q_dir, root, dirs, files):
+            if _is_expected_filename(f):
+                test_case = _create_test_case(os.path.join(root, f), q_dir)
                 test_cases.append(test_case)
-    return sorted(test_cases)
+            elif hwsuite.corpus.is_corpus_filename(f):
+                test_cases += _create_packed_test_cases(os.path.join(root, f), q_dir)
+    return sorted(test_cases, key=TestCase.sort_key)
+
+
+class DiscoveryIndex(NamedTuple):
+    """Index of the test cases discovered in a question directory.
+
+    Pathnames are stored relative to the question directory. The index is valid as
+    long as the modification times of the directories walked and of the manifests,
+    corpora, env files, and args files parsed are unchanged; adding, removing, or renaming a file changes the
+    modification time of its directory."""
+
+    dir_mtimes: Dict[str, int]
+    file_mtimes: Dict[str, int]
+    test_cases: List[TestCase]
+
+    def is_current(self, q_dir: str) -> bool:
+        for relpaths in (self.dir_mtimes, self.file_mtimes):
+            for relpath, mtime_ns in relpaths.items():
+                try:
+                    if os.stat(os.path.join(q_dir, relpath)).st_mtime_ns != mtime_ns:
+                        return False
+                except FileNotFoundError:
+                    return False
+        return True
+
+    def to_model(self, q_dir: str) -> Dict[str, Any]:
+        def relative(pathname):
+            return None if pathname is None else os.path.relpath(pathname, q_dir)
+        return {
+            'version': _DISCOVERY_INDEX_VERSION,
+            'dirs': self.dir_mtimes,
+            'files': self.file_mtimes,
+            'test_cases': [{
+                'input': relative(tc.input_file),
+                'expected': relative(tc.expected_file),
+                'env': None if tc.env is None else sorted(tc.env),
+                'args': list(tc.args),
+                'exit_code': tc.exit_code,
+                'fixtures': [relative(d) for d in tc.fixtures],
+                'name': tc.name,
+                'corpus': relative(tc.corpus_file),
+            } for tc in self.test_cases],
+        }
+
+    @staticmethod
+    def from_model(model: Dict[str, Any], q_dir: str) -> 'DiscoveryIndex':
+        if model.get('version', None) != _DISCOVERY_INDEX_VERSION:
+            raise ValueError("unsupported discovery index version")
+        def absolute(relpath):
+            return None if relpath is None else os.path.join(q_dir, relpath)
+        test_cases = []
+        for tc in model['test_cases']:
+            env = None if tc['env'] is None else [tuple(item) for item in tc['env']]
+            fixtures = [absolute(d) for d in tc['fixtures']]
+            if tc['corpus'] is not None:
+                test_cases.append(TestCase.create_packed(absolute(tc['corpus']), tc['name'], env, tc['args'], tc['exit_code'], fixtures))
+            else:
+                test_cases.append(TestCase.create(absolute(tc['input']), absolute(tc['expected']), env, tc['args'], fixtures=fixtures))
+        return DiscoveryIndex(model['dirs'], model['files'], test_cases)
+
+    @staticmethod
+    def build(q_dir: str) -> 'DiscoveryIndex':
+        """Walks the question directory and creates an index of the test cases found."""
+        dir_mtimes, file_mtimes, test_cases = {}, {}, []
+        for root, dirs, files in os.walk(q_dir):
+            dir_mtimes[os.path.relpath(root, q_dir)] = os.stat(root).st_mtime_ns
+            if testcases.MANIFEST_BASENAME in files:
+                manifest_file = os.path.join(root, testcases.MANIFEST_BASENAME)
+                file_mtimes[os.path.relpath(manifest_file, q_dir)] = os.stat(manifest_file).st_mtime_ns
+            for f in _listed_files(q_dir, root, dirs, files):
+                if hwsuite.corpus.is_corpus_filename(f):
+                    corpus_file = os.path.join(root, f)
+                    test_cases += _create_packed_test_cases(corpus_file, q_dir)
+                    file_mtimes[os.path.relpath(corpus_file, q_dir)] = os.stat(corpus_file).st_mtime_ns
+                elif _is_expected_filename(f):
+                    test_case = _create_test_case(os.path.join(root, f), q_dir)
+                    test_cases.append(test_case)
+                    filenames = _derive_counterparts(f)
+                    for parsed in (filenames.env, filenames.args):
+                        if parsed in files:
+                            file_mtimes[os.path.relpath(os.path.join(root, parsed), q_dir)] = os.stat(os.path.join(root, parsed)).st_mtime_ns
+        return DiscoveryIndex(dir_mtimes, file_mtimes, sorted(test_cases, key=TestCase.sort_key))
+
+
+def _discovery_index_pathname(q_dir: str) -> str:
+    return os.path.join(q_dir, hwsuite.CACHE_DIR_BASENAME, _DISCOVERY_INDEX_BASENAME)
+
+
+def _load_discovery_index(q_dir: str) -> Optional[DiscoveryIndex]:
+    try:
+        with open(_discovery_index_pathname(q_dir), 'r') as ifile:
+            return DiscoveryIndex.from_model(json.load(ifile), q_dir)
+    except FileNotFoundError:
+        return None
+    except (ValueError, KeyError, TypeError) as e:
+        _log.debug("ignoring unreadable discovery index in %s: %s", q_dir, e)
+        return None
+
+
+def _store_discovery_index(index: DiscoveryIndex, q_dir: str):
+    index_file = _discovery_index_pathname(q_dir)
+    try:
+        fd, temp_file = tempfile.mkstemp(prefix=_DISCOVERY_INDEX_BASENAME, dir=os.path.dirname(index_file))
+        try:
+            with os.fdopen(fd, 'w') as ofile:
+                json.dump(index.to_model(q_dir), ofile)
+            os.replace(temp_file, index_file)
+        except BaseException:
+            os.unlink(temp_file)
+            raise
+    except OSError as e:
+        _log.debug("failed to store discovery index in %s: %s", q_dir, e)
+
+
+def detect_test_case_files(q_dir: str, use_index: bool=True) -> List[TestCase]:
+    """Returns the test cases defined by files in a question directory.
+
+    Unless use_index is false, the test cases found are indexed in the question's
+    cache directory, and the index is used instead of walking the directory as long
+    as it is current."""
+    if not use_index:
+        return _scan_test_case_files(q_dir)
+    # the cache directory must exist before modification times are recorded, because creating it modifies q_dir
+    try:
+        os.makedirs(os.path.join(q_dir, hwsuite.CACHE_DIR_BASENAME), exist_ok=True)
+    except OSError as e:
+        _log.debug("not indexing test cases because cache directory could not be created: %s", e)
+        return _scan_test_case_files(q_dir)
+    index = _load_discovery_index(q_dir)
+    if index is not None and index.is_current(q_dir):
+        return list(index.test_cases)
+    index = DiscoveryIndex.build(q_dir)
+    _store_discovery_index(index, q_dir)
+    return list(index.test_cases)
+
+
+def create_virtual_test_cases(defs_file: str, dest_dirname: str=testcases._DEFAULT_TEST_CASES_DIRNAME) -> List[TestCase]:
+    """Creates virtual test cases for the test cases defined in a definitions file, without writing files.
+
+    The texts of the test cases are rendered when they are requested, so they are
+    not all held in memory at once. If the definitions name a reference, it is run
+    on all inputs now, in batches, so that its outputs are cached when requested.
+    Fixtures are detected as they would be for the files that generation writes
+    to the destination directory."""
+    q_dir = os.path.dirname(defs_file)
+    dest_dir = os.path.join(q_dir, dest_dirname)
+    try:
+        dest_entries = set(os.listdir(dest_dir))
+    except FileNotFoundError:
+        dest_entries = set()
+    general_fixtures = [d for d in (os.path.join(q_dir, FIXTURES_BASENAME), os.path.join(dest_dir, FIXTURES_BASENAME)) if os.path.isdir(d)]
+    param_source = testcases.open_definitions(defs_file)
+    if param_source.oracle is not None:
+        for _ in param_source.render_all():
+            pass
+    test_cases = []
+    for index in range(param_source.count()):
+        case_id = param_source.case_id(index)
+        fixtures = list(general_fixtures)
+        if f"{case_id}-{FIXTURES_BASENAME}" in dest_entries:
+            fixtures.append(os.path.join(dest_dir, f"{case_id}-{FIXTURES_BASENAME}"))
+        test_cases.append(TestCase.create_rendered(defs_file, case_id, fixtures))
+    return test_cases
+
+
+def create_stress_test_cases(defs_file: str) -> List[TestCase]:
+    """Returns the stress test cases listed in a definitions file."""
+    test_cases = []
+    for case_model, spec in hwsuite.stress.load_stress_definitions(defs_file):
+        test_cases.append(TestCase.create_stress(case_model['name'], spec, case_model.get('env', None), case_model.get('args', None),
+                                                 case_model.get('exit_code', 0)))
+    return test_cases
+
+
+def _feed_chunks(pipe, chunks: Iterator[bytes], errors: List[Exception]):
+    """Writes chunks to a pipe and closes it. Writes block while the pipe is full, which paces generation.
+    A program that exits without reading all of its input is not an error."""
+    try:
+        for chunk in chunks:
+            pipe.write(chunk)
+    except BrokenPipeError:
+        pass
+    except Exception as e:
+        errors.append(e)
+    finally:
+        try:
+            pipe.close()
+        except BrokenPipeError:
+            pass
+
+
+class SpooledText(NamedTuple):
+    """Stand-in for text that an outcome no longer holds in memory.
+
+    The digest and size are always available. The text itself can be read only
+    if it was spilled to a file."""
+
+    digest: str
+    size: int
+    pathname: Optional[str]
+
+    def read(self) -> str:
+        if self.pathname is None:
+            raise ValueError("text was not retained")
+        with open(self.pathname, 'r', encoding='utf8') as ifile:
+            return ifile.read()
+
+    @staticmethod
+    def digest_of(text: str) -> Tuple[str, int]:
+        data = text.encode('utf8')
+        return hashlib.sha256(data).hexdigest(), len(data)
+
+
+def _text_of(text: Optional[Union[str, SpooledText]]) -> Optional[str]:
+    return text.read() if isinstance(text, SpooledText) else text
 
 
 class TestCaseOutcome(NamedTuple):
@@ -176,9 +692,108 @@ class TestCaseOutcome(NamedTuple):
     passed: bool
     executable: str
     test_case: TestCase
-    expected_text: Optional[str]
-    actual_text: str
+    expected_text: Optional[Union[str, SpooledText]]
+    actual_text: Union[str, SpooledText]
     message: str
+    usage: Optional[ResourceUsage] = None
+
+    def read_expected_text(self) -> Optional[str]:
+        return _text_of(self.expected_text)
+
+    def read_actual_text(self) -> str:
+        return _text_of(self.actual_text)
+
+
+class OutcomeSpool(object):
+    """Keeps outcome texts out of memory.
+
+    Texts of passing outcomes are replaced by their digests. Texts of failing
+    outcomes are written to files in a temporary directory, from which they are
+    read when reported. The directory is removed when the spool is closed."""
+
+    def __init__(self, parent: Optional[str]=None):
+        self.directory = tempfile.mkdtemp(prefix='hwsuite-outcomes-', dir=parent)
+        self.lock = threading.Lock()
+        self.counter = 0
+
+    def _spill(self, text: Optional[Union[str, SpooledText]]) -> Optional[Union[str, SpooledText]]:
+        if not isinstance(text, str):
+            return text
+        digest, size = SpooledText.digest_of(text)
+        with self.lock:
+            self.counter += 1
+            pathname = os.path.join(self.directory, f"{self.counter}.txt")
+        with open(pathname, 'w', encoding='utf8') as ofile:
+            ofile.write(text)
+        return SpooledText(digest, size, pathname)
+
+    @staticmethod
+    def _digest(text: Optional[Union[str, SpooledText]]) -> Optional[Union[str, SpooledText]]:
+        if not isinstance(text, str):
+            return text
+        return SpooledText(*SpooledText.digest_of(text), None)
+
+    def compact(self, outcome: TestCaseOutcome) -> TestCaseOutcome:
+        convert = self._digest if outcome.passed else self._spill
+        return outcome._replace(expected_text=convert(outcome.expected_text), actual_text=convert(outcome.actual_text))
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+class QuestionSettings(NamedTuple):
+    """Settings that govern how a question's test cases are run.
+
+    These are read from the question's test case definitions file, if present.
+    A processing timeout defined there overrides the one derived from run history.
+    An input mode of 'stdin' means the input file is the program's standard input
+    and the expected output does not contain the echoed input; 'screen' means
+    input lines are typed into the program through screen."""
+
+    limits: UsageLimits
+    case_limits: Dict[str, UsageLimits]
+    processing_timeout: Optional[float] = None
+    input_mode: Optional[str] = None
+
+    def limits_for(self, test_case: TestCase) -> UsageLimits:
+        return self.case_limits.get(test_case.label(), self.limits)
+
+    @staticmethod
+    def default(limits: UsageLimits=hwsuite.resources.NO_LIMITS) -> 'QuestionSettings':
+        return QuestionSettings(limits, {})
+
+    @staticmethod
+    def from_model(model: Dict, defaults: UsageLimits=hwsuite.resources.NO_LIMITS) -> 'QuestionSettings':
+        """Creates settings from a definitions model; limits it defines override the given defaults."""
+        limits = defaults.update(model.get('limits', {}))
+        case_limits = {}
+        for identifier, case_model in model.get('case_limits', {}).items():
+            case_limits[identifier] = limits.update(case_model)
+        input_mode = model.get('input_mode', None)
+        if input_mode is not None and input_mode not in INPUT_MODES:
+            raise testcases.DefinitionsException(f"input_mode must be one of {INPUT_MODES}, not {repr(input_mode)}")
+        return QuestionSettings(limits, case_limits, model.get('processing_timeout', None), input_mode)
+
+    @staticmethod
+    def load(q_dir: str, defaults: UsageLimits=hwsuite.resources.NO_LIMITS,
+             definitions_filename: str=testcases._DEFAULT_DEFINITIONS_FILENAME) -> 'QuestionSettings':
+        defs_file = os.path.join(q_dir, definitions_filename)
+        try:
+            with open(defs_file, 'r') as ifile:
+                model = json.load(ifile)
+        except FileNotFoundError:
+            return QuestionSettings.default(defaults)
+        try:
+            return QuestionSettings.from_model(model, defaults)
+        except testcases.DefinitionsException as ex:
+            raise testcases.DefinitionsException(f"{defs_file}: {ex}") from ex
 
 
 class ProcessDefinition(NamedTuple):
@@ -187,6 +802,7 @@ class ProcessDefinition(NamedTuple):
     args: Tuple[str, ...]
     cwd: Optional[str]
     env: Optional[Dict[str, str]]
+    limits: UsageLimits = hwsuite.resources.NO_LIMITS
 
     def to_cmd(self):
         return [self.executable] + list(self.args)
@@ -242,10 +858,7 @@ class LogWatcher(object):
 
 
 def get_arg(args: argparse.Namespace, attr_name: str, default_value):
-    try:
-        return args.__getattr__(attr_name)
-    except AttributeError:
-        return default_value
+    return getattr(args, attr_name, default_value)
 
 
 class StuffContentException(ValueError):
@@ -309,6 +922,8 @@ class ScreenRunnable(object):
         self.completed_proc: Optional[subprocess.CompletedProcess] = None
         self.logfile = os.path.join(self.procdef.cwd, 'screenlog.0')
         self.num_stuffs = 0
+        self.started_at: Optional[float] = None
+        self.usage: Optional[ResourceUsage] = None
 
     def __str__(self):
         return f"ScreenRunnable<{self.procdef},launched={self.launched()},finished={self.finished()}>"
@@ -318,10 +933,22 @@ class ScreenRunnable(object):
 
     def start(self) -> subprocess.Popen:
         # TODO use -Logfile filename to make this more stable
-        cmd = ['screen', '-L', '-S', self.case_id, '-D', '-m', '--'] + self.procdef.to_cmd()
-        self.started_proc = subprocess.Popen(cmd, env=self.procdef.env, cwd=self.procdef.cwd, stdout=PIPE, stderr=PIPE)
+        cmd = ['screen', '-L', '-S', self.case_id, '-D', '-m', '--'] + self.procdef.limits.wrap_command(self.procdef.to_cmd())
+        self.started_at = time.perf_counter()
+        self.started_proc = subprocess.Popen(cmd, env=self.procdef.env, cwd=self.procdef.cwd, stdout=PIPE, stderr=PIPE,
+                                             start_new_session=True)
         return self.started_proc
 
+    def _reap(self, timeout: Optional[float]) -> bool:
+        """Waits for the screen process to terminate and collects its resource usage.
+
+        The usage of the screen process includes that of the program it ran.
+        Returns True if the process has terminated."""
+        usage = hwsuite.resources.wait_measured(self.started_proc, self.started_at, timeout)
+        if usage is not None:
+            self.usage = usage
+        return self.started_proc.returncode is not None
+
     def _started_to_completed(self, stdout='', stderr='') -> subprocess.CompletedProcess:
         assert self.started_proc is not None, "process must be started before calling this method"
         returncode = self.started_proc.returncode
@@ -330,16 +957,16 @@ class ScreenRunnable(object):
         self.completed_proc = subprocess.CompletedProcess(args, returncode, stdout, stderr)
         return self.completed_proc
 
-    def await_proc(self, timeout: float):
+    def await_proc(self, timeout: float) -> bool:
+        """Waits for the process to terminate. Returns True if it terminated before the timeout elapsed."""
         _log.debug("await_proc %s with timeout %s", self.started_proc, timeout)
-        try:
-            self.started_proc.wait(timeout)
+        if self._reap(timeout):
             self._started_to_completed()
             self.started_proc = None
             _log.debug("screen process completed with exit code %s", self.completed_proc.returncode)
-        except subprocess.TimeoutExpired:
-            _log.warning("process did not terminate before timeout of %s seconds elapsed", timeout)
-            pass
+            return True
+        _log.warning("process did not terminate before timeout of %s seconds elapsed", timeout)
+        return False
 
     def stuff(self, line: str, cfg: StuffConfig, line_num: int=0) -> subprocess.CompletedProcess:
         """Sends a line of text to process standard input.
@@ -372,8 +999,7 @@ class ScreenRunnable(object):
         if force_check:
             if not self.launched():
                 return False
-            returncode = self.started_proc.poll()
-            if returncode is None:
+            if not self._reap(0):
                 return False
             self._started_to_completed()
             return True
@@ -385,12 +1011,14 @@ class ScreenRunnable(object):
         if self.finished():
             return True
         _log.debug("quitting screen process")
-        if self.started_proc.poll() is not None:
+        if self._reap(0):
             self._started_to_completed()
             return True
         proc = subprocess.run(['screen', '-S', self.case_id, '-X', 'quit'], stdout=PIPE)
         exitcode = proc.returncode
         stdout = proc.stdout.decode('utf8')
+        if self._reap(_SCREEN_QUIT_GRACE_SECONDS):
+            self._started_to_completed()
         if not self.finished() and exitcode != 0:
             # there's a race here and we may not know the proc finished but it
             # did and 'quit' returned error, but there are no ill effects and
@@ -398,17 +1026,22 @@ class ScreenRunnable(object):
             _log.warning("screen 'quit' failed with code %s; stdout=%s", exitcode, repr(stdout))
         return exitcode == 0 or (exitcode == 1 and stdout.strip() == 'No screen session found')
 
+    def signal_all(self, sig: int=signal.SIGKILL):
+        """Signals the process groups of screen and of the program it runs, without waiting for them to terminate."""
+        open_proc = self.started_proc
+        if open_proc is not None and open_proc.returncode is None:
+            hwsuite.resources.kill_process_groups(open_proc.pid, sig)
+
     def kill(self) -> Optional[int]:
         open_proc = self.started_proc
         if open_proc is None:
             _log.info("proc not retained; maybe already finished? self.finished=%s", self.finished())
             return
-        _log.info("terminating process %s", open_proc.pid)
-        open_proc.terminate()
-        if open_proc.returncode is None:
-            _log.warning("SIGTERM pid %s had no effect; trying SIGKILL", open_proc.pid)
-            open_proc.kill()
-        _log.info("after term/kill attempt, returncode = %s", open_proc.returncode)
+        _log.info("killing process groups of screen process %s", open_proc.pid)
+        self.signal_all(signal.SIGKILL)
+        if self._reap(None):
+            self._started_to_completed()
+        _log.info("after kill attempt, returncode = %s", open_proc.returncode)
         return open_proc.returncode
 
     def logfile_text(self, ignore_failure: bool=False) -> str:
@@ -434,13 +1067,13 @@ class ValgrindConfig(NamedTuple):
     verbosity: str            # values: normal, quiet
 
     def is_applicable(self, test_case: TestCase) -> bool:
-        _log.debug("deciding whether to valgrind with applicability=%s and input=%s", self.applicability, test_case.input_file)
+        _log.debug("deciding whether to valgrind with applicability=%s and input=%s", self.applicability, test_case.input_name())
         if self.applicability == 'always':
             return True
         if self.applicability == 'never':
             return False
         if self.applicability == 'auto':
-            return test_case.input_file is None
+            return not test_case.has_input()
         raise ValueError("applicability is not recognized in this config object")
 
     def build_command(self, subject_cmd: Sequence[str]) -> List[str]:
@@ -486,10 +1119,13 @@ class ValgrindRunner(object):
     def __init__(self, config: ValgrindConfig):
         self.config = config
 
-    def run(self, cmd: List[str], env: Optional[Dict[str, str]], cwd: str) -> subprocess.CompletedProcess:
+    def run(self, cmd: List[str], env: Optional[Dict[str, str]], cwd: str, stdin=None,
+            input_data: Optional[bytes]=None) -> subprocess.CompletedProcess:
         valgrind_cmd = self.config.build_command(cmd)
         _log.debug("running %s with environment %s", valgrind_cmd, env)
-        proc = subprocess.run(valgrind_cmd, stdout=PIPE, stderr=PIPE, env=env, cwd=cwd)
+        if input_data is not None:
+            return subprocess.run(valgrind_cmd, input=input_data, stdout=PIPE, stderr=PIPE, env=env, cwd=cwd)
+        proc = subprocess.run(valgrind_cmd, stdin=stdin, stdout=PIPE, stderr=PIPE, env=env, cwd=cwd)
         _log.debug("valgrind terminated with code %s", proc.returncode)
         return proc
 
@@ -504,16 +1140,65 @@ class Result(NamedTuple):
 class TestCaseRunner(object):
 
     def __init__(self, executable, throttle: Throttle, stuff_config: StuffConfig, require_screen = 'auto',
-                 valgrind_config: ValgrindConfig = VALGRIND_DISABLED):
+                 valgrind_config: ValgrindConfig = VALGRIND_DISABLED, tracer: tracing.Tracer = tracing.NULL_TRACER,
+                 history: Optional[RunHistory] = None, timeout_policy: TimeoutPolicy = DEFAULT_TIMEOUT_POLICY):
         self.executable = executable
         self.throttle = throttle
         assert isinstance(throttle, Throttle)
         self.stuff_config = stuff_config
         assert isinstance(stuff_config, StuffConfig)
-        self.processing_timeout: float = 5.0
         self.require_screen = require_screen
         self.valgrind_config = valgrind_config
         self.screen_runnable_factory = ScreenRunnable
+        self.tracer = tracer
+        self.settings = QuestionSettings.default()
+        self.history = history
+        self.timeout_policy = timeout_policy
+        self.spool: Optional[OutcomeSpool] = None
+        self.sandbox_pool: Optional[SandboxPool] = None
+        self.input_mode = 'screen'
+        self.q_dir: Optional[str] = None
+        self.cancelled = threading.Event()
+        self._kills: Dict[int, Callable[[], Any]] = {}
+        self._kills_lock = threading.Lock()
+
+    def history_label(self, test_case: TestCase) -> str:
+        """Returns the name of a test case in the run history, which is unique within the question if its directory is known."""
+        return test_case.label() if self.q_dir is None else case_identifier(self.q_dir, test_case)
+
+    def cancel(self):
+        """Kills running test cases; test cases run after this is called fail immediately."""
+        self.cancelled.set()
+        with self._kills_lock:
+            kills = list(self._kills.values())
+        for kill in kills:
+            kill()
+
+    @contextlib.contextmanager
+    def _killable(self, kill: Callable[[], Any]):
+        """Context manager within which cancel() invokes the given kill function."""
+        key = id(kill)
+        with self._kills_lock:
+            self._kills[key] = kill
+        try:
+            if self.cancelled.is_set():
+                kill()
+            yield
+        finally:
+            with self._kills_lock:
+                del self._kills[key]
+
+    def processing_timeout_for(self, test_case: TestCase) -> float:
+        """Returns how long to wait for a process to terminate after all input has been sent.
+
+        The timeout defined in the question settings takes precedence; otherwise it is
+        derived from the run history, falling back on the throttle's processing timeout."""
+        if self.settings.processing_timeout is not None:
+            return self.settings.processing_timeout
+        if self.history is None:
+            return self.throttle.processing_timeout
+        q_name = os.path.basename(self.executable)
+        return self.history.timeout(q_name, self.history_label(test_case), self.throttle.processing_timeout, self.timeout_policy)
 
     def _pause(self, duration=None):
         time.sleep(self.throttle.pause_duration if duration is None else duration)
@@ -567,103 +1252,273 @@ class TestCaseRunner(object):
         assert num_comparisons > 0, "BUG: expected or actual text transform produced zero candidates"
         return to_outcome(False, expected_candidate, actual_candidate, "diff")
 
+    def _record_processing(self, test_case: TestCase, seconds: float):
+        if self.history is not None:
+            self.history.record(os.path.basename(self.executable), self.history_label(test_case), seconds)
+
+    def _record_processing_timeout(self, test_case: TestCase, timeout: float):
+        if self.history is not None:
+            self.history.record_timeout(os.path.basename(self.executable), self.history_label(test_case), timeout, self.timeout_policy)
+
+    def input_mode_for(self) -> str:
+        """Returns the input mode set for the question, or this runner's default if the question sets none."""
+        return self.settings.input_mode or self.input_mode
+
     def _is_use_screen(self, test_case: TestCase):
+        if self.input_mode_for() == 'stdin' or test_case.is_stress():
+            return False
         if self.require_screen == 'never':
             return False
         if self.require_screen == 'always':
             return True
         # 'auto'
-        return test_case.input_file is not None
-
-    def run_test_case(self, test_case: TestCase) -> TestCaseOutcome:
+        return test_case.has_input()
+
+    def run_test_case(self, test_case: TestCase, workdir: Optional[str]=None) -> TestCaseOutcome:
+        """Runs a test case and returns its outcome.
+
+        The process runs in the given working directory, if any; otherwise it runs in a
+        directory taken from the sandbox pool or in a temporary directory."""
+        if self.cancelled.is_set():
+            return TestCaseOutcome(False, self.executable, test_case, None, '', CANCELLED)
+        if workdir is not None:
+            return self._run_test_case_in(test_case, workdir)
+        if self.sandbox_pool is None:
+            with tempfile.TemporaryDirectory() as tempdir:
+                return self._run_test_case_in(test_case, tempdir)
+        with self.sandbox_pool.sandbox(f"{os.path.basename(self.executable)}-{test_case.label()}") as sandbox:
+            outcome = self._run_test_case_in(test_case, sandbox.path)
+            sandbox.keep = not outcome.passed
+            return outcome
+
+    @contextlib.contextmanager
+    def _open_stdin(self, test_case: TestCase):
+        """Context manager that provides the standard input of a process run without screen.
+
+        In stdin mode, the input file is opened and its descriptor is inherited by the
+        process, so the input never passes through this process; the input text of a
+        virtual or packed test case is written to a pipe instead. Otherwise the process inherits
+        this process's standard input, as it always has."""
+        if self.input_mode_for() != 'stdin':
+            yield None
+        elif test_case.input_file is not None:
+            with open(test_case.input_file, 'rb') as ifile:
+                yield ifile
+        elif test_case.has_input():
+            yield PIPE
+        else:
+            yield subprocess.DEVNULL
+
+    def _run_stress_case(self, test_case: TestCase, tempdir: str, span_args: Dict[str, Any]) -> TestCaseOutcome:
+        """Runs a stress test case, streaming generated input to the program and summarizing its output as it is read."""
+        spec = test_case.stress
+        tracer = self.tracer
+        limits = self.settings.limits_for(test_case)
+        cmd = [self.executable] + list(test_case.args)
+        generator: Optional[subprocess.Popen] = None
+        with tracer.span('spawn', **span_args):
+            if spec.command is not None:
+                generator = subprocess.Popen(list(spec.command), stdin=subprocess.DEVNULL, stdout=PIPE, stderr=subprocess.DEVNULL,
+                                             cwd=tempdir, start_new_session=True)
+            started_at = time.perf_counter()
+            try:
+                proc = subprocess.Popen(limits.wrap_command(cmd), stdin=PIPE if generator is None else generator.stdout, stdout=PIPE,
+                                        stderr=subprocess.DEVNULL, cwd=tempdir, env=test_case.env_dict(), start_new_session=True)
+            except BaseException:
+                if generator is not None:
+                    generator.kill()
+                    generator.wait()
+                raise
+            finally:
+                if generator is not None:
+                    generator.stdout.close()  # the program holds the read end of the pipe
+        pids = [proc.pid] if generator is None else [proc.pid, generator.pid]
+
+        def kill_all():
+            for pid in pids:
+                hwsuite.resources.kill_process_groups(pid)
+        summary = hwsuite.stress.OutputSummary()
+        feed_errors: List[Exception] = []
+        with tracer.span('wait', **span_args), Watchdog(kill_all, limits.timeout) as watchdog, self._killable(kill_all):
+            feeder = None
+            if generator is None:
+                feeder = threading.Thread(target=_feed_chunks, args=(proc.stdin, hwsuite.stress.generate_chunks(spec), feed_errors))
+                feeder.start()
+            try:
+                for chunk in iter(lambda: proc.stdout.read1(hwsuite.stress.CHUNK_SIZE), b''):
+                    summary.update(chunk)
+            finally:
+                if feeder is not None:
+                    feeder.join()
+                proc.stdout.close()
+            usage = hwsuite.resources.wait_measured(proc, started_at)
+            if generator is not None:
+                generator.wait()
+
+        def make_outcome(passed: bool, message: str) -> TestCaseOutcome:
+            return TestCaseOutcome(passed, self.executable, test_case, spec.describe_expectation(), summary.describe(), message, usage)
+        if watchdog.expired:
+            return make_outcome(False, f"timeout after {limits.timeout} seconds")
+        if feed_errors:
+            return make_outcome(False, f"input generation failed: {type(feed_errors[0]).__name__} {feed_errors[0]}")
+        if generator is not None and generator.returncode not in (0, -signal.SIGPIPE):
+            return make_outcome(False, f"input generator exited with code {generator.returncode}")
+        if not test_case.check_exit_code(proc.returncode):
+            return make_outcome(False, hwsuite.resources.describe_signal_exit(proc.returncode) or f"unexpected exit code {proc.returncode}")
+        with tracer.span('compare', **span_args) as compare_args:
+            message = summary.check(spec) or limits.violation(usage)
+            compare_args['message'] = message or "ok"
+        return make_outcome(message is None, message or "ok")
+
+    def _run_test_case_in(self, test_case: TestCase, tempdir: str) -> TestCaseOutcome:
         thread_id = threading.current_thread().ident
         use_screen = self._is_use_screen(test_case)
-        input_file = test_case.input_file
-        _log.debug("[%x] use_screen=%s for require_screen=%s and input=%s (test case %x)", thread_id, use_screen, self.require_screen, None if input_file is None else os.path.basename(input_file), hash(test_case))
-        expected_file = test_case.expected_file
-        if expected_file is None:
-            expected_text = None
-        else:
-            expected_text = read_file_text(expected_file)
+        input_name = test_case.input_name()
+        _log.debug("[%x] use_screen=%s for require_screen=%s and input=%s (test case %x)", thread_id, use_screen, self.require_screen, input_name, hash(test_case))
+        expected_text = test_case.read_expected_text()
+        tracer = self.tracer
+        span_args = {
+            'question': os.path.basename(self.executable),
+            'case': test_case.label(),
+        }
+
+        if test_case.fixtures:
+            with tracer.span('stage', **span_args):
+                hwsuite.sandbox.stage_fixtures(test_case.fixtures, tempdir)
+        if test_case.is_stress():
+            return self._run_stress_case(test_case, tempdir, span_args)
+
+        usage: Optional[ResourceUsage] = None
 
         def make_outcome(passed: bool, expected_text_: Optional[str], actual_text: Optional[str], message: str) -> TestCaseOutcome:
-            return TestCaseOutcome(passed, self.executable, test_case, expected_text_, actual_text, message)
+            return TestCaseOutcome(passed, self.executable, test_case, expected_text_, actual_text, message, usage)
 
         def check(actual_exit_code: int, actual_text: str) -> TestCaseOutcome:
             expected = Result(test_case.exit_code, expected_text)
             actual = Result(actual_exit_code, actual_text)
-            return self._check(expected, actual, make_outcome)
-
-        if input_file is None:
-            input_lines = []
-        else:
-            input_lines = read_file_lines(input_file)
-        with tempfile.TemporaryDirectory() as tempdir:
-            procdef = ProcessDefinition(self.executable, test_case.args, tempdir, test_case.env_dict())
-            if use_screen:
-                screener = self.screen_runnable_factory(procdef)
-                with screener.start():
-                    self._pause(self.throttle.pause_duration * 2)
-                    _log.debug("[%x] feeding lines to %s from %s", thread_id, os.path.basename(self.executable),
-                               None if input_file is None else os.path.basename(input_file))
-                    try:
+            with tracer.span('compare', **span_args) as compare_args:
+                outcome = self._check(expected, actual, make_outcome)
+                if outcome.passed:
+                    violation = self.settings.limits_for(test_case).violation(usage)
+                    if violation is not None:
+                        outcome = outcome._replace(passed=False, message=violation)
+                compare_args['message'] = outcome.message
+            return outcome
+
+        input_lines = test_case.input_lines()
+        limits = self.settings.limits_for(test_case)
+        timeout_message = f"timeout after {limits.timeout} seconds"
+        procdef = ProcessDefinition(self.executable, test_case.args, tempdir, test_case.env_dict(), limits)
+        if use_screen:
+            screener = self.screen_runnable_factory(procdef)
+            with tracer.span('spawn', **span_args):
+                started_proc = screener.start()
+            processing_timeout = self.processing_timeout_for(test_case)
+            processing_started = None
+            with started_proc, Watchdog(screener.signal_all, limits.timeout) as watchdog, self._killable(screener.signal_all):
+                self._pause(self.throttle.pause_duration * 2)
+                _log.debug("[%x] feeding lines to %s from %s", thread_id, os.path.basename(self.executable),
+                           input_name)
+                try:
+                    with tracer.span('feed', **span_args) as feed_args:
                         LogWatcher(screener.logfile).await_output(self.throttle.await)
                         for i, line in enumerate(input_lines):
+                            feed_args['lines'] = i + 1
                             self._pause()
                             try:
                                 proc = screener.stuff(line, self.stuff_config, i + 1)
                             except EarlyTerminationException:
                                 actual_text_ = screener.logfile_text(ignore_failure=True)
                                 _log.debug("early termination detected with code %s", screener.completed_proc.returncode)
-                                return make_outcome(False, expected_text, actual_text_, "early")
+                                usage = screener.usage
+                                return make_outcome(False, expected_text, actual_text_, timeout_message if watchdog.expired else "early")
                             if proc.returncode != 0:
                                 actual_text_ = screener.logfile_text(ignore_failure=True)
                                 return make_outcome(False, expected_text, actual_text_, "stuff")
                         if self.stuff_config.eof:
                             screener.stuff_eof()
-                        _log.debug("[%x] waiting %s seconds for process to terminate", thread_id, self.throttle.processing_timeout)
-                    finally:
-                        screener.await_proc(self.throttle.processing_timeout)
+                    _log.debug("[%x] waiting %s seconds for process to terminate", thread_id, processing_timeout)
+                    processing_started = time.perf_counter()
+                finally:
+                    input_lines.close()
+                    with tracer.span('wait', **span_args):
+                        terminated = screener.await_proc(processing_timeout)
+                        if processing_started is not None:
+                            if terminated:
+                                self._record_processing(test_case, time.perf_counter() - processing_started)
+                            else:
+                                self._record_processing_timeout(test_case, processing_timeout)
                         if not screener.quit():
                             if not screener.finished():
                                 screener.kill()
-                output = screener.logfile_text(ignore_failure=False)
-                assert screener.completed_proc, "completed process not assigned to screen runner"
-                exit_code = screener.completed_proc.returncode
+            output = screener.logfile_text(ignore_failure=False)
+            assert screener.completed_proc, "completed process not assigned to screen runner"
+            exit_code = screener.completed_proc.returncode
+            usage = screener.usage
+            if watchdog.expired:
+                return make_outcome(False, expected_text, output, timeout_message)
+        else:
+            # if we don't need to send/capture input, then we can just execute
+            cmd = [self.executable] + list(test_case.args)
+            env = test_case.env_dict()
+            _log.debug("running %s with environment %s", cmd, env)
+            input_text = test_case.embedded_input_text() if self.input_mode_for() == 'stdin' else None
+            stdin_data = None if input_text is None else input_text.encode('utf8')
+            with tracer.span('spawn', **span_args), self._open_stdin(test_case) as stdin:
+                started_at = time.perf_counter()
+                started_proc = subprocess.Popen(limits.wrap_command(cmd), stdin=stdin, stdout=PIPE, stderr=PIPE, cwd=tempdir, env=env,
+                                                start_new_session=True)
+            kill_all = lambda: hwsuite.resources.kill_process_groups(started_proc.pid)
+            with tracer.span('wait', **span_args), Watchdog(kill_all, limits.timeout) as watchdog, self._killable(kill_all):
+                stdout, _, usage = hwsuite.resources.communicate_measured(started_proc, started_at, stdin_data)
+            exit_code = started_proc.returncode
+            _log.debug("terminated with code %s", exit_code)
+            output = stdout.decode('utf8')
+            # TODO log stderr
+            if watchdog.expired:
+                return make_outcome(False, expected_text, output, timeout_message)
+            if test_case.check_exit_code(exit_code):
+                if self.valgrind_config.is_applicable(test_case):
+                    with tracer.span('memcheck', **span_args):
+                        with self._open_stdin(test_case) as stdin:
+                            valgrind_proc = ValgrindRunner(self.valgrind_config).run(cmd, env=env, cwd=tempdir, stdin=stdin,
+                                                                                     input_data=stdin_data)
+                    if valgrind_proc.returncode != 0:
+                        if not self.valgrind_config.is_quiet():
+                            _log.info("valgrind memcheck detected leak:\n%s\n", valgrind_proc.stderr.decode('utf8'))
+                        return make_outcome(False, expected_text, output, "memcheck")
             else:
-                # if we don't need to send/capture input, then we can just execute
-                cmd = [self.executable] + list(test_case.args)
-                env = test_case.env_dict()
-                _log.debug("running %s with environment %s", cmd, env)
-                completed_proc = subprocess.run(cmd, stdout=PIPE, stderr=PIPE, cwd=tempdir,
-                                                env=env)
-                exit_code = completed_proc.returncode
-                _log.debug("terminated with code %s", exit_code)
-                output = completed_proc.stdout.decode('utf8')
-                # TODO log stderr
-                if test_case.check_exit_code(completed_proc.returncode):
-                    if self.valgrind_config.is_applicable(test_case):
-                        valgrind_proc = ValgrindRunner(self.valgrind_config).run(cmd, env=env, cwd=tempdir)
-                        if valgrind_proc.returncode != 0:
-                            if not self.valgrind_config.is_quiet():
-                                _log.info("valgrind memcheck detected leak:\n%s\n", valgrind_proc.stderr.decode('utf8'))
-                            return make_outcome(False, expected_text, output, "memcheck")
-                else:
-                    return make_outcome(False, expected_text, output, f"unexpected exit code {completed_proc.returncode}")
+                message = hwsuite.resources.describe_signal_exit(exit_code) or f"unexpected exit code {exit_code}"
+                return make_outcome(False, expected_text, output, message)
         return check(exit_code, output)
 
 
 class TestCaseRunnerFactory(object):
 
     def __init__(self, throttle: Throttle, stuff_config: StuffConfig, require_screen: str = 'auto',
-                 valgrind_config: ValgrindConfig = VALGRIND_DISABLED):
+                 valgrind_config: ValgrindConfig = VALGRIND_DISABLED, tracer: tracing.Tracer = tracing.NULL_TRACER,
+                 limits: UsageLimits = hwsuite.resources.NO_LIMITS, history: Optional[RunHistory] = None,
+                 spool: Optional[OutcomeSpool] = None, sandbox_pool: Optional[SandboxPool] = None,
+                 input_mode: str = 'screen'):
         self.stuff_config = stuff_config
         self.throttle = throttle
         self.require_screen = require_screen
         self.valgrind_config = valgrind_config
+        self.tracer = tracer
+        self.limits = limits
+        self.history = history
+        self.spool = spool
+        self.sandbox_pool = sandbox_pool
+        self.input_mode = input_mode
 
     def create(self, executable: str):
-        return TestCaseRunner(executable, self.throttle, self.stuff_config, self.require_screen, self.valgrind_config)
+        runner = TestCaseRunner(executable, self.throttle, self.stuff_config, self.require_screen, self.valgrind_config,
+                                self.tracer, self.history)
+        runner.settings = QuestionSettings.default(self.limits)
+        runner.spool = self.spool
+        runner.sandbox_pool = self.sandbox_pool
+        runner.input_mode = self.input_mode
+        return runner
 
 
 class ConcurrencyManager(object):
@@ -672,27 +1527,42 @@ class ConcurrencyManager(object):
         self.concurrer = threading.Semaphore(concurrency_level)
         self.runner = runner
         self.outcomes_lock = threading.Lock()
+        self.worker_slots = queue.Queue()
+        for slot in range(1, concurrency_level + 1):
+            self.worker_slots.put(slot)
 
     def _run_test_case(self, test_case: TestCase) -> TestCaseOutcome:
         return self.runner.run_test_case(test_case)
 
-    def perform(self, test_case: TestCase, outcomes: Dict[TestCase, TestCaseOutcome], q_name:str=None, i:int=0):
-        """Runs a test case and puts the outcome in the given dictionary.
+    def perform(self, test_case: TestCase, outcomes: Dict[TestCase, TestCaseOutcome], q_name:str=None, i:int=0) -> TestCaseOutcome:
+        """Runs a test case, puts the outcome in the given dictionary, and returns it.
 
         The q_name and i parameters are only used for log messages."""
-        if test_case.input_file is None:
-            input_name = None
-        else:
-            input_name = os.path.basename(test_case.input_file)
+        input_name = test_case.input_name()
         try:
             self.concurrer.acquire()
+            slot = self.worker_slots.get_nowait()
             try:
-                outcome = self._run_test_case(test_case)
+                tracer = self.runner.tracer
+                tracer.bind_track(slot, f"worker {slot}")
+                with tracer.span('case', question=q_name, case=test_case.label(), input=input_name) as span_args:
+                    case_started = time.perf_counter()
+                    outcome = self._run_test_case(test_case)
+                    span_args['passed'] = outcome.passed
+                if self.runner.cancelled.is_set() and not outcome.passed:
+                    outcome = outcome._replace(message=CANCELLED)
+                elif self.runner.history is not None:
+                    q_key = os.path.basename(self.runner.executable)
+                    self.runner.history.record_runtime(q_key, self.runner.history_label(test_case), time.perf_counter() - case_started)
+                    self.runner.history.record_result(q_key, self.runner.history_label(test_case), outcome.passed)
+                if self.runner.spool is not None:
+                    outcome = self.runner.spool.compact(outcome)
                 if outcome.passed:
                     _log.debug("%s: case %s (%s) passed", q_name, i + 1, input_name)
                 else:
                     _log.info("%s: case %s (%s) failed: %s", q_name, i + 1, input_name, outcome.message)
             finally:
+                self.worker_slots.put(slot)
                 self.concurrer.release()
         except Exception as e:
             _log.warning("%s: case %s (%s) unhandled exception: %s %s", q_name, i + 1, input_name, type(e).__name__, e)
@@ -705,20 +1575,20 @@ class ConcurrencyManager(object):
             outcomes[test_case] = outcome
         finally:
             self.outcomes_lock.release()
+        return outcome
 
 
 def report(outcomes: List[TestCaseOutcome], report_type: str, ofile=sys.stderr):
     for outcome in outcomes:
         q_name = os.path.basename(outcome.executable)
-        if outcome.test_case.input_file is None:
-            input_name = None
-        else:
-            input_name = os.path.basename(outcome.test_case.input_file)
+        input_name = outcome.test_case.input_name()
         print(f"{q_name}: {input_name}: {outcome.message}")
+        if outcome.usage is not None:
+            print(f"{q_name}: {input_name}: {outcome.usage.describe()}", file=ofile)
         if report_type == 'diff':
             # expected_text can't be None here, or outcome.message would not be 'diff'
-            expected = outcome.expected_text.split("\n")
-            actual = outcome.actual_text.split("\n")
+            expected = outcome.read_expected_text().split("\n")
+            actual = outcome.read_actual_text().split("\n")
             delta = difflib.context_diff(expected, actual)
             for line in delta:
                 print(line, file=ofile)
@@ -726,16 +1596,16 @@ def report(outcomes: List[TestCaseOutcome], report_type: str, ofile=sys.stderr):
             print("=================================================", file=ofile)
             print("EXPECTED", file=ofile)
             print("=================================================", file=ofile)
-            print(outcome.expected_text, end="", file=ofile)
+            print(outcome.read_expected_text(), end="", file=ofile)
             print("=================================================", file=ofile)
             print("=================================================", file=ofile)
             print("ACTUAL", file=ofile)
             print("=================================================", file=ofile)
-            print(outcome.actual_text, end="", file=ofile)
+            print(outcome.read_actual_text(), end="", file=ofile)
             print("=================================================", file=ofile)
         elif report_type == 'repr':
-            print("expected: {}".format(repr(outcome.expected_text)), file=ofile)
-            print("  actual: {}".format(repr(outcome.actual_text)), file=ofile)
+            print("expected: {}".format(repr(outcome.read_expected_text())), file=ofile)
+            print("  actual: {}".format(repr(outcome.read_actual_text())), file=ofile)
         else:
             _log.debug("test case failure reported with message=diff but diff_action=%s", report_type)
         if report_type != 'diff':
@@ -751,6 +1621,8 @@ class TestCasesConfig(NamedTuple):
     def matches(self, test_case: TestCase):
         if self.filter_pattern is None:
             return True
+        if test_case.is_virtual():
+            return fnmatch.fnmatch(test_case.name, self.filter_pattern)
         if test_case.expected_file is None:
             if test_case.input_file is not None:
                 filename = os.path.basename(test_case.input_file)
@@ -766,15 +1638,51 @@ class TestCasesConfig(NamedTuple):
 
 class CppChecker(object):
 
-    def __init__(self, runner_factory: TestCaseRunnerFactory, concurrency_level: int):
+    def __init__(self, runner_factory: TestCaseRunnerFactory, concurrency_level: int, schedule: str='history',
+                 exit_first: bool=False, virtual: bool=False, dedup: bool=True):
         self.runner_factory = runner_factory
         self.concurrency_level = concurrency_level
+        self.schedule = schedule
+        self.exit_first = exit_first
+        self.virtual = virtual
+        self.dedup = dedup
+
+    def _detect_virtual_test_cases(self, q_dir: str) -> Optional[List[TestCase]]:
+        """Returns virtual test cases rendered from the question's definitions file, plus test cases defined by
+        files other than generated ones, or None if there is no definitions file."""
+        defs_file = os.path.join(q_dir, testcases._DEFAULT_DEFINITIONS_FILENAME)
+        if not os.path.isfile(defs_file):
+            return None
+        with open(defs_file, 'r') as ifile:
+            if not testcases.defines_rendered_cases(json.load(ifile)):
+                return None
+        test_cases = create_virtual_test_cases(defs_file)
+        generated_dir = os.path.join(q_dir, testcases._DEFAULT_TEST_CASES_DIRNAME)
+        for test_case in detect_test_case_files(q_dir):
+            if test_case.is_packed():
+                if test_case.corpus_file != generated_dir + hwsuite.corpus.CORPUS_SUFFIX:
+                    test_cases.append(test_case)
+            elif os.path.dirname(test_case.expected_file) != generated_dir:
+                test_cases.append(test_case)
+        return sorted(test_cases, key=TestCase.sort_key)
+
+    # noinspection PyMethodMayBeStatic
+    def _detect_stress_test_cases(self, q_dir: str) -> List[TestCase]:
+        defs_file = os.path.join(q_dir, testcases._DEFAULT_DEFINITIONS_FILENAME)
+        if not os.path.isfile(defs_file):
+            return []
+        return create_stress_test_cases(defs_file)
 
     # noinspection PyMethodMayBeStatic
     def _detect_test_cases(self, q_dir: str) -> List[TestCase]:
+        stress_cases = self._detect_stress_test_cases(q_dir)
+        if self.virtual:
+            virtual_cases = self._detect_virtual_test_cases(q_dir)
+            if virtual_cases:
+                return virtual_cases + stress_cases
         cases_from_files = detect_test_case_files(q_dir)
-        if cases_from_files:
-            return cases_from_files
+        if cases_from_files or stress_cases:
+            return cases_from_files + stress_cases
         return [TestCase.create(None, None)]  # case that merely requires exit code zero
 
     # noinspection PyMethodMayBeStatic
@@ -784,18 +1692,12 @@ class CppChecker(object):
         assert os.path.isfile(q_executable), "not found: " + q_executable
         return q_executable
 
-    def check_cpp(self, cpp_file: str, test_cases_cfg: TestCasesConfig) -> Dict[TestCase, TestCaseOutcome]:
-        q_dir = os.path.dirname(cpp_file)
+    def select_test_cases(self, q_dir: str, test_cases_cfg: TestCasesConfig) -> List[TestCase]:
+        """Detects the test cases of a question and returns those that the configuration admits."""
         test_case_files = self._detect_test_cases(q_dir)
-        outcomes = {}
-        if not test_case_files:
-            return outcomes
         q_name = os.path.basename(q_dir)
         _log.info("%s: detected %s test cases", q_name, len(test_case_files))
-        q_executable = self._resolve_executable(q_dir)
-        runner = self.runner_factory.create(q_executable)
-        threads: List[threading.Thread] = []
-        concurrency_mgr = ConcurrencyManager(runner, self.concurrency_level)
+        selected = []
         for i, test_case in enumerate(test_case_files):
             if test_cases_cfg.max_test_cases is not None and i >= test_cases_cfg.max_test_cases:
                 _log.debug("breaking early due to test case limit")
@@ -803,21 +1705,79 @@ class CppChecker(object):
             if not test_cases_cfg.matches(test_case):
                 _log.debug("skipping; filter %s rejected test case %s", test_cases_cfg, test_case)
                 continue
-            t = threading.Thread(target=lambda: concurrency_mgr.perform(test_case, outcomes, q_name, i))
+            selected.append(test_case)
+        return selected
+
+    def check_cpp(self, cpp_file: str, test_cases_cfg: TestCasesConfig,
+                  test_cases: Optional[List[TestCase]]=None) -> Dict[TestCase, TestCaseOutcome]:
+        """Runs the test cases of a question. If test_cases is None, the test cases are detected and selected first.
+
+        Unless dedup is false, test cases with identical content are run once, and the
+        outcome is attributed to each of them."""
+        q_dir = os.path.dirname(cpp_file)
+        if test_cases is None:
+            test_cases = self.select_test_cases(q_dir, test_cases_cfg)
+        outcomes = {}
+        q_name = os.path.basename(q_dir)
+        if not test_cases:
+            _log.warning("all test cases were skipped")
+            return outcomes
+        q_executable = self._resolve_executable(q_dir)
+        runner = self.runner_factory.create(q_executable)
+        runner.settings = QuestionSettings.load(q_dir, runner.settings.limits)
+        runner.q_dir = q_dir
+        num_test_cases = len(test_cases)
+        aliases: Dict[TestCase, List[TestCase]] = {}
+        if self.dedup:
+            test_cases, aliases = group_duplicates(test_cases, runner.settings.limits_for)
+            if aliases:
+                _log.info("%s: %s duplicate test cases share the outcomes of others", q_name, num_test_cases - len(test_cases))
+        if self.schedule == 'history' and runner.history is not None:
+            # history is keyed by executable name, as in ConcurrencyManager.perform
+            order = runner.history.schedule(os.path.basename(q_executable), [runner.history_label(tc) for tc in test_cases])
+            test_cases = [test_cases[i] for i in order]
+        concurrency_mgr = ConcurrencyManager(runner, self.concurrency_level)
+        work = queue.Queue()
+        for i, test_case in enumerate(test_cases):
+            work.put((i, test_case))
+
+        def run_queued():
+            # cases are taken from the queue in scheduled order; running threads never outnumber the concurrency level
+            while not runner.cancelled.is_set():
+                try:
+                    i_, test_case_ = work.get_nowait()
+                except queue.Empty:
+                    return
+                outcome = concurrency_mgr.perform(test_case_, outcomes, q_name, i_)
+                if self.exit_first and not outcome.passed and outcome.message != CANCELLED:
+                    _log.info("%s: cancelling remaining test cases after first failure", q_name)
+                    runner.cancel()
+        threads = [threading.Thread(target=run_queued) for _ in range(min(self.concurrency_level, len(test_cases)))]
+        for t in threads:
             t.start()
-            threads.append(t)
         for t in threads:
-            t.join(test_cases_cfg.timeout)
-            if t.is_alive():
-                _log.warning("test case running in thread %s exceeded timeout", t)
-                t.join()
-        if not threads:
-            _log.warning("all test cases were skipped")
-        assert len(threads) == len(outcomes), "not all threads returned an outcome: {} threads but {} outcomes".format(len(threads), len(outcomes))
+            t.join()
+        for test_case, outcome in list(outcomes.items()):
+            for alias in aliases.get(test_case, ()):
+                _log.debug("%s: %s has the outcome of %s", q_name, alias.label(), test_case.label())
+                outcomes[alias] = outcome._replace(test_case=alias)
+        if runner.cancelled.is_set():
+            outcomes = {tc: outcome for tc, outcome in outcomes.items() if outcome.message != CANCELLED}
+            _log.info("%s: %s test cases cancelled", q_name, num_test_cases - len(outcomes))
+        else:
+            assert num_test_cases == len(outcomes), "not all test cases have an outcome: {} test cases but {} outcomes".format(num_test_cases, len(outcomes))
         return outcomes
 
 
-def review_outcomes(outcomes: Dict[TestCase, TestCaseOutcome], report_type, q_name=None):
+def report_usage(outcomes: List[TestCaseOutcome], ofile=sys.stderr):
+    """Prints the resource usage of every test case, passing or not."""
+    for outcome in sorted(outcomes, key=lambda o: o.test_case.label()):
+        q_name = os.path.basename(outcome.executable)
+        usage = 'usage not measured' if outcome.usage is None else outcome.usage.describe()
+        print(f"{q_name}: {outcome.test_case.label()}: {outcome.message}; {usage}", file=ofile)
+
+
+def review_outcomes(outcomes: Dict[TestCase, TestCaseOutcome], report_type, q_name=None, show_usage=False):
     failures = [outcome for outcome in outcomes.values() if not outcome.passed]
     if failures:
         _log.info("%s: %s failures among %s test cases", q_name, len(failures), len(outcomes))
@@ -827,15 +1787,112 @@ def review_outcomes(outcomes: Dict[TestCase, TestCaseOutcome], report_type, q_na
         else:
             _log.warning("zero test cases executed for %s", q_name)
     report(failures, report_type)
+    if show_usage:
+        report_usage(list(outcomes.values()))
     return len(failures)
 
 
+def case_identifier(q_dir: str, test_case: TestCase) -> str:
+    """Returns a name for a test case that is unique within its question and independent of where the project is."""
+    if test_case.expected_file is None:
+        return test_case.label()
+    return os.path.relpath(test_case.expected_file, q_dir)
+
+
+def to_case_result(q_dir: str, outcome: TestCaseOutcome) -> CaseResult:
+    usage = outcome.usage
+    return CaseResult(os.path.basename(q_dir), case_identifier(q_dir, outcome.test_case), outcome.passed, outcome.message,
+                      None if usage is None else usage.wall_ms, None if usage is None else round(usage.cpu_ms(), 3))
+
+
+def select_shard(selections: List[Tuple[str, List[TestCase]]], shard: Shard, balance: str='count',
+                 history: Optional[RunHistory]=None) -> List[Tuple[str, List[TestCase]]]:
+    """Returns the test cases of each question that belong to the given shard.
+
+    The partition depends only on the set of (question, test case) pairs, and on the
+    run history if runtime balancing is requested, so every job that sees the same
+    project computes the same partition."""
+    keyed = {}
+    runtimes = {}
+    for cpp_file, test_cases in selections:
+        q_dir = os.path.dirname(cpp_file)
+        q_name = os.path.basename(q_dir)
+        for test_case in test_cases:
+            key = f"{q_name}/{case_identifier(q_dir, test_case)}"
+            keyed[key] = test_case
+            if history is not None:
+                runtimes[key] = history.mean_runtime(q_name, case_identifier(q_dir, test_case))
+    use_runtimes = balance == 'runtime'
+    if use_runtimes and not any(r is not None for r in runtimes.values()):
+        _log.info("no runtime history available; balancing shards by test case count")
+        use_runtimes = False
+    assignments = hwsuite.shard.assign(list(keyed.keys()), shard.count, runtimes if use_runtimes else None)
+    mine = set(key for key, n in assignments.items() if n == shard.index - 1)
+    _log.info("shard %s has %s of %s test cases", shard, len(mine), len(keyed))
+    selected = []
+    for cpp_file, test_cases in selections:
+        q_dir = os.path.dirname(cpp_file)
+        q_name = os.path.basename(q_dir)
+        selected.append((cpp_file, [tc for tc in test_cases if f"{q_name}/{case_identifier(q_dir, tc)}" in mine]))
+    return selected
+
+
+def _parse_shard(spec: str) -> Shard:
+    try:
+        return Shard.parse(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def create_runner_factory(args: argparse.Namespace, tracer: tracing.Tracer=tracing.NULL_TRACER,
+                          history: Optional[RunHistory]=None, spool: Optional[OutcomeSpool]=None,
+                          sandbox_pool: Optional[SandboxPool]=None) -> TestCaseRunnerFactory:
+    """Creates a factory of runners configured by command line options."""
+    await_config = PollConfig.from_args_await(args)
+    throttle = Throttle(args.pause, await_config, _DEFAULT_PROCESSING_TIMEOUT_SECONDS)
+    stuff_config = StuffConfig.from_args(args)
+    valgrind_config = ValgrindConfig.from_options(args)
+    limits = UsageLimits(rlimit_cpu_seconds=get_arg(args, 'rlimit_cpu', None), rlimit_as_kb=get_arg(args, 'rlimit_as', None),
+                         rlimit_fsize_kb=get_arg(args, 'rlimit_fsize', None), timeout=args.timeout)
+    return TestCaseRunnerFactory(throttle, stuff_config, args.require_screen, valgrind_config, tracer, limits, history, spool,
+                                 sandbox_pool, get_arg(args, 'input_mode', None) or 'screen')
+
+
+def create_sandbox_pool(args: argparse.Namespace) -> SandboxPool:
+    """Creates the pool of working directories configured by command line options."""
+    return SandboxPool(get_arg(args, 'sandbox_dir', None), get_arg(args, 'keep_failed', False))
+
+
 def _main(args: argparse.Namespace):
+    worker_address = get_arg(args, 'worker', None)
+    if worker_address:
+        # imported here because distrib depends on this module
+        from hwsuite import distrib
+        return distrib.work(args, worker_address)
     proj_dir = os.path.abspath(args.project_dir or hwsuite.find_proj_root())
     _log.debug("this project dir is %s (specified %s)", proj_dir, args.project_dir)
     assert proj_dir and os.path.isdir(proj_dir), "failed to detect project directory"
+    tracer = tracing.Tracer() if get_arg(args, 'trace', None) else tracing.NULL_TRACER
+    history_file = None
+    if not get_arg(args, 'no_history', False):
+        history_file = get_arg(args, 'history', None) or os.path.join(proj_dir, hwsuite.history.HISTORY_BASENAME)
+    history = RunHistory.load(history_file) if history_file else None
+    try:
+        with OutcomeSpool() as spool, create_sandbox_pool(args) as sandbox_pool:
+            return _check_project(args, proj_dir, tracer, history, spool, sandbox_pool)
+    finally:
+        if tracer.enabled():
+            tracer.write(args.trace)
+            _log.info("trace written to %s", args.trace)
+        if history is not None:
+            history.save(history_file)
+
+
+def _check_project(args: argparse.Namespace, proj_dir: str, tracer: tracing.Tracer, history: Optional[RunHistory]=None,
+                   spool: Optional[OutcomeSpool]=None, sandbox_pool: Optional[SandboxPool]=None):
     _log.debug("building executables by running build in %s", proj_dir)
-    hwsuite.build.build(proj_dir)
+    with tracer.span('build', project=os.path.basename(proj_dir)):
+        hwsuite.build.build(proj_dir)
     main_cpps = []
     if args.subdirs:
         _log.debug("limiting tests to subdirectories: %s", args.subdirs)
@@ -854,29 +1911,58 @@ def _main(args: argparse.Namespace):
         return 1
     num_threads = args.threads or multiprocessing.cpu_count()
     total_failures = 0
-    await_config = PollConfig.from_args_await(args)
-    throttle = Throttle(args.pause, await_config, _DEFAULT_PROCESSING_TIMEOUT_SECONDS)
-    stuff_config = StuffConfig.from_args(args)
     test_cases_config = TestCasesConfig(args.max_cases, args.filter, args.timeout)
-    valgrind_config = ValgrindConfig.from_options(args)
-    runner_factory = TestCaseRunnerFactory(throttle, stuff_config, args.require_screen, valgrind_config)
-    for i, cpp_file in enumerate(sorted(main_cpps)):
-        if args.test_cases != 'existing':
+    runner_factory = create_runner_factory(args, tracer, history, spool, sandbox_pool)
+    exit_first = get_arg(args, 'exitfirst', False)
+    cpp_checker = CppChecker(runner_factory, num_threads, get_arg(args, 'schedule', 'history'), exit_first,
+                             args.test_cases == 'virtual', not get_arg(args, 'no_dedup', False))
+    if args.test_cases not in ('existing', 'virtual'):
+        defs_files = []
+        for cpp_file in sorted(main_cpps):
             defs_file = os.path.join(os.path.dirname(cpp_file), 'test-cases.json')
-            if not os.path.isfile(defs_file):
-                if args.test_cases == 'require':
-                    raise FileNotFoundError(defs_file)
-            else:
-                testcases.produce_from_defs(defs_file, onerror='raise')
-        cpp_checker = CppChecker(runner_factory, num_threads)
-        outcomes = cpp_checker.check_cpp(cpp_file, test_cases_config)
-        q_name = os.path.basename(os.path.dirname(cpp_file))
-        per_cpp_failures = review_outcomes(outcomes, report_type=args.report, q_name=q_name)
+            if os.path.isfile(defs_file):
+                defs_files.append(defs_file)
+            elif args.test_cases == 'require':
+                raise FileNotFoundError(defs_file)
+        with tracer.span('generate', questions=len(defs_files)):
+            testcases.produce_all(defs_files, onerror='raise', max_workers=num_threads)
+    selections: List[Tuple[str, List[TestCase]]] = []
+    for cpp_file in sorted(main_cpps):
+        q_dir = os.path.dirname(cpp_file)
+        selections.append((cpp_file, cpp_checker.select_test_cases(q_dir, test_cases_config)))
+    shard: Optional[Shard] = get_arg(args, 'shard', None)
+    if shard is not None:
+        selections = select_shard(selections, shard, get_arg(args, 'shard_balance', 'count'), history)
+    distributed_outcomes = None
+    serve_address = get_arg(args, 'serve', None)
+    if serve_address:
+        from hwsuite import distrib
+        distributed_outcomes = distrib.serve_selections(serve_address, proj_dir, cpp_checker, selections, spool)
+    results: List[CaseResult] = []
+    for cpp_file, test_cases in selections:
+        q_dir = os.path.dirname(cpp_file)
+        q_name = os.path.basename(q_dir)
+        if shard is not None and not test_cases:
+            _log.debug("%s: no test cases in shard %s", q_name, shard)
+            continue
+        if distributed_outcomes is not None:
+            outcomes = distributed_outcomes.get(q_dir, {})
+        else:
+            outcomes = cpp_checker.check_cpp(cpp_file, test_cases_config, test_cases)
+        per_cpp_failures = review_outcomes(outcomes, report_type=args.report, q_name=q_name,
+                                           show_usage=get_arg(args, 'usage', False))
         total_failures += per_cpp_failures
+        results += [to_case_result(q_dir, outcome) for outcome in outcomes.values()]
+        if exit_first and total_failures > 0:
+            _log.info("skipping remaining questions after first failure")
+            break
+    results_file = get_arg(args, 'results', None)
+    if results_file:
+        write_results(results_file, results, shard)
     return 0 if total_failures == 0 else _ERR_TEST_CASE_FAILURES
 
 
-def main():
+def _create_arg_parser() -> ArgumentParser:
     parser = ArgumentParser()
     parser.add_argument("subdirs", nargs='*', help="subdirectories containing executables to test; if none specified, run all")
     hwsuite.add_logging_options(parser)
@@ -884,15 +1970,39 @@ def main():
     parser.add_argument("-m", "--max-cases", type=int, default=None, metavar="N", help="run at most N test cases per cpp")
     parser.add_argument("-j", "-t", "--threads", type=int, metavar="N", help="concurrency level for test cases; default is cpu count")
     parser.add_argument("--log-input", help="log feeding of input lines at DEBUG level")
-    parser.add_argument("--timeout", type=float, help="per-test-case timeout (in seconds)")
+    parser.add_argument("--timeout", type=float, help="per-test-case timeout (in seconds); the process group of a case is killed when it elapses")
+    parser.add_argument("--rlimit-cpu", type=int, metavar="SECONDS", help="limit CPU time of each test case process")
+    parser.add_argument("--rlimit-as", type=int, metavar="KB", help="limit address space of each test case process")
+    parser.add_argument("--rlimit-fsize", type=int, metavar="KB", help="limit size of files written by each test case process")
     parser.add_argument("--filter", metavar="PATTERN", help="match test case input filenames against PATTERN")
     parser.add_argument("--report", metavar="ACTION", choices=_REPORT_CHOICES, default='diff', help=f"what to print on test case failure; one of {_REPORT_CHOICES}; default is 'diff'")
     parser.add_argument("--stuff", metavar="MODE", choices=_STUFF_MODES, default='auto', help="how to interpret input lines sent to process via `screen -X stuff`: 'auto' or 'strict'")
-    parser.add_argument("--test-cases", metavar="MODE", choices=_TEST_CASES_CHOICES, help=f"test case generation mode; choices are {_TEST_CASES_CHOICES}; default 'auto' means attempt to re-generate")
+    parser.add_argument("--test-cases", metavar="MODE", choices=_TEST_CASES_CHOICES, help=f"test case generation mode; choices are {_TEST_CASES_CHOICES}; default 'auto' means attempt to re-generate; 'virtual' renders test cases in memory without writing files")
     parser.add_argument("--project-dir", metavar="DIR", help="project directory (if not current directory)")
     parser.add_argument("--await", type=float, metavar="INTERVAL", help="poll with specified interval for text on process output stream before sending input")
     parser.add_argument("--require-screen", choices=('auto', 'always', 'never'), default='auto', help="how to decide whether to use `screen` to run executable; default is 'auto', which means only when input is to be sent to process")
     parser.add_argument("--valgrind", help="specify valgrind configuration; use 'applicability=never' to disable")
+    parser.add_argument("--input-mode", choices=INPUT_MODES, help="how to feed input files to programs of questions whose definitions set no input_mode; 'stdin' passes the file as standard input, and expected output then lacks the echoed input; default 'screen'")
+    parser.add_argument("--usage", action='store_true', help="print CPU time, wall time, and peak memory of every test case")
+    parser.add_argument("--shard", metavar="INDEX/COUNT", type=_parse_shard, help="run only the test cases in shard INDEX (1 to COUNT) of a deterministic partition")
+    parser.add_argument("--shard-balance", choices=hwsuite.shard.BALANCE_CHOICES, default='count', help="balance shards by test case count or by runtimes recorded in history; every job must use the same history file for 'runtime'")
+    parser.add_argument("--results", metavar="FILE", help="write pass/fail results of test cases as JSON to FILE; combine files with merge")
+    parser.add_argument("--schedule", choices=_SCHEDULE_CHOICES, default='history', help="order of test cases; 'history' runs cases that failed last time first, then new cases, then longest first; 'sorted' uses filename order")
+    parser.add_argument("--no-dedup", action='store_true', help="run every test case even if another has the same input, args, env, and expected output")
+    parser.add_argument("-x", "--exitfirst", action='store_true', help="stop after the first failing test case, killing cases still running")
+    parser.add_argument("--serve", metavar="ADDR", help="instead of running test cases, serve them to workers on ADDR, which is unix:PATH or [HOST:]PORT")
+    parser.add_argument("--worker", metavar="ADDR", help="run test cases served by the coordinator at ADDR; --threads sets the number of concurrent cases")
+    parser.add_argument("--fetch", action='store_true', help="with --worker, fetch executables and test case files from the coordinator instead of using a shared project directory")
+    parser.add_argument("--history", metavar="FILE", help=f"file where test case durations are recorded, from which processing timeouts are derived; default is {hwsuite.history.HISTORY_BASENAME} in project dir")
+    parser.add_argument("--no-history", action='store_true', help="do not read or record test case durations; use fixed processing timeout")
+    parser.add_argument("--sandbox-dir", metavar="DIR", help="create working directories of test cases in DIR, e.g. /dev/shm; default is the system temp directory")
+    parser.add_argument("--keep-failed", action='store_true', help="keep working directories of failed test cases and log their locations")
+    parser.add_argument("--trace", metavar="FILE", help="write Chrome trace-event JSON describing the run to FILE")
+    return parser
+
+
+def main():
+    parser = _create_arg_parser()
     args = parser.parse_args()
     hwsuite.configure_logging(args)
     try:
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+"""
+    corpus.py reads and writes packed test case corpora.
+
+    A corpus holds the input, expected output, environment, arguments, and
+    expected exit code of many test cases in one file, instead of a handful
+    of tiny files per test case. The file is a header, the texts of the test
+    cases, a JSON index of the test cases, and a footer that gives the
+    position of the index. Opening a corpus reads only the footer and the
+    index; the texts are read through a memory map when they are requested,
+    so any test case can be read without reading the whole corpus.
+
+    See pack.py for converting between a corpus and loose test case files.
+"""
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import NamedTuple, Optional, Tuple, Dict, List, Sequence
+
+import hwsuite
+
+_log = logging.getLogger(__name__)
+CORPUS_SUFFIX = '.corpus'
+_MAGIC = b'HWCORPUS'
+_VERSION = 1
+_HEADER = struct.Struct('<8sI')
+_FOOTER = struct.Struct('<QQ8s')
+_corpora: Dict[str, Tuple[Tuple[int, int], 'Corpus']] = {}
+_corpora_lock = threading.Lock()
+
+
+class CorpusException(hwsuite.MessageworthyException):
+    pass
+
+
+class CorpusEntry(NamedTuple):
+    """Test case in a corpus. The input and expected spans are offsets and lengths of encoded text."""
+
+    name: str
+    input: Optional[Tuple[int, int]]
+    expected: Optional[Tuple[int, int]]
+    env: Optional[Dict[str, str]]
+    args: Tuple[str, ...]
+    exit_code: int
+
+    def to_model(self) -> Dict:
+        return {
+            'name': self.name,
+            'input': None if self.input is None else list(self.input),
+            'expected': None if self.expected is None else list(self.expected),
+            'env': self.env,
+            'args': list(self.args),
+            'exit_code': self.exit_code,
+        }
+
+    @staticmethod
+    def from_model(model: Dict) -> 'CorpusEntry':
+        def span(value):
+            return None if value is None else (int(value[0]), int(value[1]))
+        return CorpusEntry(model['name'], span(model['input']), span(model['expected']), model['env'], tuple(model['args']),
+                           model['exit_code'])
+
+
+def is_corpus_filename(f: str) -> bool:
+    return f.endswith(CORPUS_SUFFIX)
+
+
+class Corpus(object):
+    """Corpus open for reading. Texts are decoded from a memory map of the file on request."""
+
+    def __init__(self, pathname: str):
+        self.pathname = pathname
+        with open(pathname, 'rb') as ifile:
+            try:
+                self.data = mmap.mmap(ifile.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                raise CorpusException(f"not a corpus: {pathname}")
+        try:
+            self.entries = self._read_index()
+        except CorpusException:
+            self.close()
+            raise
+        self._by_name = {entry.name: entry for entry in self.entries}
+
+    def _read_index(self) -> List[CorpusEntry]:
+        data = self.data
+        if len(data) < _HEADER.size + _FOOTER.size:
+            raise CorpusException(f"not a corpus: {self.pathname}")
+        magic, version = _HEADER.unpack_from(data, 0)
+        index_offset, index_length, end_magic = _FOOTER.unpack_from(data, len(data) - _FOOTER.size)
+        if magic != _MAGIC or end_magic != _MAGIC:
+            raise CorpusException(f"not a corpus: {self.pathname}")
+        if version != _VERSION:
+            raise CorpusException(f"unsupported corpus version {version} in {self.pathname}")
+        try:
+            model = json.loads(data[index_offset:index_offset + index_length].decode('utf8'))
+            return [CorpusEntry.from_model(m) for m in model['cases']]
+        except (ValueError, KeyError, TypeError, IndexError) as e:
+            raise CorpusException(f"corrupt corpus index in {self.pathname}: {e}")
+
+    def __len__(self):
+        return len(self.entries)
+
+    def names(self) -> List[str]:
+        return [entry.name for entry in self.entries]
+
+    def entry(self, name: str) -> CorpusEntry:
+        try:
+            return self._by_name[name]
+        except KeyError:
+            raise CorpusException(f"no test case {repr(name)} in {self.pathname}")
+
+    def _read(self, span: Optional[Tuple[int, int]]) -> Optional[str]:
+        if span is None:
+            return None
+        offset, length = span
+        return self.data[offset:offset + length].decode('utf8')
+
+    def read_input(self, name: str) -> Optional[str]:
+        return self._read(self.entry(name).input)
+
+    def read_expected(self, name: str) -> Optional[str]:
+        return self._read(self.entry(name).expected)
+
+    def close(self):
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+def open_corpus(pathname: str) -> Corpus:
+    """Returns a corpus shared by all callers in this process, opened again if the file has been replaced.
+
+    A corpus replaced by a newer one is not closed, because another thread may still
+    be reading it; its memory map is released when it is garbage-collected."""
+    st = os.stat(pathname)
+    key = st.st_mtime_ns, st.st_size
+    with _corpora_lock:
+        cached = _corpora.get(pathname, None)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    corpus = Corpus(pathname)
+    with _corpora_lock:
+        _corpora[pathname] = key, corpus
+    return corpus
+
+
+class CorpusWriter(object):
+    """Writer that creates a corpus in a temporary file and moves it into place when closed."""
+
+    def __init__(self, pathname: str):
+        self.pathname = pathname
+        os.makedirs(os.path.dirname(os.path.abspath(pathname)), exist_ok=True)
+        fd, self.temp_file = tempfile.mkstemp(prefix=os.path.basename(pathname), dir=os.path.dirname(os.path.abspath(pathname)))
+        self.ofile = os.fdopen(fd, 'wb')
+        self.ofile.write(_HEADER.pack(_MAGIC, _VERSION))
+        self.offset = _HEADER.size
+        self.entries: List[CorpusEntry] = []
+        self.names = set()
+
+    def _write(self, text: Optional[str]) -> Optional[Tuple[int, int]]:
+        if text is None:
+            return None
+        data = text.encode('utf8')
+        self.ofile.write(data)
+        span = self.offset, len(data)
+        self.offset += len(data)
+        return span
+
+    def add(self, name: str, input_text: Optional[str], expected_text: Optional[str], env: Optional[Dict[str, str]]=None,
+            args: Sequence[str]=(), exit_code: int=0):
+        if name in self.names:
+            raise ValueError(f"duplicate test case name {repr(name)}")
+        self.names.add(name)
+        entry = CorpusEntry(name, self._write(input_text), self._write(expected_text), None if env is None else dict(env),
+                            tuple(args), exit_code)
+        self.entries.append(entry)
+
+    def close(self):
+        index = json.dumps({'cases': [entry.to_model() for entry in self.entries]}).encode('utf8')
+        self.ofile.write(index)
+        self.ofile.write(_FOOTER.pack(self.offset, len(index), _MAGIC))
+        self.ofile.close()
+        os.chmod(self.temp_file, 0o644)
+        os.replace(self.temp_file, self.pathname)
+
+    def abort(self):
+        self.ofile.close()
+        os.unlink(self.temp_file)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+
+"""
+    distrib.py distributes test cases from a coordinator to worker processes.
+
+    The coordinator serves a queue of test cases on a TCP or UNIX socket.
+    Workers connect, pull test cases one at a time, run them with a
+    TestCaseRunner, and send back outcomes. Messages are JSON objects, one per
+    line. Workers either share the project directory with the coordinator or
+    fetch the executable and test case files they need. Connections are not
+    authenticated, so listen only on trusted networks.
+"""
+import argparse
+import base64
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+import time
+from typing import NamedTuple, Dict, List, Optional, Tuple, Any, Set, Union
+
+import hwsuite
+from hwsuite import check
+from hwsuite.check import TestCase, TestCaseOutcome, TestCaseRunner, TestCaseRunnerFactory, QuestionSettings
+from hwsuite.check import OutcomeSpool, SpooledText
+from hwsuite.resources import ResourceUsage
+from hwsuite.stress import StressSpec
+
+_log = logging.getLogger(__name__)
+_DEFAULT_HOST = '127.0.0.1'
+_WAIT_INTERVAL_SECONDS = 0.1
+_DRAIN_TIMEOUT_SECONDS = 5.0
+_IDLE_TIMEOUT_SECONDS = 300.0
+_MAX_TASK_ATTEMPTS = 3
+
+
+class AddressException(hwsuite.MessageworthyException):
+    pass
+
+
+class ProtocolException(Exception):
+    pass
+
+
+class FetchException(ProtocolException):
+    """Raised when the coordinator refuses or fails to serve a file."""
+    pass
+
+
+class WorkResult(NamedTuple):
+    """Number of test cases a worker ran and the exceptions that ended its connections early."""
+
+    num_run: int
+    failures: List[Exception]
+
+
+def parse_address(spec: str) -> Tuple[int, Union[str, Tuple[str, int]]]:
+    """Parses unix:PATH or [HOST:]PORT into an address family and address."""
+    if spec.startswith('unix:'):
+        return socket.AF_UNIX, spec[len('unix:'):]
+    host, _, port = spec.rpartition(':')
+    if not port.isdigit():
+        raise AddressException(f"address must be unix:PATH or [HOST:]PORT, not {repr(spec)}")
+    return socket.AF_INET, (host or _DEFAULT_HOST, int(port))
+
+
+def _send(wfile, message: Dict[str, Any]):
+    wfile.write((json.dumps(message) + "\n").encode('utf8'))
+    wfile.flush()
+
+
+def _receive(rfile) -> Optional[Dict[str, Any]]:
+    line = rfile.readline()
+    if not line:
+        return None
+    return json.loads(line.decode('utf8'))
+
+
+class Task(NamedTuple):
+
+    task_id: int
+    q_dir: str
+    executable: str
+    test_case: TestCase
+
+    def files(self) -> List[str]:
+        """Returns the pathnames of the files a worker needs to run this task."""
+        pathnames = [self.executable, self.test_case.input_file, self.test_case.expected_file]
+        pathnames += self.fixture_files()
+        return [p for p in pathnames if p is not None]
+
+    def fixture_files(self) -> List[str]:
+        return sorted(os.path.join(root, f) for d in self.test_case.fixtures for root, _, files in os.walk(d) for f in files)
+
+    def to_model(self, proj_dir: str) -> Dict[str, Any]:
+        def relative(pathname):
+            return None if pathname is None else os.path.relpath(pathname, proj_dir)
+        test_case = self.test_case
+        defs_file = os.path.join(self.q_dir, 'test-cases.json')
+        return {
+            'id': self.task_id,
+            'q_dir': relative(self.q_dir),
+            'executable': relative(self.executable),
+            'definitions': relative(defs_file) if os.path.isfile(defs_file) else None,
+            'case': {
+                'input': relative(test_case.input_file),
+                'expected': relative(test_case.expected_file),
+                'env': None if test_case.env is None else sorted(test_case.env),
+                'args': list(test_case.args),
+                'exit_code': test_case.exit_code,
+                'fixtures': [relative(d) for d in test_case.fixtures],
+                'fixture_files': [relative(f) for f in self.fixture_files()],
+                'name': test_case.name,
+                'input_text': test_case.embedded_input_text(),
+                'expected_text': test_case.embedded_expected_text(),
+                'stress': None if test_case.stress is None else test_case.stress.to_model(),
+            },
+        }
+
+
+def _text_to_model(text: Optional[Union[str, SpooledText]], retain: bool) -> Any:
+    if text is None or (retain and isinstance(text, str)):
+        return text
+    if isinstance(text, SpooledText):
+        if retain:
+            return text.read()
+        return {'digest': text.digest, 'size': text.size}
+    digest, size = SpooledText.digest_of(text)
+    return {'digest': digest, 'size': size}
+
+
+def _text_from_model(model: Any) -> Optional[Union[str, SpooledText]]:
+    if model is None or isinstance(model, str):
+        return model
+    return SpooledText(model['digest'], model['size'], None)
+
+
+def outcome_to_model(task_id: int, outcome: TestCaseOutcome) -> Dict[str, Any]:
+    """Serializes an outcome. Texts of passing outcomes are sent as digests only."""
+    retain = not outcome.passed
+    return {
+        'op': 'outcome',
+        'id': task_id,
+        'passed': outcome.passed,
+        'message': outcome.message,
+        'expected_text': _text_to_model(outcome.expected_text, retain),
+        'actual_text': _text_to_model(outcome.actual_text, retain),
+        'usage': None if outcome.usage is None else outcome.usage._asdict(),
+    }
+
+
+def outcome_from_model(model: Dict[str, Any], task: Task) -> TestCaseOutcome:
+    usage = None if model['usage'] is None else ResourceUsage(**model['usage'])
+    return TestCaseOutcome(model['passed'], task.executable, task.test_case, _text_from_model(model['expected_text']),
+                           _text_from_model(model['actual_text']), model['message'], usage)
+
+
+class Coordinator(object):
+    """Queue of tasks served to workers.
+
+    Tasks checked out by a worker whose connection closes before it sends their
+    outcomes are put back in the queue, up to a limit on attempts per task, after
+    which the task is recorded as failed. Shutting down waits briefly for workers
+    to disconnect, so that workers waiting for tasks are told there are none
+    left rather than finding their connections closed."""
+
+    def __init__(self, proj_dir: str, tasks: List[Task], spool: Optional[OutcomeSpool]=None):
+        self.proj_dir = proj_dir
+        self.tasks = {task.task_id: task for task in tasks}
+        self.spool = spool
+        self.pending = collections.deque(task.task_id for task in tasks)
+        self.outcomes: Dict[int, TestCaseOutcome] = {}
+        self.attempts: Dict[int, int] = collections.defaultdict(int)
+        self.cond = threading.Condition()
+        self.servable_files: Set[str] = set()
+        for task in tasks:
+            self.servable_files.update(os.path.relpath(p, proj_dir) for p in task.files())
+            defs_file = os.path.join(task.q_dir, 'test-cases.json')
+            if os.path.isfile(defs_file):
+                self.servable_files.add(os.path.relpath(defs_file, proj_dir))
+        self.server: Optional[socketserver.BaseServer] = None
+        self.num_connections = 0
+        self.idle_since = time.perf_counter()
+
+    def connect(self):
+        with self.cond:
+            self.num_connections += 1
+
+    def disconnect(self):
+        with self.cond:
+            self.num_connections -= 1
+            if self.num_connections == 0:
+                self.idle_since = time.perf_counter()
+            self.cond.notify_all()
+
+    def checkout(self) -> Tuple[str, Optional[Task]]:
+        """Returns ('task', task) if a task is pending, ('wait', None) if tasks are still running elsewhere, or ('done', None)."""
+        with self.cond:
+            if self.pending:
+                task_id = self.pending.popleft()
+                self.attempts[task_id] += 1
+                return 'task', self.tasks[task_id]
+            if len(self.outcomes) < len(self.tasks):
+                return 'wait', None
+            return 'done', None
+
+    def complete(self, task_id: int, outcome: TestCaseOutcome):
+        if self.spool is not None:
+            outcome = self.spool.compact(outcome)
+        with self.cond:
+            self.outcomes[task_id] = outcome
+            self.cond.notify_all()
+
+    def _fail(self, task_id: int, message: str):
+        task = self.tasks[task_id]
+        self.outcomes[task_id] = TestCaseOutcome(False, task.executable, task.test_case, None, '', message)
+        self.cond.notify_all()
+
+    def release(self, task_ids: Set[int]):
+        with self.cond:
+            unfinished = sorted(task_id for task_id in task_ids if task_id not in self.outcomes)
+            exhausted = [task_id for task_id in unfinished if self.attempts[task_id] >= _MAX_TASK_ATTEMPTS]
+            for task_id in exhausted:
+                _log.warning("%s: worker disconnected on each of %s attempts; giving up", self.tasks[task_id].test_case.label(), self.attempts[task_id])
+                self._fail(task_id, f"abandoned after {self.attempts[task_id]} attempts")
+            requeued = [task_id for task_id in unfinished if task_id not in self.outcomes]
+            if requeued:
+                _log.warning("worker disconnected; requeueing %s test cases", len(requeued))
+            self.pending.extendleft(reversed(requeued))
+
+    def abandon(self, message: str):
+        """Records failed outcomes for all tasks that have none."""
+        with self.cond:
+            self.pending.clear()
+            for task_id in self.tasks:
+                if task_id not in self.outcomes:
+                    self._fail(task_id, message)
+
+    def read_file(self, relpath: str) -> bytes:
+        if relpath not in self.servable_files:
+            raise ProtocolException(f"file not servable: {relpath}")
+        with open(os.path.join(self.proj_dir, relpath), 'rb') as ifile:
+            return ifile.read()
+
+    def serve(self, address_spec: str) -> socketserver.BaseServer:
+        """Starts serving tasks on a background thread."""
+        family, address = parse_address(address_spec)
+        server_type = _UnixServer if family == socket.AF_UNIX else _TCPServer
+        self.server = server_type(address, _CoordinatorHandler)
+        self.server.coordinator = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        _log.info("serving %s test cases on %s", len(self.tasks), address_spec)
+        return self.server
+
+    def wait(self, timeout: Optional[float]=None, idle_timeout: Optional[float]=None) -> bool:
+        """Waits for outcomes of all tasks.
+
+        Returns False if the timeout elapses first, or if no worker has been
+        connected for idle_timeout seconds while outcomes are still missing."""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        with self.cond:
+            while len(self.outcomes) < len(self.tasks):
+                now = time.perf_counter()
+                remaining = None if deadline is None else deadline - now
+                if idle_timeout is not None and self.num_connections == 0:
+                    idle_remaining = self.idle_since + idle_timeout - now
+                    remaining = idle_remaining if remaining is None else min(remaining, idle_remaining)
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def drain(self, timeout: float) -> bool:
+        """Waits for workers to disconnect. Returns False if the timeout elapses first."""
+        deadline = time.perf_counter() + timeout
+        with self.cond:
+            while self.num_connections > 0:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return False
+                self.cond.wait(remaining)
+        return True
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            if not self.drain(_DRAIN_TIMEOUT_SECONDS):
+                _log.debug("%s workers still connected at shutdown", self.num_connections)
+            self.server.server_close()
+            if isinstance(self.server, _UnixServer):
+                os.remove(self.server.server_address)
+            self.server = None
+
+    def outcomes_by_question(self) -> Dict[str, Dict[TestCase, TestCaseOutcome]]:
+        by_question = {}
+        with self.cond:
+            for task_id, outcome in self.outcomes.items():
+                by_question.setdefault(self.tasks[task_id].q_dir, {})[outcome.test_case] = outcome
+        return by_question
+
+
+class _CoordinatorHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        coordinator: Coordinator = self.server.coordinator
+        held: Set[int] = set()
+        coordinator.connect()
+        try:
+            while True:
+                message = _receive(self.rfile)
+                if message is None:
+                    break
+                op = message.get('op', None)
+                if op == 'next':
+                    status, task = coordinator.checkout()
+                    if task is None:
+                        _send(self.wfile, {'op': status})
+                    else:
+                        held.add(task.task_id)
+                        _send(self.wfile, dict(op='task', **task.to_model(coordinator.proj_dir)))
+                elif op == 'outcome':
+                    task_id = message['id']
+                    coordinator.complete(task_id, outcome_from_model(message, coordinator.tasks[task_id]))
+                    held.discard(task_id)
+                    _send(self.wfile, {'op': 'ack'})
+                elif op == 'fetch':
+                    try:
+                        data = coordinator.read_file(message['path'])
+                        _send(self.wfile, {'op': 'file', 'path': message['path'], 'data': base64.b64encode(data).decode('ascii')})
+                    except (ProtocolException, OSError) as e:
+                        _send(self.wfile, {'op': 'error', 'message': str(e)})
+                else:
+                    _send(self.wfile, {'op': 'error', 'message': f"unrecognized op {repr(op)}"})
+        except (OSError, ValueError, KeyError) as e:
+            _log.warning("connection from %s failed: %s", self.client_address, e)
+        finally:
+            coordinator.release(held)
+            coordinator.disconnect()
+
+
+class _TCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+
+    daemon_threads = True
+
+
+class Worker(object):
+    """Pulls test cases from a coordinator and runs them.
+
+    If proj_dir is None, files are fetched from the coordinator into a local
+    mirror directory; otherwise pathnames are resolved against proj_dir."""
+
+    def __init__(self, address_spec: str, runner_factory: TestCaseRunnerFactory, proj_dir: Optional[str]=None):
+        self.address_spec = address_spec
+        self.runner_factory = runner_factory
+        self.proj_dir = proj_dir
+        self.mirror_dir = None if proj_dir is not None else tempfile.mkdtemp(prefix='hwsuite-worker-')
+        self.fetched: Set[str] = set()
+        self.runners: Dict[str, TestCaseRunner] = {}
+        self.lock = threading.Lock()
+        self.num_run = 0
+
+    def _connect(self) -> socket.socket:
+        family, address = parse_address(self.address_spec)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.connect(address)
+        return sock
+
+    def _local_path(self, relpath: Optional[str]) -> Optional[str]:
+        if relpath is None:
+            return None
+        return os.path.join(self.proj_dir or self.mirror_dir, relpath)
+
+    def _resolve(self, relpath: Optional[str], rfile, wfile) -> Optional[str]:
+        local_path = self._local_path(relpath)
+        if relpath is None or self.mirror_dir is None:
+            return local_path
+        with self.lock:
+            if relpath in self.fetched:
+                return local_path
+            _send(wfile, {'op': 'fetch', 'path': relpath})
+            reply = _receive(rfile)
+            if reply is None:
+                raise ProtocolException(f"connection closed by coordinator while fetching {relpath}")
+            if reply.get('op', None) != 'file':
+                raise FetchException(f"failed to fetch {relpath}: {reply.get('message', reply)}")
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, 'wb') as ofile:
+                ofile.write(base64.b64decode(reply['data']))
+            self.fetched.add(relpath)
+        return local_path
+
+    def _runner(self, executable: str, q_dir: str) -> TestCaseRunner:
+        with self.lock:
+            runner = self.runners.get(executable, None)
+            if runner is None:
+                runner = self.runner_factory.create(executable)
+                runner.settings = QuestionSettings.load(q_dir, runner.settings.limits)
+                runner.q_dir = q_dir
+                self.runners[executable] = runner
+            return runner
+
+    def _run_task(self, model: Dict[str, Any], rfile, wfile) -> TestCaseOutcome:
+        q_dir = self._local_path(model['q_dir'])
+        executable = self._local_path(model['executable'])
+        case = model['case']
+        env = None if case['env'] is None else [tuple(item) for item in case['env']]
+        fixtures = [self._local_path(d) for d in case['fixtures']]
+        test_case = TestCase.create(self._local_path(case['input']), self._local_path(case['expected']),
+                                    env, case['args'], case['exit_code'], fixtures)
+        test_case = test_case._replace(name=case['name'], input_text=case['input_text'], expected_text=case['expected_text'])
+        if case.get('stress') is not None:
+            test_case = test_case._replace(stress=StressSpec.from_model(case['stress']))
+        try:
+            for relpath in [model['definitions'], model['executable'], case['input'], case['expected']] + case['fixture_files']:
+                self._resolve(relpath, rfile, wfile)
+            if self.mirror_dir is not None:
+                os.chmod(executable, os.stat(executable).st_mode | stat.S_IXUSR)
+        except (FetchException, OSError) as e:
+            _log.warning("%s: %s", test_case.label(), e)
+            return TestCaseOutcome(False, executable, test_case, None, '', f"files unavailable: {e}")
+        runner = self._runner(executable, q_dir)
+        try:
+            return runner.run_test_case(test_case)
+        except Exception as e:
+            _log.warning("%s: unhandled exception: %s %s", test_case.label(), type(e).__name__, e)
+            return TestCaseOutcome(False, executable, test_case, None, '', f"unhandled: {type(e).__name__} {e}")
+
+    def work(self) -> int:
+        """Runs test cases until the coordinator has none left. Returns the number of test cases run.
+
+        Raises ProtocolException if the coordinator closes the connection before saying it has
+        no test cases left, and OSError if the connection fails."""
+        num_run = 0
+        with self._connect() as sock, sock.makefile('rb') as rfile, sock.makefile('wb') as wfile:
+            while True:
+                _send(wfile, {'op': 'next'})
+                reply = _receive(rfile)
+                if reply is None:
+                    raise ProtocolException("connection closed by coordinator before all test cases were run")
+                if reply['op'] == 'done':
+                    break
+                if reply['op'] == 'wait':
+                    time.sleep(_WAIT_INTERVAL_SECONDS)
+                    continue
+                if reply['op'] != 'task':
+                    raise ProtocolException(f"unexpected reply {reply}")
+                outcome = self._run_task(reply, rfile, wfile)
+                _send(wfile, outcome_to_model(reply['id'], outcome))
+                if _receive(rfile) is None:
+                    raise ProtocolException(f"connection closed by coordinator before outcome of task {reply['id']} was acknowledged")
+                num_run += 1
+                with self.lock:
+                    self.num_run += 1
+        return num_run
+
+    def work_concurrently(self, num_threads: int) -> WorkResult:
+        """Runs test cases on several connections at once.
+
+        Returns the number of test cases run, including those run on connections
+        that failed, and the exceptions that ended connections early."""
+        failures = []
+        num_run_before = self.num_run
+
+        def work_or_fail():
+            try:
+                self.work()
+            except Exception as e:
+                _log.warning("worker connection to %s failed: %s %s", self.address_spec, type(e).__name__, e)
+                failures.append(e)
+        threads = [threading.Thread(target=work_or_fail) for _ in range(num_threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return WorkResult(self.num_run - num_run_before, failures)
+
+    def close(self):
+        if self.mirror_dir is not None:
+            shutil.rmtree(self.mirror_dir, ignore_errors=True)
+
+
+def create_tasks(cpp_checker: check.CppChecker, selections: List[Tuple[str, List[TestCase]]]) -> List[Task]:
+    tasks = []
+    for cpp_file, test_cases in selections:
+        if not test_cases:
+            continue
+        q_dir = os.path.dirname(cpp_file)
+        # noinspection PyProtectedMember
+        executable = cpp_checker._resolve_executable(q_dir)
+        for test_case in test_cases:
+            tasks.append(Task(len(tasks), q_dir, executable, test_case))
+    return tasks
+
+
+def serve_selections(address_spec: str, proj_dir: str, cpp_checker: check.CppChecker,
+                     selections: List[Tuple[str, List[TestCase]]], spool: Optional[OutcomeSpool]=None) -> Dict[str, Dict[TestCase, TestCaseOutcome]]:
+    """Serves the selected test cases to workers and returns their outcomes by question directory.
+
+    Test cases still without outcomes after no worker has been connected for a
+    while are recorded as failed."""
+    coordinator = Coordinator(proj_dir, create_tasks(cpp_checker, selections), spool)
+    coordinator.serve(address_spec)
+    try:
+        if not coordinator.wait(idle_timeout=_IDLE_TIMEOUT_SECONDS):
+            _log.warning("no workers connected for %s seconds; abandoning remaining test cases", _IDLE_TIMEOUT_SECONDS)
+            coordinator.abandon("abandoned: no workers connected")
+    finally:
+        coordinator.shutdown()
+    return coordinator.outcomes_by_question()
+
+
+def work(args: argparse.Namespace, address_spec: str) -> int:
+    """Runs test cases served by a coordinator, as configured by check command line options."""
+    proj_dir = None
+    if not check.get_arg(args, 'fetch', False):
+        proj_dir = os.path.abspath(args.project_dir or hwsuite.find_proj_root())
+    num_threads = args.threads or multiprocessing.cpu_count()
+    with check.create_sandbox_pool(args) as sandbox_pool:
+        worker = Worker(address_spec, check.create_runner_factory(args, sandbox_pool=sandbox_pool), proj_dir)
+        try:
+            result = worker.work_concurrently(num_threads)
+        finally:
+            worker.close()
+    _log.info("ran %s test cases served by %s", result.num_run, address_spec)
+    if result.failures:
+        _log.error("%s of %s connections to %s failed", len(result.failures), num_threads, address_spec)
+        return 1
+    return 0
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+"""
+    expressions.py evaluates arithmetic expressions written in test case definitions.
+
+    Expressions use Python syntax but are restricted to literals, names of
+    parameters, arithmetic, comparisons, conditional expressions, indexing,
+    and calls of a few builtin functions. Attribute access and everything
+    else is rejected when the expression is compiled, so definitions files
+    cannot run arbitrary code.
+
+    Powers, products, left shifts, and string formatting with % are evaluated
+    by functions that reject results too large to compute quickly, such as
+    9**9**9, 'x' * 10**10, or '%010000000000d' % 1, so definitions files
+    cannot hang generation or exhaust memory either.
+"""
+import ast
+import math
+import re
+from typing import Dict, Any, Set
+
+_FUNCTIONS = {
+    'abs': abs,
+    'min': min,
+    'max': max,
+    'round': round,
+    'int': int,
+    'float': float,
+    'str': str,
+    'len': len,
+    'sum': sum,
+    'sorted': sorted,
+    'floor': math.floor,
+    'ceil': math.ceil,
+    'sqrt': math.sqrt,
+}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Name, ast.Load,
+    ast.Num, ast.Str, ast.NameConstant, ast.Tuple, ast.List, ast.Subscript, ast.Index, ast.Slice, ast.Call,
+    ast.operator, ast.unaryop, ast.boolop, ast.cmpop,
+    getattr(ast, 'Constant', ast.Num),  # literals parse to Constant nodes in Python 3.8 and later
+)
+
+
+_MAX_INT_BITS = 1 << 16
+_MAX_SEQUENCE_LENGTH = 1 << 20
+_CONVERSION_SPEC = re.compile(r'%(?:\([^)]*\))?[-#0 +]*(\*|\d*)(?:\.(\*|\d*))?[hlL]?(.)', re.DOTALL)
+
+
+class ExpressionException(ValueError):
+    pass
+
+
+def _check_int_bits(bits: int, op: str):
+    if bits > _MAX_INT_BITS:
+        raise ExpressionException(f"result of {op} would exceed {_MAX_INT_BITS} bits")
+
+
+def _checked_pow(a, b):
+    if isinstance(a, int) and isinstance(b, int) and b > 0 and abs(a) > 1:
+        _check_int_bits(b * (abs(a).bit_length() - 1), '**')
+    return a ** b
+
+
+def _checked_mul(a, b):
+    for seq, n in ((a, b), (b, a)):
+        if isinstance(seq, (str, list, tuple)) and isinstance(n, int):
+            if len(seq) * n > _MAX_SEQUENCE_LENGTH:
+                raise ExpressionException(f"result of * would exceed {_MAX_SEQUENCE_LENGTH} items")
+            return a * b
+    if isinstance(a, int) and isinstance(b, int):
+        _check_int_bits(a.bit_length() + b.bit_length(), '*')
+    return a * b
+
+
+def _checked_lshift(a, b):
+    if isinstance(a, int) and isinstance(b, int) and b > 0:
+        _check_int_bits(a.bit_length() + b, '<<')
+    return a << b
+
+
+def _checked_mod(a, b):
+    if not isinstance(a, str):
+        return a % b
+    specs = _CONVERSION_SPEC.findall(a)
+    # every conversion is at most its width and precision plus the longest formatted value
+    values = b.values() if isinstance(b, dict) else (b if isinstance(b, tuple) else (b,))
+    to_text = repr if any(conversion in 'ra' for _, _, conversion in specs) else str
+    longest = max((len(to_text(value)) for value in {id(value): value for value in values}.values()), default=0)
+    bound = len(a) + len(specs) * longest
+    for width, precision, _ in specs:
+        if width == '*' or precision == '*':
+            raise ExpressionException("* width and precision are not allowed in % format strings")
+        bound += int(width or 0) + int(precision or 0)
+    if bound > _MAX_SEQUENCE_LENGTH:
+        raise ExpressionException(f"result of % would exceed {_MAX_SEQUENCE_LENGTH} characters")
+    return a % b
+
+
+# keys are not identifiers, so no name in an expression can refer to or shadow these functions
+_CHECKED_OPERATORS = {
+    ast.Pow: ('<pow>', _checked_pow),
+    ast.Mult: ('<mul>', _checked_mul),
+    ast.LShift: ('<lshift>', _checked_lshift),
+    ast.Mod: ('<mod>', _checked_mod),
+}
+_CHECKED_FUNCTIONS = {name: function for name, function in _CHECKED_OPERATORS.values()}
+
+
+class _CheckedOperatorTransformer(ast.NodeTransformer):
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.AST:
+        self.generic_visit(node)
+        checked = _CHECKED_OPERATORS.get(type(node.op), None)
+        if checked is None:
+            return node
+        call = ast.Call(func=ast.Name(id=checked[0], ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+        return ast.copy_location(call, node)
+
+
+class Expression(object):
+    """Expression compiled once and evaluated with different parameter values."""
+
+    def __init__(self, source: str):
+        self.source = source
+        try:
+            tree = ast.parse(source, mode='eval')
+        except SyntaxError as e:
+            raise ExpressionException(f"invalid expression {repr(source)}: {e.msg}")
+        self.names: Set[str] = set()
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                raise ExpressionException(f"{type(node).__name__} is not allowed in expression {repr(source)}")
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS or node.keywords:
+                    raise ExpressionException(f"only positional calls of {sorted(_FUNCTIONS)} are allowed in expression {repr(source)}")
+            elif isinstance(node, ast.Name) and node.id not in _FUNCTIONS:
+                self.names.add(node.id)
+        tree = ast.fix_missing_locations(_CheckedOperatorTransformer().visit(tree))
+        self.code = compile(tree, '<expression>', 'eval')
+
+    def evaluate(self, values: Dict[str, Any]) -> Any:
+        missing = self.names - set(values.keys())
+        if missing:
+            raise ExpressionException(f"undefined names {sorted(missing)} in expression {repr(self.source)}")
+        namespace = dict(_FUNCTIONS)
+        namespace.update(values)
+        namespace.update(_CHECKED_FUNCTIONS)
+        return eval(self.code, {'__builtins__': {}}, namespace)
+
+    def __repr__(self):
+        return f"Expression({repr(self.source)})"
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+"""
+    history.py records how long test case programs take and derives timeouts from it.
+
+    Durations are kept per question and per test case in a JSON file in the
+    project directory, so that each run of check can size its timeouts from the
+    runs before it.
+"""
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+_log = logging.getLogger(__name__)
+HISTORY_BASENAME = '.hwhistory.json'
+_MAX_SAMPLES = 50
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """Returns the nearest-rank percentile of the values, or zero if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = int(math.ceil(p / 100.0 * len(ordered)))
+    return ordered[max(rank, 1) - 1]
+
+
+class TimeoutPolicy(NamedTuple):
+    """Policy that derives a timeout from observed durations.
+
+    The timeout is a multiple of the 99th percentile of the durations, clamped
+    to the floor and ceiling. With fewer than min_samples durations, the default
+    timeout supplied by the caller is used instead."""
+
+    multiplier: float = 3.0
+    floor: float = 0.5
+    ceiling: float = 30.0
+    min_samples: int = 5
+
+    def derive(self, durations: Sequence[float], default_timeout: float) -> float:
+        if len(durations) < self.min_samples:
+            return default_timeout
+        timeout = self.multiplier * percentile(durations, 99)
+        return min(max(timeout, self.floor), self.ceiling)
+
+    def censored(self, timeout: float) -> float:
+        """Returns the duration to record for a run that did not finish within the timeout.
+
+        The true duration is unknown but longer than the timeout, so a multiple of the
+        timeout is recorded, capped at the ceiling, which lets derived timeouts grow."""
+        return min(timeout * self.multiplier, max(self.ceiling, timeout))
+
+
+DEFAULT_TIMEOUT_POLICY = TimeoutPolicy()
+
+
+class RunHistory(object):
+    """Durations observed per question and test case.
+
+    Two series are kept: processing durations, from the end of input to the
+    termination of the process, and runtimes, which span the whole test case.
+    Only the most recent values of each test case are retained, along with
+    whether the test case passed the last time it ran. Instances are safe to
+    record into from multiple threads."""
+
+    def __init__(self, durations: Optional[Dict[str, Dict[str, List[float]]]]=None,
+                 runtimes: Optional[Dict[str, Dict[str, List[float]]]]=None,
+                 passed: Optional[Dict[str, Dict[str, bool]]]=None, max_samples: int=_MAX_SAMPLES):
+        self.durations = durations if durations is not None else {}
+        self.runtimes = runtimes if runtimes is not None else {}
+        self.passed = passed if passed is not None else {}
+        self.max_samples = max_samples
+        self.lock = threading.Lock()
+
+    def _append(self, table: Dict[str, Dict[str, List[float]]], q_name: str, case_label: str, seconds: float):
+        with self.lock:
+            samples = table.setdefault(q_name, {}).setdefault(case_label, [])
+            samples.append(round(seconds, 6))
+            del samples[:-self.max_samples]
+
+    def record(self, q_name: str, case_label: str, seconds: float):
+        self._append(self.durations, q_name, case_label, seconds)
+
+    def record_timeout(self, q_name: str, case_label: str, timeout: float, policy: TimeoutPolicy=DEFAULT_TIMEOUT_POLICY):
+        """Records a processing duration for a run that timed out, as a censored sample."""
+        self.record(q_name, case_label, policy.censored(timeout))
+
+    def record_runtime(self, q_name: str, case_label: str, seconds: float):
+        self._append(self.runtimes, q_name, case_label, seconds)
+
+    def record_result(self, q_name: str, case_label: str, passed: bool):
+        with self.lock:
+            self.passed.setdefault(q_name, {})[case_label] = passed
+
+    def last_passed(self, q_name: str, case_label: str) -> Optional[bool]:
+        """Returns whether the test case passed when it last ran, or None if it has not run."""
+        with self.lock:
+            return self.passed.get(q_name, {}).get(case_label, None)
+
+    def mean_runtime(self, q_name: str, case_label: str) -> Optional[float]:
+        with self.lock:
+            samples = self.runtimes.get(q_name, {}).get(case_label, [])
+            return sum(samples) / len(samples) if samples else None
+
+    def samples(self, q_name: str, case_label: Optional[str]=None) -> List[float]:
+        """Returns durations of a test case, or of all test cases of the question if no case is specified."""
+        with self.lock:
+            q_durations = self.durations.get(q_name, {})
+            if case_label is not None:
+                return list(q_durations.get(case_label, []))
+            return [d for samples in q_durations.values() for d in samples]
+
+    def timeout(self, q_name: str, case_label: str, default_timeout: float,
+                policy: TimeoutPolicy=DEFAULT_TIMEOUT_POLICY) -> float:
+        """Derives a timeout for a test case from its durations, falling back on those of its question."""
+        durations = self.samples(q_name, case_label)
+        if len(durations) < policy.min_samples:
+            durations = self.samples(q_name)
+        return policy.derive(durations, default_timeout)
+
+    def schedule(self, q_name: str, case_labels: Sequence[str]) -> List[int]:
+        """Returns the order in which to run test cases, as indexes into the given labels.
+
+        Test cases that failed when they last ran come first, then test cases that
+        have never run, then the rest from longest to shortest mean runtime. The
+        order is otherwise that of the given labels."""
+        def priority(i):
+            label = case_labels[i]
+            last_passed = self.last_passed(q_name, label)
+            if last_passed is False:
+                return 0, 0.0
+            runtime = self.mean_runtime(q_name, label)
+            if last_passed is None or runtime is None:
+                return 1, 0.0
+            return 2, -runtime
+        return sorted(range(len(case_labels)), key=priority)
+
+    def to_dict(self) -> Dict:
+        def copy(table):
+            return {q_name: {label: list(samples) for label, samples in cases.items()} for q_name, cases in table.items()}
+        with self.lock:
+            return {
+                'durations': copy(self.durations),
+                'runtimes': copy(self.runtimes),
+                'passed': {q_name: dict(cases) for q_name, cases in self.passed.items()},
+            }
+
+    def save(self, pathname: str):
+        """Writes the history to a file; a temporary file is renamed so that readers never see a partial file."""
+        model = self.to_dict()
+        fd, temp_pathname = tempfile.mkstemp(prefix=os.path.basename(pathname), dir=os.path.dirname(pathname) or None)
+        try:
+            with os.fdopen(fd, 'w') as ofile:
+                json.dump(model, ofile, indent=1, sort_keys=True)
+            os.replace(temp_pathname, pathname)
+        except Exception:
+            os.remove(temp_pathname)
+            raise
+        _log.debug("history written to %s", pathname)
+
+    @staticmethod
+    def load(pathname: str) -> 'RunHistory':
+        """Reads a history file. A missing or unreadable file yields an empty history."""
+        try:
+            with open(pathname, 'r') as ifile:
+                model = json.load(ifile)
+            return RunHistory(model.get('durations', {}), model.get('runtimes', {}), model.get('passed', {}))
+        except FileNotFoundError:
+            return RunHistory()
+        except (ValueError, AttributeError) as e:
+            _log.warning("ignoring unreadable history file %s: %s", pathname, e)
+            return RunHistory()
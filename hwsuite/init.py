@@ -28,6 +28,8 @@ cmake-build*/
 __pycache__/
 test-cases/
 *.pyc
+.hwhistory.json
+.hwcache/
 """
 _SAFETY_MODES = ('ignore', 'cautious', 'overwrite')
 _DEFAULT_SAFETY_MODE = 'ignore'
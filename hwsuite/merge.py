@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+"""
+    merge.py combines the results files written by sharded check jobs.
+
+    A summary of failures is printed, and the exit code is what a single check
+    of the whole project would have returned.
+"""
+import logging
+import sys
+from argparse import ArgumentParser
+from typing import List, Dict, Any, Sequence
+
+import hwsuite
+from hwsuite import check
+from hwsuite.shard import CaseResult, load_results
+
+_log = logging.getLogger(__name__)
+
+
+class IncompleteShardsException(hwsuite.MessageworthyException):
+    pass
+
+
+class ResultsFileException(hwsuite.MessageworthyException):
+    pass
+
+
+def _load(pathname: str) -> Dict[str, Any]:
+    try:
+        return load_results(pathname)
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise ResultsFileException(f"could not read {pathname}: {e}")
+
+
+def merge_results(loaded: Sequence[Dict[str, Any]], allow_partial: bool=False) -> List[CaseResult]:
+    """Merges the results of several results files into one list.
+
+    Unless allow_partial is true, every shard of the partition must be present
+    exactly once. A test case that appears in more than one file counts as
+    passed only if it passed everywhere."""
+    shards = [item['shard'] for item in loaded if item['shard'] is not None]
+    if shards and not allow_partial:
+        counts = set(shard.count for shard in shards)
+        if len(counts) != 1:
+            raise IncompleteShardsException(f"results come from partitions of different sizes: {sorted(counts)}")
+        count = counts.pop()
+        indexes = [shard.index for shard in shards]
+        missing = sorted(set(range(1, count + 1)) - set(indexes))
+        if missing:
+            raise IncompleteShardsException(f"missing results of shards {missing} of {count}")
+        duplicates = sorted(set(i for i in indexes if indexes.count(i) > 1))
+        if duplicates:
+            raise IncompleteShardsException(f"more than one results file for shards {duplicates}")
+    merged: Dict[str, CaseResult] = {}
+    for item in loaded:
+        for result in item['results']:
+            previous = merged.get(result.key(), None)
+            if previous is None or (previous.passed and not result.passed):
+                merged[result.key()] = result
+    return [merged[key] for key in sorted(merged.keys())]
+
+
+def summarize(results: List[CaseResult], ofile=sys.stdout) -> int:
+    """Prints failed test cases and a count of failures per question. Returns the number of failures."""
+    per_question: Dict[str, List[CaseResult]] = {}
+    for result in results:
+        per_question.setdefault(result.question, []).append(result)
+    total_failures = 0
+    for q_name in sorted(per_question.keys()):
+        q_results = per_question[q_name]
+        failures = [r for r in q_results if not r.passed]
+        for failure in failures:
+            print(f"{q_name}: {failure.case}: {failure.message}", file=ofile)
+        print(f"{q_name}: {len(failures)} failures among {len(q_results)} test cases", file=ofile)
+        total_failures += len(failures)
+    return total_failures
+
+
+def main():
+    parser = ArgumentParser(description="Merge results files written by check --results.")
+    hwsuite.add_logging_options(parser)
+    parser.add_argument("results_files", nargs='+', metavar="FILE", help="results files to merge")
+    parser.add_argument("--allow-partial", action='store_true', help="do not require results of every shard")
+    args = parser.parse_args()
+    hwsuite.configure_logging(args)
+    try:
+        merged = merge_results([_load(pathname) for pathname in args.results_files], args.allow_partial)
+    except hwsuite.MessageworthyException as ex:
+        print(f"{__name__}: {type(ex).__name__}: {ex}", file=sys.stderr)
+        return 2
+    # noinspection PyProtectedMember
+    return 0 if summarize(merged) == 0 else check._ERR_TEST_CASE_FAILURES
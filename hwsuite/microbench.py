@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+"""
+    microbench.py times pure-Python functions that run once per line or per file.
+
+    Inputs are synthesized at a size proportional to the scale argument, so that
+    costs that grow faster than the input show up as the scale is increased.
+"""
+import logging
+import os
+import tempfile
+import timeit
+from argparse import ArgumentParser
+from typing import Callable, Any, Dict, List, NamedTuple, Optional, Sequence
+
+import hwsuite
+from hwsuite import bench, check, stage
+from hwsuite.check import StuffConfig
+from hwsuite.testcases import ParameterSource
+
+_log = logging.getLogger(__name__)
+_DEFAULT_SCALE = 1000
+_DEFAULT_REPEAT = 5
+
+
+def synthesize_cpp_lines(num_lines: int, cut_every: int=20) -> List[str]:
+    """Returns lines of C++ source with a cut block and a cut line every so often.
+
+    Lines stop short of num_lines if the next cut block would not fit, so that
+    every cut block is stopped."""
+    lines = []
+    while len(lines) < num_lines:
+        i = len(lines)
+        if i % cut_every == 0:
+            if i + 4 > num_lines:
+                break
+            lines += [
+                "    // stage: cut start\n",
+                f"    int debug{i} = {i};\n",
+                f"    cerr << debug{i} << endl;\n",
+                "    // stage: cut stop\n",
+            ]
+        elif i % cut_every == cut_every // 2:
+            lines.append(f"    cerr << \"trace {i}\" << endl;  // stage: cut\n")
+        else:
+            lines.append(f"    total += values[{i}] * {i};\n")
+    return lines
+
+
+def synthesize_input_line(length: int) -> str:
+    """Returns a line of the given length that includes characters with special meaning for screen."""
+    pattern = "price: $12 ^ hash #3 plain text "
+    return (pattern * (length // len(pattern) + 1))[:length]
+
+
+def synthesize_test_case_files(parent: str, num_cases: int) -> str:
+    """Writes loose test case files into a question directory and returns the directory."""
+    q_dir = os.path.join(parent, f"q-{num_cases}")
+    cases_dir = os.path.join(q_dir, 'test-cases')
+    os.makedirs(cases_dir, exist_ok=True)
+    width = len(str(num_cases))
+    for i in range(num_cases):
+        case_id = str(i + 1).zfill(width)
+        for suffix, text in (('input', f"{i}\n"), ('expected', f"value {i}\n")):
+            with open(os.path.join(cases_dir, f"{case_id}-{suffix}.txt"), 'w') as ofile:
+                ofile.write(text)
+        if i % 10 == 0:
+            with open(os.path.join(cases_dir, f"{case_id}-args.txt"), 'w') as ofile:
+                ofile.write(f"--case\n{i}\n")
+    return q_dir
+
+
+def synthesize_param_source(num_cases: int) -> ParameterSource:
+    model = {
+        'input': "{name}\n{a} {b}\n",
+        'expected': "Enter your name: {name}\nEnter two numbers: {a} {b}\nSum = {c}\n",
+        'param_names': ['name', 'a', 'b', 'c'],
+        'test_cases': [[f"name{i}", i, 2 * i, 3 * i] for i in range(num_cases)],
+    }
+    return ParameterSource.load(model, os.getcwd())
+
+
+class Microbenchmark(NamedTuple):
+
+    name: str
+    prepare: Callable[[int, str], Callable[[], Any]]   # (scale, work dir) -> function to time
+
+
+def _prepare_translate_special_chars(scale: int, workdir: str) -> Callable[[], Any]:
+    line = synthesize_input_line(scale * 10)
+    return lambda: StuffConfig.translate_special_chars(line)
+
+
+def _prepare_transfer_lines(scale: int, workdir: str) -> Callable[[], Any]:
+    lines = synthesize_cpp_lines(scale)
+    return lambda: stage._transfer_lines(lines)
+
+
+def _prepare_derive_counterparts(scale: int, workdir: str) -> Callable[[], Any]:
+    patterns = ('/q1/test-cases/{}-expected.txt', '/q1/test-cases/expected-{}.txt', '/q1/{}-expected-output.txt')
+    pathnames = [patterns[i % len(patterns)].format(i) for i in range(scale)]
+
+    def derive_all():
+        for pathname in pathnames:
+            check._derive_counterparts(pathname)
+    return derive_all
+
+
+def _prepare_detect_test_case_files(scale: int, workdir: str) -> Callable[[], Any]:
+    q_dir = synthesize_test_case_files(workdir, scale)
+    return lambda: check.detect_test_case_files(q_dir, use_index=False)
+
+
+def _prepare_detect_test_case_files_indexed(scale: int, workdir: str) -> Callable[[], Any]:
+    q_dir = synthesize_test_case_files(workdir, scale)
+    check.detect_test_case_files(q_dir)
+    return lambda: check.detect_test_case_files(q_dir)
+
+
+def _prepare_render(scale: int, workdir: str) -> Callable[[], Any]:
+    param_source = synthesize_param_source(scale)
+
+    def render_all():
+        for test_case in param_source.test_cases:
+            param_source.render_input_text(test_case)
+            param_source.render_expected_text(test_case)
+    return render_all
+
+
+MICROBENCHMARKS = (
+    Microbenchmark('translate_special_chars', _prepare_translate_special_chars),
+    Microbenchmark('transfer_lines', _prepare_transfer_lines),
+    Microbenchmark('derive_counterparts', _prepare_derive_counterparts),
+    Microbenchmark('detect_test_case_files', _prepare_detect_test_case_files),
+    Microbenchmark('detect_test_case_files_indexed', _prepare_detect_test_case_files_indexed),
+    Microbenchmark('render', _prepare_render),
+)
+
+
+def measure(microbenchmark: Microbenchmark, scale: int, repeat: int=_DEFAULT_REPEAT, workdir: Optional[str]=None) -> float:
+    """Returns the fastest of several timings of the benchmark function, in milliseconds."""
+    with tempfile.TemporaryDirectory(dir=workdir) as tempdir:
+        fn = microbenchmark.prepare(scale, tempdir)
+        timings = timeit.repeat(fn, number=1, repeat=repeat)
+    return min(timings) * 1000
+
+
+def run_all(scales: Sequence[int], names: Optional[Sequence[str]]=None, repeat: int=_DEFAULT_REPEAT) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for microbenchmark in MICROBENCHMARKS:
+        if names and microbenchmark.name not in names:
+            continue
+        for scale in scales:
+            elapsed_ms = measure(microbenchmark, scale, repeat)
+            _log.debug("%s at scale %s: %.3f ms", microbenchmark.name, scale, elapsed_ms)
+            results[f"{microbenchmark.name}[{scale}]"] = {'ms': round(elapsed_ms, 3)}
+    return results
+
+
+def main():
+    parser = ArgumentParser(description="Time hwsuite functions that run per line or per file.")
+    hwsuite.add_logging_options(parser)
+    parser.add_argument("names", nargs='*', metavar="NAME", help=f"benchmarks to run; choices are {[m.name for m in MICROBENCHMARKS]}")
+    parser.add_argument("-s", "--scale", default=str(_DEFAULT_SCALE), metavar="LIST", help="comma-separated input sizes (lines, files, cases, or tens of characters)")
+    parser.add_argument("-r", "--repeat", type=int, default=_DEFAULT_REPEAT, metavar="N", help="number of timings per benchmark; the fastest is reported")
+    parser.add_argument("--baseline", metavar="FILE", help="compare results to baseline stored in FILE")
+    parser.add_argument("--save-baseline", action='store_true', help="store results in the baseline file")
+    args = parser.parse_args()
+    hwsuite.configure_logging(args)
+    if args.save_baseline and not args.baseline:
+        parser.error("--save-baseline requires --baseline")
+    unknown = set(args.names) - set(m.name for m in MICROBENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {sorted(unknown)}")
+    results = run_all(bench._parse_list(args.scale, int), args.names, args.repeat)
+    baseline = bench.load_baseline(args.baseline) if args.baseline else {}
+    bench.compare_to_baseline(results, baseline, ('ms',))
+    if args.save_baseline:
+        bench.store_baseline(results, args.baseline)
+    return 0
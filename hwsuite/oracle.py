@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+"""
+    oracle.py produces expected output by running a reference implementation.
+
+    A definitions file may name a reference executable instead of, or in
+    addition to, an expected output template. The reference is run on the
+    rendered input of each test case, with the input as standard input, and
+    its standard output becomes the expected output. Because the input is not
+    echoed, the oracle suits questions whose input_mode is 'stdin'.
+
+    Outputs are cached in the cache directory beside the definitions file,
+    keyed by a digest of the reference (the executable and any arguments that
+    name files) and a digest of the input, so only new or changed inputs cause
+    the reference to run. When all test cases of a definitions file have been
+    rendered, outputs of inputs that were not among them are dropped from the
+    cache. Runs that miss the cache are spread over a pool of threads, each of
+    which waits on its own reference process.
+"""
+import concurrent.futures
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from typing import Dict, List, Optional, Sequence, Any, Iterable, Callable, Set
+
+import hwsuite
+
+_log = logging.getLogger(__name__)
+_DEFAULT_TIMEOUT_SECONDS = 10.0
+_CACHE_PREFIX = 'oracle-'
+
+
+class OracleException(hwsuite.MessageworthyException):
+    pass
+
+
+def _digest_file(h, pathname: str):
+    with open(pathname, 'rb') as ifile:
+        for chunk in iter(lambda: ifile.read(65536), b''):
+            h.update(chunk)
+
+
+def input_digest(input_text: str) -> str:
+    return hashlib.sha256(input_text.encode('utf8')).hexdigest()
+
+
+class Oracle(object):
+    """Reference implementation that computes expected outputs, with a cache of outputs by input digest."""
+
+    def __init__(self, executable: str, args: Sequence[str]=(), root_dir: str='.', timeout: Optional[float]=_DEFAULT_TIMEOUT_SECONDS,
+                 max_workers: Optional[int]=None):
+        self.root_dir = root_dir
+        self.executable = os.path.join(root_dir, executable)
+        if not os.path.isfile(self.executable) and os.sep not in executable:
+            self.executable = shutil.which(executable) or self.executable
+        if not os.path.isfile(self.executable):
+            raise OracleException(f"reference executable not found: {executable}")
+        self.args = tuple(args)
+        self.timeout = timeout
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.digest = self._compute_digest()
+        self.outputs: Dict[str, str] = {}
+        self.requested: Set[str] = set()
+        self.loaded = False
+        self.modified = False
+
+    def _resolve_arg(self, arg: str) -> Optional[str]:
+        pathname = os.path.join(self.root_dir, arg)
+        return os.path.abspath(pathname) if os.path.isfile(pathname) else None
+
+    def referenced_files(self) -> List[str]:
+        """Returns the executable and the arguments that name files, whose contents determine the outputs."""
+        files = [self.executable]
+        for arg in self.args:
+            pathname = self._resolve_arg(arg)
+            if pathname is not None:
+                files.append(pathname)
+        return files
+
+    def command(self) -> List[str]:
+        """Returns the command that runs the reference. Arguments that name files are made absolute,
+        because the reference runs in a temporary directory."""
+        return [os.path.abspath(self.executable)] + [self._resolve_arg(arg) or arg for arg in self.args]
+
+    def _compute_digest(self) -> str:
+        h = hashlib.sha256(json.dumps(list(self.args)).encode('utf8'))
+        for pathname in self.referenced_files():
+            _digest_file(h, pathname)
+        return h.hexdigest()
+
+    def cache_pathname(self) -> str:
+        return os.path.join(self.root_dir, hwsuite.CACHE_DIR_BASENAME, f"{_CACHE_PREFIX}{self.digest[:16]}.json")
+
+    def load(self):
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            with open(self.cache_pathname(), 'r') as ifile:
+                model = json.load(ifile)
+            if model.get('reference') == self.digest:
+                self.outputs = model['outputs']
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            _log.debug("ignoring unreadable oracle cache: %s", e)
+
+    def save(self, prune: bool=False):
+        """Stores the cache of outputs and removes caches of other versions of the reference.
+
+        If prune is true, outputs of inputs that have not been requested since the
+        cache was loaded are dropped, so pass it only after requesting all inputs."""
+        if prune:
+            unrequested = set(self.outputs.keys()) - self.requested
+            if unrequested:
+                _log.debug("dropping %s unrequested outputs from oracle cache", len(unrequested))
+                self.outputs = {digest: output for digest, output in self.outputs.items() if digest in self.requested}
+                self.modified = True
+        if not self.modified:
+            return
+        cache_file = self.cache_pathname()
+        try:
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            fd, temp_file = tempfile.mkstemp(prefix=os.path.basename(cache_file), dir=os.path.dirname(cache_file))
+            with os.fdopen(fd, 'w') as ofile:
+                json.dump({'reference': self.digest, 'outputs': self.outputs}, ofile)
+            os.replace(temp_file, cache_file)
+            for stale in glob.glob(os.path.join(os.path.dirname(cache_file), f"{_CACHE_PREFIX}*.json")):
+                if stale != cache_file:
+                    os.remove(stale)
+            self.modified = False
+        except OSError as e:
+            _log.debug("failed to save oracle cache %s: %s", cache_file, e)
+
+    def run(self, input_text: str) -> str:
+        """Runs the reference on one input and returns its standard output."""
+        cmd = self.command()
+        name = os.path.basename(self.executable)
+        with tempfile.TemporaryDirectory() as tempdir:
+            try:
+                proc = subprocess.run(cmd, input=input_text.encode('utf8'), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                      cwd=tempdir, timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                raise OracleException(f"reference {name} timed out after {self.timeout} seconds")
+            except OSError as e:
+                raise OracleException(f"reference {name} could not be run: {e}") from e
+        if proc.returncode != 0:
+            stderr = proc.stderr.decode('utf8', errors='replace')[:256]
+            raise OracleException(f"reference {name} exited with code {proc.returncode}; stderr={stderr}")
+        try:
+            return proc.stdout.decode('utf8')
+        except UnicodeDecodeError as e:
+            raise OracleException(f"reference {name} printed output that is not UTF-8: {e}") from e
+
+    def expected_outputs(self, inputs: Sequence[str], on_error: Optional[Callable[[int, Exception], None]]=None) -> List[Optional[str]]:
+        """Returns the expected output for each input, running the reference in parallel on inputs not cached.
+
+        If on_error is None, the first failure of the reference is raised. Otherwise on_error is
+        called with the index and exception of each input on which the reference failed, and
+        the output for that input is None."""
+        self.load()
+        digests = [input_digest(text) for text in inputs]
+        self.requested.update(digests)
+        missing = {}
+        for digest, text in zip(digests, inputs):
+            if digest not in self.outputs:
+                missing[digest] = text
+        failures: Dict[str, Exception] = {}
+        if missing:
+            _log.debug("running reference on %s of %s inputs", len(missing), len(inputs))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.max_workers, len(missing))) as executor:
+                futures = {digest: executor.submit(self.run, text) for digest, text in missing.items()}
+                for digest, future in futures.items():
+                    try:
+                        self.outputs[digest] = future.result()
+                        self.modified = True
+                    except OracleException as e:
+                        failures[digest] = e
+        outputs = []
+        for i, digest in enumerate(digests):
+            if digest in failures:
+                if on_error is None:
+                    raise failures[digest]
+                on_error(i, failures[digest])
+                outputs.append(None)
+            else:
+                outputs.append(self.outputs[digest])
+        return outputs
+
+    @staticmethod
+    def from_model(model: Any, root_dir: str) -> 'Oracle':
+        """Creates an oracle from the 'reference' value of a definitions model, which is a
+        pathname or an object with 'executable' and optional 'args' and 'timeout'."""
+        if isinstance(model, str):
+            return Oracle(model, root_dir=root_dir)
+        if not isinstance(model, dict) or 'executable' not in model:
+            raise OracleException("reference must be a pathname or an object that defines 'executable'")
+        return Oracle(model['executable'], model.get('args', ()), root_dir, model.get('timeout', _DEFAULT_TIMEOUT_SECONDS))
+
+
+def batches(items: Iterable[Any], size: int) -> Iterable[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
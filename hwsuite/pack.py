@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+"""
+    pack.py converts test cases between loose files and a packed corpus.
+
+    Packing reads the loose-file layout of NN-input.txt, NN-expected.txt,
+    NN-env.txt, and NN-args.txt, found the way check finds test cases, and
+    writes a corpus. Unpacking writes the loose files of each test case in a
+    corpus. Test case names in a corpus may name subdirectories, but never
+    directories outside the one being unpacked into.
+"""
+import logging
+import os
+import sys
+from argparse import ArgumentParser
+
+import hwsuite
+from hwsuite import check
+from hwsuite.corpus import Corpus, CorpusWriter, CorpusException
+
+_log = logging.getLogger(__name__)
+
+
+def _case_name(src_dir: str, expected_file: str, identifier: str) -> str:
+    name = identifier or os.path.splitext(os.path.basename(expected_file))[0]
+    return os.path.normpath(os.path.join(os.path.relpath(os.path.dirname(expected_file), src_dir), name))
+
+
+def pack(src_dir: str, corpus_file: str) -> int:
+    """Packs the test cases defined by loose files in a directory into a corpus. Returns the number of test cases packed."""
+    test_cases = [tc for tc in check.detect_test_case_files(src_dir, use_index=False) if tc.expected_file is not None]
+    if not test_cases:
+        raise CorpusException(f"no test case files in {src_dir}")
+    with CorpusWriter(corpus_file) as writer:
+        for test_case in test_cases:
+            input_text = None if test_case.input_file is None else check.read_file_text(test_case.input_file)
+            writer.add(_case_name(src_dir, test_case.expected_file, test_case.filter_key()), input_text,
+                       check.read_file_text(test_case.expected_file), test_case.env_dict(), test_case.args, test_case.exit_code)
+    return len(test_cases)
+
+
+def _check_name(name: str):
+    """Raises CorpusException if a test case name could refer to a file outside the directory it is unpacked into."""
+    if not name or os.path.isabs(name) or '..' in name.replace('\\', '/').split('/'):
+        raise CorpusException(f"test case name {repr(name)} is not a relative pathname within the destination")
+
+
+def _write_text(pathname: str, text: str):
+    os.makedirs(os.path.dirname(pathname), exist_ok=True)
+    with open(pathname, 'w') as ofile:
+        ofile.write(text)
+
+
+def unpack(corpus_file: str, dest_dir: str) -> int:
+    """Writes the test cases of a corpus as loose files in a directory. Returns the number of test cases written.
+
+    The loose-file layout has no place for an expected exit code, so a nonzero one is lost with a warning.
+    Raises CorpusException before writing anything if a test case name is absolute or contains '..'."""
+    with Corpus(corpus_file) as corpus:
+        for entry in corpus.entries:
+            _check_name(entry.name)
+        for entry in corpus.entries:
+            prefix = os.path.join(dest_dir, entry.name)
+            _write_text(f"{prefix}-expected.txt", corpus.read_expected(entry.name) or '')
+            if entry.input is not None:
+                _write_text(f"{prefix}-input.txt", corpus.read_input(entry.name))
+            if entry.env is not None:
+                _write_text(f"{prefix}-env.txt", ''.join(f"{k}={v}\n" for k, v in sorted(entry.env.items())))
+            if entry.args:
+                _write_text(f"{prefix}-args.txt", ''.join(f"{arg}\n" for arg in entry.args))
+            if entry.exit_code != 0:
+                _log.warning("exit code %s of test case %s cannot be represented by loose files", entry.exit_code, entry.name)
+        return len(corpus)
+
+
+def _describe(corpus_file: str, ofile=sys.stdout):
+    with Corpus(corpus_file) as corpus:
+        for entry in corpus.entries:
+            input_size = 0 if entry.input is None else entry.input[1]
+            expected_size = 0 if entry.expected is None else entry.expected[1]
+            print(f"{entry.name}\tinput={input_size}\texpected={expected_size}\texit_code={entry.exit_code}", file=ofile)
+
+
+def main():
+    parser = ArgumentParser(description="Convert test cases between loose files and a packed corpus.")
+    hwsuite.add_logging_options(parser)
+    parser.add_argument("action", choices=('pack', 'unpack', 'list'), help="'pack' DIR into CORPUS, 'unpack' CORPUS into DIR, or 'list' the cases in CORPUS")
+    parser.add_argument("corpus", metavar="CORPUS", help="corpus file")
+    parser.add_argument("directory", nargs='?', metavar="DIR", help="directory of loose test case files")
+    args = parser.parse_args()
+    hwsuite.configure_logging(args)
+    try:
+        if args.action == 'list':
+            _describe(args.corpus)
+            return 0
+        if args.directory is None:
+            parser.error(f"{args.action} requires DIR")
+        if args.action == 'pack':
+            count = pack(args.directory, args.corpus)
+        else:
+            count = unpack(args.corpus, args.directory)
+        _log.info("%s test cases %sed", count, args.action)
+        return 0
+    except hwsuite.MessageworthyException as ex:
+        print(f"{__name__}: {type(ex).__name__}: {ex}", file=sys.stderr)
+        return 1
+    except OSError as ex:
+        print(f"{__name__}: {type(ex).__name__}: {ex}", file=sys.stderr)
+        return 1
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+
+"""
+    resources.py measures and limits the resources consumed by child processes.
+"""
+import json
+import logging
+import os
+import resource
+import signal
+import subprocess
+import sys
+import threading
+import time
+from typing import NamedTuple, Optional, Dict, Any, Tuple, List, Callable, Set, Sequence
+
+_log = logging.getLogger(__name__)
+_MAX_POLL_INTERVAL_SECONDS = 0.05
+_RLIMIT_WRAPPER = """\
+import json, os, resource, sys
+for rsrc, soft, hard in json.loads(sys.argv[1]):
+    resource.setrlimit(rsrc, (soft, hard))
+try:
+    os.execvp(sys.argv[2], sys.argv[2:])
+except OSError as e:
+    sys.stderr.write(f"{sys.argv[2]}: {e}\\n")
+    os._exit(127)
+"""
+
+
+class ResourceUsage(NamedTuple):
+
+    user_ms: float
+    sys_ms: float
+    wall_ms: float
+    max_rss_kb: int
+
+    def cpu_ms(self) -> float:
+        return self.user_ms + self.sys_ms
+
+    def describe(self) -> str:
+        return f"cpu={self.cpu_ms():.0f}ms (user={self.user_ms:.0f}ms sys={self.sys_ms:.0f}ms) wall={self.wall_ms:.0f}ms rss={self.max_rss_kb}kB"
+
+    @staticmethod
+    def from_rusage(rusage, wall_seconds: float) -> 'ResourceUsage':
+        # ru_maxrss is in kilobytes on Linux
+        return ResourceUsage(round(rusage.ru_utime * 1000, 3), round(rusage.ru_stime * 1000, 3),
+                             round(wall_seconds * 1000, 3), rusage.ru_maxrss)
+
+
+class UsageLimits(NamedTuple):
+    """Limits on the resources a test case may use.
+
+    The max_* limits are checked after the process terminates and fail a test case
+    that exceeds them. The rlimit_* limits are enforced by the kernel while the
+    process runs, and the timeout is a wall-clock deadline after which the process
+    group of the test case is killed."""
+
+    max_cpu_ms: Optional[float] = None
+    max_rss_kb: Optional[int] = None
+    rlimit_cpu_seconds: Optional[int] = None
+    rlimit_as_kb: Optional[int] = None
+    rlimit_fsize_kb: Optional[int] = None
+    timeout: Optional[float] = None
+
+    def violation(self, usage: Optional[ResourceUsage]) -> Optional[str]:
+        """Returns a message describing how the usage exceeds these limits, or None if it does not."""
+        if usage is None:
+            return None
+        if self.max_cpu_ms is not None and usage.cpu_ms() > self.max_cpu_ms:
+            return f"cpu limit exceeded: {usage.cpu_ms():.0f} ms > {self.max_cpu_ms} ms"
+        if self.max_rss_kb is not None and usage.max_rss_kb > self.max_rss_kb:
+            return f"memory limit exceeded: {usage.max_rss_kb} kB > {self.max_rss_kb} kB"
+        return None
+
+    def update(self, model: Dict[str, Any]) -> 'UsageLimits':
+        """Returns a copy of these limits with values overridden by those defined in the given dictionary."""
+        overrides = {}
+        for key, value in model.items():
+            if key in self._fields:
+                overrides[key] = value
+            else:
+                _log.warning("ignoring unrecognized limit %s", repr(key))
+        return self._replace(**overrides)
+
+    def rlimits(self) -> List[Tuple[int, int, int]]:
+        """Returns (resource, soft limit, hard limit) triples to be applied to a child process."""
+        triples = []
+        if self.rlimit_cpu_seconds is not None:
+            # exceeding the soft limit delivers SIGXCPU; the hard limit is a backstop that delivers SIGKILL
+            triples.append((resource.RLIMIT_CPU, self.rlimit_cpu_seconds, self.rlimit_cpu_seconds + 1))
+        if self.rlimit_as_kb is not None:
+            triples.append((resource.RLIMIT_AS, self.rlimit_as_kb * 1024, self.rlimit_as_kb * 1024))
+        if self.rlimit_fsize_kb is not None:
+            triples.append((resource.RLIMIT_FSIZE, self.rlimit_fsize_kb * 1024, self.rlimit_fsize_kb * 1024))
+        return triples
+
+    def wrap_command(self, cmd: Sequence[str]) -> List[str]:
+        """Returns a command that applies the rlimits and then executes the given command,
+        or the given command itself if there are no rlimits.
+
+        The limits are set by the wrapper before it executes the command, so the program
+        never runs without them, and no code runs between fork and exec in this process,
+        which is unsafe with threads. The same wrapper serves programs started by another
+        program, such as screen."""
+        triples = self.rlimits()
+        if not triples:
+            return list(cmd)
+        return [sys.executable, '-I', '-S', '-c', _RLIMIT_WRAPPER, json.dumps(triples)] + list(cmd)
+
+
+NO_LIMITS = UsageLimits()
+
+
+def _to_returncode(status: int) -> int:
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def wait_measured(proc: subprocess.Popen, started: float, timeout: Optional[float]=None) -> Optional[ResourceUsage]:
+    """Waits for a process to terminate and returns its resource usage.
+
+    The process is reaped with wait4, so its return code is assigned here instead of
+    by the Popen object. Returns None if the timeout elapses before the process
+    terminates or if the process was already reaped elsewhere. The started argument
+    is the time.perf_counter() value when the process was launched."""
+    if proc.returncode is not None:
+        return None
+    deadline = None if timeout is None else time.perf_counter() + timeout
+    interval = 0.001
+    while True:
+        try:
+            pid, status, rusage = os.wait4(proc.pid, 0 if deadline is None else os.WNOHANG)
+        except ChildProcessError:
+            _log.debug("process %s already reaped", proc.pid)
+            proc.wait()
+            return None
+        if pid != 0:
+            proc.returncode = _to_returncode(status)
+            return ResourceUsage.from_rusage(rusage, time.perf_counter() - started)
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            return None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * 2, _MAX_POLL_INTERVAL_SECONDS)
+
+
+def _write_and_close(stream, data: bytes):
+    try:
+        stream.write(data)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            stream.close()
+        except BrokenPipeError:
+            pass
+
+
+def communicate_measured(proc: subprocess.Popen, started: float,
+                         input_data: Optional[bytes]=None) -> Tuple[bytes, bytes, Optional[ResourceUsage]]:
+    """Reads standard output and standard error of a process until they are closed, then reaps it.
+
+    If input_data is not None, it is written to the standard input of the process,
+    which must be a pipe, and the pipe is closed. Returns output bytes, error bytes,
+    and resource usage."""
+    stdin_writer = None
+    if input_data is not None:
+        stdin_writer = threading.Thread(target=_write_and_close, args=(proc.stdin, input_data))
+        stdin_writer.start()
+    stderr_chunks = []
+    stderr_reader = threading.Thread(target=lambda: stderr_chunks.append(proc.stderr.read()))
+    stderr_reader.start()
+    try:
+        stdout = proc.stdout.read()
+    finally:
+        if stdin_writer is not None:
+            stdin_writer.join()
+        stderr_reader.join()
+        proc.stdout.close()
+        proc.stderr.close()
+    usage = wait_measured(proc, started)
+    return stdout, b''.join(stderr_chunks), usage
+
+
+def describe_signal_exit(returncode: int) -> Optional[str]:
+    """Returns a message if the return code indicates the process was killed for exceeding an rlimit."""
+    if returncode == -signal.SIGXCPU:
+        return "cpu rlimit exceeded"
+    if returncode == -signal.SIGXFSZ:
+        return "file size rlimit exceeded"
+    return None
+
+
+def _child_pids(pid: int) -> List[int]:
+    children = []
+    task_dir = f"/proc/{pid}/task"
+    try:
+        tids = os.listdir(task_dir)
+    except OSError:
+        return children
+    for tid in tids:
+        try:
+            with open(os.path.join(task_dir, tid, 'children'), 'r') as ifile:
+                children += [int(token) for token in ifile.read().split()]
+        except OSError:
+            pass
+    return children
+
+
+def kill_process_groups(pid: int, sig: int=signal.SIGKILL) -> Set[int]:
+    """Signals the process group of a process and the process groups of its children.
+
+    Children are included because a program may put itself or its children in a
+    separate session; screen does this for the program it runs. The process group
+    of this process is never signaled. Returns the set of process groups signaled."""
+    pgids = set()
+    for candidate in [pid] + _child_pids(pid):
+        try:
+            pgids.add(os.getpgid(candidate))
+        except ProcessLookupError:
+            pass
+    pgids.discard(os.getpgrp())
+    for pgid in pgids:
+        try:
+            os.killpg(pgid, sig)
+        except ProcessLookupError:
+            pass
+    _log.debug("sent signal %s to process groups %s", sig, pgids)
+    return pgids
+
+
+class Watchdog(object):
+    """Context manager that invokes a kill function if the body takes longer than a timeout."""
+
+    def __init__(self, kill: Callable[[], Any], timeout: Optional[float]):
+        self.kill = kill
+        self.timeout = timeout
+        self.expired = False
+        self._timer: Optional[threading.Timer] = None
+
+    def _expire(self):
+        self.expired = True
+        _log.info("deadline of %s seconds elapsed; killing process", self.timeout)
+        self.kill()
+
+    def __enter__(self):
+        if self.timeout is not None:
+            self._timer = threading.Timer(self.timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._timer is not None:
+            self._timer.cancel()
+        return False
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+"""
+    sandbox.py provides working directories that are reused from one test case to the next.
+
+    Creating and recursively deleting a directory for every test case is costly
+    on slow disks. A pool hands out directories that are emptied when they are
+    returned, and removes them all when it is closed. The pool may be placed on
+    a tmpfs such as /dev/shm.
+
+    Fixture files are staged into working directories by reflink where the
+    filesystem supports copy-on-write clones, otherwise by hard link, and by
+    copying only if neither works. A program that writes to a hard-linked
+    fixture would modify the original, so only fixtures that cannot be written
+    are hard-linked; others are copied when reflinks are not supported.
+"""
+import contextlib
+import fcntl
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+from typing import List, Optional, Dict, Sequence, Tuple
+
+_log = logging.getLogger(__name__)
+_FICLONE = 0x40049409
+STAGE_METHODS = ('reflink', 'hardlink', 'copy')
+_stage_methods_by_devices: Dict[Tuple[int, int], str] = {}
+_stage_methods_lock = threading.Lock()
+
+
+class Sandbox(object):
+    """Working directory on loan from a pool; set keep to retain it after use."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.keep = False
+
+
+def _empty_directory(directory: str) -> bool:
+    """Removes the contents of a directory. Returns False if something could not be removed."""
+    try:
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+    except OSError as e:
+        _log.debug("failed to empty %s: %s", directory, e)
+        return False
+    return True
+
+
+class SandboxPool(object):
+    """Pool of working directories shared by the threads that run test cases.
+
+    Directories are created on demand, so the pool grows to the number of test
+    cases that run at once. If keep_failed is true, directories that are to be
+    kept are moved out of the pool instead of being emptied, and they survive
+    when the pool is closed."""
+
+    def __init__(self, parent: Optional[str]=None, keep_failed: bool=False):
+        self.parent = parent
+        self.root = tempfile.mkdtemp(prefix='hwsuite-sandboxes-', dir=parent)
+        self.keep_failed = keep_failed
+        self.available: List[str] = []
+        self.lock = threading.Lock()
+        self.num_created = 0
+        self.kept_root: Optional[str] = None
+        self.kept: List[str] = []
+
+    def acquire(self) -> str:
+        with self.lock:
+            if self.available:
+                return self.available.pop()
+            self.num_created += 1
+            path = os.path.join(self.root, str(self.num_created))
+        os.mkdir(path)
+        return path
+
+    def _keep(self, path: str, name: str) -> str:
+        with self.lock:
+            if self.kept_root is None:
+                self.kept_root = tempfile.mkdtemp(prefix='hwsuite-failed-', dir=self.parent)
+            destination = os.path.join(self.kept_root, f"{re.sub(r'[^A-Za-z0-9._-]', '_', name)}-{len(self.kept) + 1}")
+            self.kept.append(destination)
+        os.rename(path, destination)
+        _log.info("working directory of failed test case %s kept at %s", name, destination)
+        return destination
+
+    def release(self, path: str, keep: bool=False, name: str='case'):
+        """Returns a directory to the pool, or moves it out of the pool if it is to be kept."""
+        if keep and self.keep_failed:
+            self._keep(path, name)
+            return
+        if _empty_directory(path):
+            with self.lock:
+                self.available.append(path)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+
+    @contextlib.contextmanager
+    def sandbox(self, name: str='case'):
+        """Context manager that lends a directory; the directory is kept if an exception is raised."""
+        sandbox = Sandbox(self.acquire())
+        try:
+            yield sandbox
+        except BaseException:
+            sandbox.keep = True
+            raise
+        finally:
+            self.release(sandbox.path, sandbox.keep, name)
+
+    def close(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+        with self.lock:
+            self.available.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+def _reflink(src: str, dst: str):
+    with open(src, 'rb') as ifile, open(dst, 'wb') as ofile:
+        try:
+            fcntl.ioctl(ofile.fileno(), _FICLONE, ifile.fileno())
+        except OSError:
+            ofile.close()
+            os.unlink(dst)
+            raise
+
+
+def _stage_file(method: str, src: str, dst: str):
+    if method == 'reflink':
+        _reflink(src, dst)
+    elif method == 'hardlink':
+        os.link(src, dst)
+    else:
+        shutil.copyfile(src, dst)
+        shutil.copymode(src, dst)
+
+
+def _is_read_only(pathname: str) -> bool:
+    """Returns True if the file has no write permission bits and cannot be written by this process."""
+    return os.stat(pathname).st_mode & 0o222 == 0 and not os.access(pathname, os.W_OK)
+
+
+def stage_file(src: str, dst: str) -> str:
+    """Makes src available at dst as cheaply as possible and returns the method used.
+
+    The cheapest method that works is remembered for each pair of source and
+    destination devices, so methods that are bound to fail are not retried.
+    A source that can be written is never hard-linked, so that writes to dst
+    cannot change it."""
+    devices = os.stat(src).st_dev, os.stat(os.path.dirname(dst)).st_dev
+    with _stage_methods_lock:
+        cached = _stage_methods_by_devices.get(devices, STAGE_METHODS[0])
+    read_only = _is_read_only(src)
+    for method in STAGE_METHODS[STAGE_METHODS.index(cached):]:
+        if method == 'hardlink' and not read_only:
+            continue
+        try:
+            _stage_file(method, src, dst)
+        except OSError as e:
+            if method == STAGE_METHODS[-1]:
+                raise
+            _log.debug("staging by %s from device %s to %s failed: %s", method, devices[0], devices[1], e)
+            with _stage_methods_lock:
+                next_method = STAGE_METHODS[STAGE_METHODS.index(method) + 1]
+                current = _stage_methods_by_devices.get(devices, STAGE_METHODS[0])
+                if STAGE_METHODS.index(next_method) > STAGE_METHODS.index(current):
+                    _stage_methods_by_devices[devices] = next_method
+            continue
+        return method
+
+
+def list_fixture_files(fixture_dirs: Sequence[str]) -> Dict[str, str]:
+    """Maps relative pathnames to the fixture files they are staged from.
+
+    A file in a later directory takes the place of a file with the same relative
+    pathname in an earlier one. Directories that do not exist are ignored."""
+    files = {}
+    for fixture_dir in fixture_dirs:
+        for root, _, filenames in os.walk(fixture_dir):
+            for f in filenames:
+                src = os.path.join(root, f)
+                files[os.path.relpath(src, fixture_dir)] = src
+    return files
+
+
+def stage_fixtures(fixture_dirs: Sequence[str], dest: str) -> int:
+    """Stages the files in the fixture directories into a working directory. Returns the number of files staged."""
+    files = list_fixture_files(fixture_dirs)
+    for relpath, src in sorted(files.items()):
+        dst = os.path.join(dest, relpath)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        stage_file(src, dst)
+    return len(files)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""
+    shard.py partitions test cases among jobs and defines the results files they write.
+
+    Every (question, test case) pair of a project has a key that does not depend
+    on the machine the project is checked out on. Keys are assigned to shards
+    either round-robin in sorted order or, when runtimes are known, by placing
+    the longest test cases first on the least-loaded shard.
+"""
+import json
+import logging
+import statistics
+from typing import NamedTuple, Dict, List, Optional, Sequence, Any
+
+_log = logging.getLogger(__name__)
+_RESULTS_VERSION = 1
+_DEFAULT_RUNTIME_ESTIMATE = 1.0
+BALANCE_CHOICES = ('count', 'runtime')
+
+
+class Shard(NamedTuple):
+    """Shard of a partition, with a one-based index."""
+
+    index: int
+    count: int
+
+    def __str__(self):
+        return f"{self.index}/{self.count}"
+
+    @staticmethod
+    def parse(spec: str) -> 'Shard':
+        """Parses a shard specification of the form INDEX/COUNT; raises ValueError if it is malformed."""
+        parts = spec.split('/')
+        if len(parts) != 2:
+            raise ValueError(f"shard must be INDEX/COUNT, not {repr(spec)}")
+        index, count = int(parts[0]), int(parts[1])
+        if count < 1 or not (1 <= index <= count):
+            raise ValueError(f"shard index must be between 1 and count: {repr(spec)}")
+        return Shard(index, count)
+
+
+def assign(keys: Sequence[str], count: int, runtimes: Optional[Dict[str, Optional[float]]]=None) -> Dict[str, int]:
+    """Maps each key to a zero-based shard number.
+
+    Without runtimes, keys are dealt round-robin in sorted order. With runtimes,
+    keys are placed longest first onto the shard with the least total runtime;
+    keys whose runtime is unknown are estimated at the median of the known runtimes."""
+    ordered = sorted(set(keys))
+    if runtimes is None:
+        return {key: position % count for position, key in enumerate(ordered)}
+    known = [r for r in runtimes.values() if r is not None]
+    estimate = statistics.median(known) if known else _DEFAULT_RUNTIME_ESTIMATE
+    weights = {key: runtimes.get(key, None) for key in ordered}
+    weights = {key: (estimate if weight is None else weight) for key, weight in weights.items()}
+    loads = [0.0] * count
+    assignments = {}
+    for key in sorted(ordered, key=lambda k: -weights[k]):
+        target = min(range(count), key=lambda n: loads[n])
+        assignments[key] = target
+        loads[target] += weights[key]
+    _log.debug("estimated shard loads: %s", loads)
+    return assignments
+
+
+class CaseResult(NamedTuple):
+    """Result of one test case, as recorded in a results file."""
+
+    question: str
+    case: str
+    passed: bool
+    message: str
+    wall_ms: Optional[float] = None
+    cpu_ms: Optional[float] = None
+
+    def key(self) -> str:
+        return f"{self.question}/{self.case}"
+
+
+def write_results(pathname: str, results: List[CaseResult], shard: Optional[Shard]=None):
+    model = {
+        'version': _RESULTS_VERSION,
+        'shard': None if shard is None else str(shard),
+        'results': [r._asdict() for r in sorted(results, key=CaseResult.key)],
+    }
+    with open(pathname, 'w') as ofile:
+        json.dump(model, ofile, indent=1)
+    _log.debug("%s results written to %s", len(results), pathname)
+
+
+def load_results(pathname: str) -> Dict[str, Any]:
+    """Reads a results file. Returns a dictionary with 'shard' (a Shard or None) and 'results' (a list of CaseResult)."""
+    with open(pathname, 'r') as ifile:
+        model = json.load(ifile)
+    if model.get('version', None) != _RESULTS_VERSION:
+        raise ValueError(f"unsupported results file version in {pathname}")
+    shard = None if model.get('shard', None) is None else Shard.parse(model['shard'])
+    return {
+        'shard': shard,
+        'results': [CaseResult(**r) for r in model['results']],
+    }
@@ -8,7 +8,7 @@ import sys
 import fnmatch
 import logging
 import shutil
-from typing import List, Optional, Sequence, Dict
+from typing import List, Optional, Sequence, Dict, Iterable, Iterator
 import re
 import hwsuite
 from hwsuite import GitRunner
@@ -39,16 +39,21 @@ def clean(stage_dir: str):
         _log.info("%s directories and %s files deleted", ndirs, nfiles)
 
 
+_CUT_ANY = re.compile(r'//\s*stage:\s*(remove|cut)(\s+.*)?$', flags=re.IGNORECASE)
+_CUT_START = re.compile(r'//\s*stage:\s*(remove|cut)\s+start(\s+.*)?$', flags=re.IGNORECASE)
+_CUT_STOP = re.compile(r'//\s*stage:\s*(remove|cut)\s+stop(\s+.*)?$', flags=re.IGNORECASE)
+
+
 def _is_cut_any(line) -> bool:
-    return re.search(r'//\s*stage:\s*(remove|cut)(\s+.*)?$', line, flags=re.IGNORECASE) is not None
+    return _CUT_ANY.search(line) is not None
 
 
 def _is_cut_start(line: str) -> bool:
-    return re.search(r'//\s*stage:\s*(remove|cut)\s+start(\s+.*)?$', line, flags=re.IGNORECASE) is not None
+    return _CUT_START.search(line) is not None
 
 
 def _is_cut_stop(line: str) -> bool:
-    return re.search(r'//\s*stage:\s*(remove|cut)\s+stop(\s+.*)?$', line, flags=re.IGNORECASE) is not None
+    return _CUT_STOP.search(line) is not None
 
 
 class StageSyntaxException(hwsuite.MessageworthyException):
@@ -57,46 +62,49 @@ class StageSyntaxException(hwsuite.MessageworthyException):
 class UnstoppedCutException(StageSyntaxException):
     pass
 
-
-def _is_in_remove_block(all_lines: List[str], line_index: int) -> bool:
-    # look backward until you find a cut start or cut stop line; if cut stop, then FALSE; if cut start, then...
-    # look foward until you find a cut start or cut stop; if cut stop, then TRUE, if cut start or never found, then ERROR
-    if _is_cut_any(all_lines[line_index]):
-        return True
-    after_cut_start = False
-    for i in reversed(range(0, line_index)):
-        line = all_lines[i]
-        if _is_cut_stop(line):
-            return False
-        if _is_cut_start(line):
-            after_cut_start = True
-            break
-    if after_cut_start:
-        for i in range(line_index + 1, len(all_lines)):
-            line = all_lines[i]
-            if _is_cut_stop(line):
-                return True
-        raise UnstoppedCutException("`cut stop` never found")
-    return False
-
-
-def _transfer_lines(src_lines: List[str]) -> List[str]:
-    good_lines = []
-    for idx, line in enumerate(src_lines):
-        if not _is_cut_any(line) and not _is_in_remove_block(src_lines, idx):
-            good_lines.append(line)
-    return good_lines
+class UnstartedCutException(StageSyntaxException):
+    pass
 
 
-def _transfer(src_file, dst_file) -> str:
-    """Copy src_file to dst_file, removing lines marked for removal, and return the text written."""
+def _filter_lines(src_lines: Iterable[str]) -> Iterator[str]:
+    """Yields the lines that are not cut, in one pass. Marker lines are always cut.
+
+    Raises a StageSyntaxException, after yielding the lines that precede the problem,
+    if a cut start is not followed by a cut stop or a cut stop is not preceded by a cut start."""
+    cut_start_lineno = None
+    lineno = 0
+    for lineno, line in enumerate(src_lines, 1):
+        if _CUT_ANY.search(line) is None:
+            if cut_start_lineno is None:
+                yield line
+            continue
+        if _CUT_START.search(line) is not None:
+            if cut_start_lineno is not None:
+                raise UnstoppedCutException(f"`cut start` on line {cut_start_lineno} not stopped before `cut start` on line {lineno}")
+            cut_start_lineno = lineno
+        elif _CUT_STOP.search(line) is not None:
+            if cut_start_lineno is None:
+                raise UnstartedCutException(f"`cut stop` on line {lineno} has no `cut start`")
+            cut_start_lineno = None
+    if cut_start_lineno is not None:
+        raise UnstoppedCutException(f"`cut start` on line {cut_start_lineno} never stopped")
+
+
+def _transfer_lines(src_lines: Iterable[str]) -> List[str]:
+    return list(_filter_lines(src_lines))
+
+
+def _transfer(src_file, dst_file):
+    """Copy src_file to dst_file, removing lines marked for removal. Lines are streamed, so
+    the source is never held in memory; the destination is removed if the source is malformed."""
     with open(src_file, 'r') as ifile:
-        src_lines = [line for line in ifile]
-    good_lines = _transfer_lines(src_lines)
-    with open(dst_file, 'w') as ofile:
-        for line in good_lines:
-            ofile.write(line)
-    return ''.join(good_lines)
+        with open(dst_file, 'w') as ofile:
+            try:
+                ofile.writelines(_filter_lines(ifile))
+            except StageSyntaxException:
+                ofile.close()
+                os.remove(dst_file)
+                raise
 
 
 def _has_unsafe_chars(s: str) -> bool:
@@ -173,8 +181,8 @@ class Stager(object):
             os.makedirs(os.path.dirname(dst_file), exist_ok=True)
             try:
                 _transfer(src_file, dst_file)
-            except UnstoppedCutException:
-                raise UnstoppedCutException(f"unstopped cut in {src_file}")
+            except StageSyntaxException as ex:
+                raise type(ex)(f"{src_file}: {ex}") from ex
             _log.debug("copied %s -> %s", src_file, dst_file)
         return len(dest_mapping)
 
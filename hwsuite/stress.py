@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+"""
+    stress.py defines stress test cases, whose input is generated as it is consumed.
+
+    A stress test case feeds a program far more input than is practical to store,
+    in order to expose slow algorithms. The input comes from a generator command,
+    whose standard output becomes the program's standard input through a pipe, or
+    from a line template rendered once per line and written to the program in
+    chunks. Either way the program's pace sets the pace of generation, because
+    writes to a full pipe block.
+
+    The output is not stored either. It is summarized as it is read, by its
+    SHA-256 digest, its size, its number of lines, and its last line, and the
+    summary is checked against an expected digest, a predicate expression over
+    the summary, or both.
+
+    Stress test cases are listed under 'stress' in a question's definitions file:
+
+        "stress": [{
+            "name": "sum-1m",
+            "input": {"header": "1000000\\n", "line": "{x}\\n", "count": 1000000, "fields": {"x": "i * 7 % 1000"}},
+            "expect": {"predicate": "lines == 1 and last_line == '499500000'"}
+        }, {
+            "name": "from-script",
+            "input": {"command": ["./gen.sh", "100000"]},
+            "expect": {"sha256": "..."}
+        }]
+
+    A line template may use the line index i and the fields, which are
+    expressions of i. A relative command pathname is resolved against the
+    question directory. Test cases may also set args, env, and exit_code.
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import NamedTuple, Optional, Tuple, Dict, Any, Iterator, List
+
+from hwsuite.expressions import Expression
+from hwsuite.testcases import CompiledTemplate, DefinitionsException
+
+_log = logging.getLogger(__name__)
+CHUNK_SIZE = 65536
+_TAIL_SIZE = 65536
+SUMMARY_NAMES = frozenset(['sha256', 'size', 'lines', 'last_line'])
+
+
+class StressSpec(NamedTuple):
+    """Input source and output check of a stress test case. Fields are hashable so test cases stay hashable."""
+
+    command: Optional[Tuple[str, ...]] = None
+    line: Optional[str] = None
+    count: int = 0
+    fields: Tuple[Tuple[str, str], ...] = ()
+    header: str = ''
+    footer: str = ''
+    sha256: Optional[str] = None
+    predicate: Optional[str] = None
+
+    def describe_expectation(self) -> str:
+        parts = []
+        if self.sha256 is not None:
+            parts.append(f"sha256={self.sha256}\n")
+        if self.predicate is not None:
+            parts.append(f"predicate: {self.predicate}\n")
+        return ''.join(parts)
+
+    def to_model(self) -> Dict[str, Any]:
+        return self._asdict()
+
+    @staticmethod
+    def from_model(model: Dict[str, Any]) -> 'StressSpec':
+        model = dict(model)
+        model['command'] = None if model['command'] is None else tuple(model['command'])
+        model['fields'] = tuple(tuple(item) for item in model['fields'])
+        return StressSpec(**model)
+
+    @staticmethod
+    def parse(model: Dict[str, Any], q_dir: str) -> 'StressSpec':
+        """Parses and validates the input and expect objects of a stress test case definition."""
+        input_model = model.get('input', None)
+        expect = model.get('expect', None)
+        if not isinstance(input_model, dict) or not isinstance(expect, dict):
+            raise DefinitionsException("stress test case must define 'input' and 'expect' objects")
+        if ('command' in input_model) == ('line' in input_model):
+            raise DefinitionsException("stress test case input must define exactly one of 'command' and 'line'")
+        if 'sha256' not in expect and 'predicate' not in expect:
+            raise DefinitionsException("stress test case must expect 'sha256' or 'predicate'")
+        command = None
+        if 'command' in input_model:
+            command = list(input_model['command'])
+            if not command:
+                raise DefinitionsException("stress test case command is empty")
+            if not os.path.isabs(command[0]) and os.sep in command[0]:
+                command[0] = os.path.normpath(os.path.join(q_dir, command[0]))
+            command = tuple(command)
+        fields = tuple(input_model.get('fields', {}).items())
+        spec = StressSpec(command, input_model.get('line', None), int(input_model.get('count', 0)), fields,
+                          input_model.get('header', ''), input_model.get('footer', ''), expect.get('sha256', None),
+                          expect.get('predicate', None))
+        spec.validate()
+        return spec
+
+    def validate(self):
+        """Checks that templates and expressions use only the names available to them."""
+        defined = {'i'}
+        for name, source in self.fields:
+            undefined = Expression(source).names - defined
+            if undefined:
+                raise DefinitionsException(f"field {name} uses undefined names {sorted(undefined)}")
+            defined.add(name)
+        if self.line is not None:
+            undefined = CompiledTemplate(self.line).fields - defined
+            if undefined:
+                raise DefinitionsException(f"line template uses undefined names {sorted(undefined)}")
+        if self.predicate is not None:
+            undefined = Expression(self.predicate).names - SUMMARY_NAMES
+            if undefined:
+                raise DefinitionsException(f"predicate uses undefined names {sorted(undefined)}; available are {sorted(SUMMARY_NAMES)}")
+
+
+def generate_chunks(spec: StressSpec, chunk_size: int=CHUNK_SIZE) -> Iterator[bytes]:
+    """Yields the input of a line-template stress test case in chunks of about chunk_size bytes."""
+    render = CompiledTemplate(spec.line).render
+    fields = [(name, Expression(source)) for name, source in spec.fields]
+    pending: List[bytes] = [spec.header.encode('utf8')]
+    pending_size = len(pending[0])
+    for i in range(spec.count):
+        values = {'i': i}
+        for name, expression in fields:
+            values[name] = expression.evaluate(values)
+        data = render(values).encode('utf8')
+        pending.append(data)
+        pending_size += len(data)
+        if pending_size >= chunk_size:
+            yield b''.join(pending)
+            pending, pending_size = [], 0
+    pending.append(spec.footer.encode('utf8'))
+    chunk = b''.join(pending)
+    if chunk:
+        yield chunk
+
+
+class OutputSummary(object):
+    """Summary of a program's output, updated as chunks of output are read.
+
+    Only the last 64 KiB of output are kept, so a longer last line is truncated."""
+
+    def __init__(self):
+        self.hasher = hashlib.sha256()
+        self.size = 0
+        self.newlines = 0
+        self.tail = b''
+
+    def update(self, chunk: bytes):
+        self.hasher.update(chunk)
+        self.size += len(chunk)
+        self.newlines += chunk.count(b'\n')
+        self.tail = (self.tail + chunk)[-_TAIL_SIZE:]
+
+    def values(self) -> Dict[str, Any]:
+        """Returns the summary values that a predicate may use. The last line excludes its line terminator."""
+        lines = self.newlines + (0 if self.tail.endswith(b'\n') or self.size == 0 else 1)
+        last_line = self.tail[:-1] if self.tail.endswith(b'\n') else self.tail
+        last_line = last_line.rsplit(b'\n', 1)[-1].decode('utf8', errors='replace')
+        return {
+            'sha256': self.hasher.hexdigest(),
+            'size': self.size,
+            'lines': lines,
+            'last_line': last_line,
+        }
+
+    def describe(self) -> str:
+        values = self.values()
+        return ''.join(f"{name}={repr(values[name]) if name == 'last_line' else values[name]}\n" for name in ('sha256', 'size', 'lines', 'last_line'))
+
+    def check(self, spec: StressSpec) -> Optional[str]:
+        """Returns None if the output meets the expectations of a stress test case, or a message otherwise."""
+        values = self.values()
+        if spec.sha256 is not None and values['sha256'] != spec.sha256.lower():
+            return "sha256"
+        if spec.predicate is not None:
+            try:
+                if not Expression(spec.predicate).evaluate(values):
+                    return "predicate"
+            except Exception as e:
+                return f"predicate failed: {type(e).__name__} {e}"
+        return None
+
+
+def load_stress_definitions(defs_file: str) -> List[Tuple[Dict[str, Any], StressSpec]]:
+    """Returns the stress test case definitions of a definitions file, each with its parsed spec."""
+    with open(defs_file, 'r') as ifile:
+        model = json.load(ifile)
+    q_dir = os.path.dirname(defs_file)
+    definitions = []
+    for case_model in model.get('stress', []):
+        if 'name' not in case_model:
+            raise DefinitionsException("stress test case must define 'name'")
+        definitions.append((case_model, StressSpec.parse(case_model, q_dir)))
+    return definitions
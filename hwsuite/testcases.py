@@ -1,21 +1,44 @@
 #!/usr/bin/env python3
 
 # testcases.py
+import abc
+import concurrent.futures
+import hashlib
 import json
 import math
 import os.path
+import random
+import re
+import string
 import sys
+import tempfile
+import threading
 import traceback
 from argparse import ArgumentParser
-from typing import NamedTuple, List, Dict, Any, Optional
+from typing import NamedTuple, List, Dict, Any, Optional, Iterator, Tuple, Sequence, Callable, FrozenSet, Set
 import logging
 
 import hwsuite
+from hwsuite.corpus import CorpusWriter, CORPUS_SUFFIX
+from hwsuite.expressions import Expression
+from hwsuite.oracle import Oracle
+import hwsuite.oracle
 
 _log = logging.getLogger(__name__)
 _DEFAULT_CASE_ID_PRECISION = 2
 _DEFAULT_DEFINITIONS_FILENAME = "test-cases.json"
 _DEFAULT_TEST_CASES_DIRNAME = "test-cases"
+MANIFEST_BASENAME = ".manifest.json"
+LAYOUTS = ('files', 'corpus')
+_MANIFEST_VERSION = 1
+# increment when a change to this module changes the files generated from the same definitions
+GENERATOR_VERSION = 2
+_ORACLE_BATCH_SIZE = 256
+_WRITE_BATCH_SIZE = 256
+_MAX_WRITER_THREADS = 4
+_RANDOM_CHECKPOINT_INTERVAL = 1024
+_definitions: Dict[str, Tuple[Tuple[int, int], 'ParameterSource']] = {}
+_definitions_lock = threading.Lock()
 
 
 def to_pathname(filename, disable_mkdir=False):
@@ -30,26 +53,328 @@ def _read_file_text(pathname) -> str:
         return ifile.read()
 
 
+class DefinitionsException(hwsuite.MessageworthyException):
+    pass
+
+
+_FORMATTER = string.Formatter()
+
+
+class CompiledTemplate(object):
+    """Template in str.format syntax that is parsed and checked once and rendered many times.
+
+    The names of the fields are known before anything is rendered, so parameters
+    can be validated up front. Rendering uses the bound format_map method of the
+    template, which formats in C without copying the parameters; in measurements
+    that was faster than assembling pieces of a pre-split template in Python."""
+
+    def __init__(self, template: str):
+        self.template = template
+        self.fields: FrozenSet[str] = frozenset(self._parse_fields(template))
+        self.render = template.format_map
+
+    @staticmethod
+    def _parse_fields(template: str) -> Set[str]:
+        fields = set()
+        try:
+            parsed = list(_FORMATTER.parse(template))
+        except ValueError as e:
+            raise DefinitionsException(f"malformed template {repr(template)}: {e}")
+        for _, field_name, format_spec, _ in parsed:
+            if field_name is None:
+                continue
+            root = field_name.split('.', 1)[0].split('[', 1)[0]
+            if not root or root.isdigit():
+                raise DefinitionsException(f"template fields must be named, but {repr(template)} has {{{field_name}}}")
+            fields.add(root)
+            if '{' in format_spec:
+                fields.update(CompiledTemplate._parse_fields(format_spec))
+        return fields
+
+
+class CaseGenerator(abc.ABC):
+    """Declared source of test case parameters that are produced on demand."""
+
+    @abc.abstractmethod
+    def param_names(self) -> FrozenSet[str]:
+        pass
+
+    @abc.abstractmethod
+    def count(self) -> int:
+        pass
+
+    @abc.abstractmethod
+    def generate(self) -> Iterator[Dict[str, Any]]:
+        pass
+
+    @abc.abstractmethod
+    def params_at(self, index: int) -> Dict[str, Any]:
+        """Returns the parameters of the case at an index, which are those the generate method yields at that index."""
+        pass
+
+
+class ProductGenerator(CaseGenerator):
+    """Generates every combination of parameter values, varying the last parameter fastest."""
+
+    def __init__(self, params: List[Tuple[str, Sequence[Any]]]):
+        self.params = params
+
+    def param_names(self) -> FrozenSet[str]:
+        return frozenset(name for name, _ in self.params)
+
+    def count(self) -> int:
+        total = 1
+        for _, values in self.params:
+            total *= len(values)
+        return total
+
+    def generate(self) -> Iterator[Dict[str, Any]]:
+        for index in range(self.count()):
+            yield self.params_at(index)
+
+    def params_at(self, index: int) -> Dict[str, Any]:
+        # combinations are computed from their index so that value sequences such as ranges are never expanded
+        case = {}
+        for name, values in reversed(self.params):
+            index, position = divmod(index, len(values))
+            case[name] = values[position]
+        return {name: case[name] for name, _ in self.params}
+
+
+class RandomGenerator(CaseGenerator):
+    """Generates a fixed number of cases whose parameters are sampled from a seeded random number generator.
+
+    The cases are a sequence drawn from one generator, so the case at an index is found
+    by replaying the draws before it. The state of the generator is kept at intervals as
+    cases are found, so that a replay starts from the nearest state kept before the index."""
+
+    def __init__(self, samplers: List[Tuple[str, Callable[[random.Random], Any]]], num_cases: int, seed: Any):
+        self.samplers = samplers
+        self.num_cases = num_cases
+        self.seed = seed
+        self._checkpoints: List[Any] = [random.Random(seed).getstate()]
+        self._checkpoints_lock = threading.Lock()
+
+    def param_names(self) -> FrozenSet[str]:
+        return frozenset(name for name, _ in self.samplers)
+
+    def count(self) -> int:
+        return self.num_cases
+
+    def _sample(self, rng: random.Random) -> Dict[str, Any]:
+        return {name: sample(rng) for name, sample in self.samplers}
+
+    def generate(self) -> Iterator[Dict[str, Any]]:
+        rng = random.Random(self.seed)
+        for _ in range(self.num_cases):
+            yield self._sample(rng)
+
+    def params_at(self, index: int) -> Dict[str, Any]:
+        if not 0 <= index < self.num_cases:
+            raise IndexError(f"case index {index} out of range")
+        with self._checkpoints_lock:
+            checkpoint = min(index // _RANDOM_CHECKPOINT_INTERVAL, len(self._checkpoints) - 1)
+            rng = random.Random()
+            rng.setstate(self._checkpoints[checkpoint])
+            position = checkpoint * _RANDOM_CHECKPOINT_INTERVAL
+            while position < index:
+                self._sample(rng)
+                position += 1
+                if position % _RANDOM_CHECKPOINT_INTERVAL == 0 and position // _RANDOM_CHECKPOINT_INTERVAL == len(self._checkpoints):
+                    self._checkpoints.append(rng.getstate())
+        return self._sample(rng)
+
+
+def _parse_values(name: str, spec: Any) -> Sequence[Any]:
+    if isinstance(spec, list):
+        return spec
+    if isinstance(spec, dict) and 'range' in spec:
+        return range(*spec['range'])
+    raise ValueError(f"values of parameter {repr(name)} must be a list or {{\"range\": [start, stop, step]}}")
+
+
+def _parse_sampler(name: str, spec: Any) -> Callable[[random.Random], Any]:
+    if isinstance(spec, list):
+        return lambda rng: rng.choice(spec)
+    if isinstance(spec, dict):
+        if 'randint' in spec:
+            low, high = spec['randint']
+            return lambda rng: rng.randint(low, high)
+        if 'uniform' in spec:
+            low, high = spec['uniform']
+            return lambda rng: rng.uniform(low, high)
+        if 'choice' in spec:
+            choices = spec['choice']
+            return lambda rng: rng.choice(choices)
+    raise ValueError(f"sampler of parameter {repr(name)} must be a list or one of randint, uniform, or choice")
+
+
+def parse_generator(model: Dict[str, Any]) -> CaseGenerator:
+    """Creates a generator from its definition.
+
+    A definition is either {"product": {NAME: VALUES, ...}}, where VALUES is a
+    list or {"range": [start, stop, step]} with an exclusive stop, as in Python,
+    or {"random": {NAME: SAMPLER, ...}, "count": N, "seed": S}, where SAMPLER is
+    a list to choose from or one of {"randint": [low, high]}, {"uniform": [low, high]},
+    and {"choice": [...]}."""
+    if 'product' in model:
+        return ProductGenerator([(name, _parse_values(name, spec)) for name, spec in model['product'].items()])
+    if 'random' in model:
+        if 'count' not in model:
+            raise ValueError("random generator must define 'count'")
+        samplers = [(name, _parse_sampler(name, spec)) for name, spec in model['random'].items()]
+        return RandomGenerator(samplers, int(model['count']), model.get('seed', 0))
+    raise ValueError(f"generator must define 'product' or 'random': {model}")
+
+
 class ParameterSource(NamedTuple):
-    
+    """Templates and parameters of the test cases defined in a definitions file.
+
+    Parameters are the explicit test cases followed by the cases of each generator.
+    Computed fields are expressions of the parameters, evaluated in order, so a
+    computed field may use the fields computed before it."""
+
     input_text_template: str
     expected_text_template: str
     test_cases: List[Dict[str, Any]]
     case_id_precision: Optional[int]
-    
+    generators: Tuple[CaseGenerator, ...] = ()
+    computed: Tuple[Tuple[str, Expression], ...] = ()
+    input_renderer: Optional[CompiledTemplate] = None
+    expected_renderer: Optional[CompiledTemplate] = None
+    oracle: Optional[Oracle] = None
+    layout: str = LAYOUTS[0]
+
     def __str__(self):
-        return f"ParameterSource<num_test_cases={len(self.test_cases)}>"
-    
+        return f"ParameterSource<num_test_cases={self.count()}>"
+
+    def count(self) -> int:
+        return len(self.test_cases) + sum(g.count() for g in self.generators)
+
+    def iter_params(self) -> Iterator[Dict[str, Any]]:
+        """Yields the parameters of each test case, without computed fields, producing generated ones lazily."""
+        yield from self.test_cases
+        for generator in self.generators:
+            yield from generator.generate()
+
+    def params_at(self, index: int) -> Dict[str, Any]:
+        """Returns the parameters of the test case at an index, without computed fields."""
+        if not 0 <= index < self.count():
+            raise IndexError(f"case index {index} out of range")
+        if index < len(self.test_cases):
+            return self.test_cases[index]
+        index -= len(self.test_cases)
+        for generator in self.generators:
+            if index < generator.count():
+                return generator.params_at(index)
+            index -= generator.count()
+        raise IndexError(f"case index {index} out of range")
+
+    def complete(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns the parameters of a test case with its computed fields added."""
+        if not self.computed:
+            return params
+        test_case = dict(params)
+        for name, expression in self.computed:
+            test_case[name] = expression.evaluate(test_case)
+        return test_case
+
     def precision(self):
         if self.case_id_precision is not None:
             return self.case_id_precision
-        return 1 + int(math.log10(len(self.test_cases)))
+        return 1 + int(math.log10(max(self.count(), 1)))
     
     def render_input_text(self, test_case):
-        return self.input_text_template.format(**test_case)
-    
+        if self.input_renderer is None:
+            return self.input_text_template.format(**test_case)
+        return self.input_renderer.render(test_case)
+
     def render_expected_text(self, test_case):
-        return self.expected_text_template.format(**test_case)
+        if self.expected_renderer is None:
+            return self.expected_text_template.format(**test_case)
+        return self.expected_renderer.render(test_case)
+
+    def case_id(self, index: int) -> str:
+        return ("{0:0" + str(self.precision()) + "d}").format(index + 1)
+
+    def input_text_at(self, index: int) -> str:
+        """Renders the input text of the test case at an index."""
+        return self.render_input_text(self.complete(self.params_at(index)))
+
+    def expected_text_at(self, index: int) -> str:
+        """Renders the expected text of the test case at an index, running the reference if there is one."""
+        test_case = self.complete(self.params_at(index))
+        if self.oracle is not None:
+            return self.oracle.expected_outputs([self.render_input_text(test_case)])[0]
+        return self.render_expected_text(test_case)
+
+    def _render_inputs(self, on_error: Optional[Callable[[int, Exception], None]]) -> Iterator[Tuple[int, Dict[str, Any], str]]:
+        for i, params in enumerate(self.iter_params()):
+            try:
+                test_case = self.complete(params)
+                input_text = self.render_input_text(test_case)
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(i, e)
+                continue
+            yield i, test_case, input_text
+
+    def render_all(self, on_error: Optional[Callable[[int, Exception], None]]=None) -> Iterator[Tuple[str, str, str]]:
+        """Yields the case ID, input text, and expected text of each test case, rendering each when it is requested.
+
+        If the definitions name a reference, expected texts are produced by the oracle
+        in batches. If on_error is not None, a test case that fails to render is
+        skipped after on_error is called with its index and the exception."""
+        case_id_format = "{0:0" + str(self.precision()) + "d}"
+        if self.oracle is not None:
+            complete = False
+            try:
+                for batch in hwsuite.oracle.batches(self._render_inputs(on_error), _ORACLE_BATCH_SIZE):
+                    batch_on_error = None if on_error is None else (lambda j, e: on_error(batch[j][0], e))
+                    outputs = self.oracle.expected_outputs([input_text for _, _, input_text in batch], batch_on_error)
+                    for (i, _, input_text), expected_text in zip(batch, outputs):
+                        if expected_text is not None:
+                            yield case_id_format.format(i + 1), input_text, expected_text
+                complete = True
+            finally:
+                self.oracle.save(prune=complete)
+            return
+        for i, test_case, input_text in self._render_inputs(on_error):
+            try:
+                expected_text = self.render_expected_text(test_case)
+            except Exception as e:
+                if on_error is None:
+                    raise
+                on_error(i, e)
+                continue
+            yield case_id_format.format(i + 1), input_text, expected_text
+
+    def validate(self):
+        """Checks that every test case defines the fields that the templates and computed fields use.
+
+        Explicit test cases are checked one by one; generated ones are checked by the
+        names of the parameters their generators define, so nothing is generated.
+        Raises DefinitionsException describing the first problem found."""
+        required = set()
+        for renderer in (self.input_renderer, self.expected_renderer):
+            if renderer is not None:
+                required.update(renderer.fields)
+
+        def check(names: FrozenSet[str], description: str):
+            available = set(names)
+            for name, expression in self.computed:
+                missing = expression.names - available
+                if missing:
+                    raise DefinitionsException(f"{description} lacks {sorted(missing)} used by computed field {repr(name)}")
+                available.add(name)
+            missing = required - available
+            if missing:
+                raise DefinitionsException(f"{description} lacks {sorted(missing)} used by templates")
+        for i, test_case in enumerate(self.test_cases):
+            check(frozenset(test_case.keys()), f"test case {i + 1}")
+        for i, generator in enumerate(self.generators):
+            check(generator.param_names(), f"generator {i + 1}")
     
     @staticmethod
     def load(model: Dict, root_dir: str) -> 'ParameterSource':
@@ -76,8 +401,14 @@ class ParameterSource(NamedTuple):
             if not os.path.isabs(path):
                 path = os.path.join(root_dir, path)
             expected_text_template = _read_file_text(path)
-        if expected_text_template is None:
-            raise ValueError("model must define 'expected' or 'expected_file'")
+        oracle = None
+        if 'reference' in model:
+            if expected_text_template is not None:
+                _log.warning("model defines both a reference and an expected template; using the reference")
+                expected_text_template = None
+            oracle = Oracle.from_model(model['reference'], root_dir)
+        elif expected_text_template is None:
+            raise ValueError("model must define 'expected', 'expected_file', or 'reference'")
         try:
             param_names = None
             for test_case in model['test_cases']:
@@ -88,33 +419,143 @@ class ParameterSource(NamedTuple):
                     param_names = param_names or model.get('param_names', None)
                     if param_names is None:
                         raise ValueError("'param_names' must be defined if array test cases are defined")
+                    if len(test_case) < len(param_names):
+                        raise DefinitionsException(f"test case {len(test_cases) + 1} has {len(test_case)} values but there are {len(param_names)} param_names")
                     for i in range(len(param_names)):
                         case_dict[param_names[i]] = test_case[i]
                     test_cases.append(case_dict)
         except KeyError:
-            _log.warning("test cases not defined")
-            pass
+            if 'generators' not in model:
+                _log.warning("test cases not defined")
+        generators = tuple(parse_generator(g) for g in model.get('generators', []))
+        computed = tuple((name, Expression(source)) for name, source in model.get('computed', {}).items())
         precision = model.get('case_id_precision', None)
-        return ParameterSource(input_text_template, expected_text_template, test_cases, precision)
+        layout = model.get('layout', LAYOUTS[0])
+        if layout not in LAYOUTS:
+            raise DefinitionsException(f"layout must be one of {LAYOUTS}, not {repr(layout)}")
+        expected_renderer = None if expected_text_template is None else CompiledTemplate(expected_text_template)
+        param_source = ParameterSource(input_text_template, expected_text_template, test_cases, precision, generators, computed,
+                                       CompiledTemplate(input_text_template), expected_renderer, oracle, layout)
+        param_source.validate()
+        return param_source
+
+
+def _template_files(model: Dict, root_dir: str) -> List[str]:
+    """Returns the pathnames of the template files that a definitions model uses."""
+    pathnames = []
+    for inline_key, file_key in [('input', 'input_file'), ('expected', 'expected_file')]:
+        if inline_key not in model and file_key in model:
+            pathnames.append(os.path.join(root_dir, model[file_key]))
+    if 'reference' in model:
+        pathnames += Oracle.from_model(model['reference'], root_dir).referenced_files()
+    return pathnames
+
+
+def write_text_if_changed(pathname: str, text: str, exists: bool=True) -> bool:
+    """Writes text to a file unless the file already contains it. Returns True if the file was written.
+
+    The file is replaced atomically, so readers see either the old or the new content.
+    A caller that knows the file does not exist may pass exists=False to skip reading it."""
+    if exists:
+        try:
+            with open(pathname, 'r') as ifile:
+                if ifile.read() == text:
+                    return False
+        except (FileNotFoundError, UnicodeDecodeError):
+            pass
+    fd, temp_file = tempfile.mkstemp(prefix=os.path.basename(pathname), dir=os.path.dirname(pathname))
+    try:
+        with os.fdopen(fd, 'w') as ofile:
+            ofile.write(text)
+        os.chmod(temp_file, 0o644)
+        os.replace(temp_file, pathname)
+    except BaseException:
+        os.unlink(temp_file)
+        raise
+    return True
+
+
+def read_manifest(dest_dir: str) -> Optional[List[str]]:
+    """Returns the filenames listed in the manifest of a generated test cases directory,
+    or None if the directory has no readable manifest."""
+    try:
+        with open(os.path.join(dest_dir, MANIFEST_BASENAME), 'r') as ifile:
+            model = json.load(ifile)
+        if model.get('version') == _MANIFEST_VERSION:
+            return list(model['files'])
+    except FileNotFoundError:
+        pass
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        _log.debug("ignoring unreadable manifest in %s: %s", dest_dir, e)
+    return None
+
+
+def _write_manifest(dest_dir: str, filenames: List[str]):
+    write_text_if_changed(os.path.join(dest_dir, MANIFEST_BASENAME), json.dumps({
+        'version': _MANIFEST_VERSION,
+        'files': sorted(filenames),
+    }, indent=2))
+
+
+def _prune(dest_dir: str, existing: FrozenSet[str], owned: Set[str], suffix: str) -> int:
+    """Removes files generated previously that are not generated any more. Returns the number of files removed.
+
+    Only files listed in the manifest are removed. A directory without a manifest may
+    hold hand-written test cases, so nothing is removed from it; files named like
+    generated ones that were not generated this time are reported instead."""
+    previous = read_manifest(dest_dir)
+    if previous is None:
+        pattern = re.compile(r'^\d+-(?:input|expected)' + re.escape(suffix) + '$')
+        unowned = sorted(f for f in existing if pattern.match(f) and f not in owned)
+        if unowned:
+            _log.warning("%s files in %s are named like generated files but are not generated by the definitions; "
+                         "they are kept but not run, so move hand-written cases elsewhere or remove stale ones: %s",
+                         len(unowned), dest_dir, unowned)
+        return 0
+    nremoved = 0
+    for filename in previous:
+        if filename not in owned and os.path.basename(filename) == filename:
+            try:
+                os.remove(os.path.join(dest_dir, filename))
+                nremoved += 1
+            except FileNotFoundError:
+                pass
+    if nremoved:
+        _log.debug("%s stale files removed from %s", nremoved, dest_dir)
+    return nremoved
+
 
+def write_cases(param_source: ParameterSource, dest_dir: str, suffix=".txt", onerror='continue') -> int:
+    """Writes the input and expected files of each test case. Returns the number of test cases written.
 
-def write_cases(param_source: ParameterSource, dest_dir: str, suffix=".txt", onerror='continue'):
+    Files that already have the rendered content are left untouched, so their
+    modification times are preserved. The destination directory is listed once,
+    so files that do not exist yet are written without being read first, and
+    rendered cases are written in batches by a few threads while the next
+    batch is rendered.
+
+    The files written are listed in a manifest in the destination directory,
+    and files listed in the previous manifest that were not written again are
+    removed, so that no stale test cases remain when definitions shrink or the
+    case ID precision changes."""
+    os.makedirs(dest_dir, exist_ok=True)
+    existing = frozenset(os.listdir(dest_dir))
     nsuccesses = 0
-    for i, test_case in enumerate(param_source.test_cases):
+    owned: Set[str] = set()
+
+    def on_error(_, e: Exception):
+        if onerror == 'raise':
+            raise e
+        _log.warning("failed to render case for %s: %s, %s", dest_dir, type(e), e)
+
+    def write_case(case: Tuple[str, str, str]) -> List[str]:
+        case_id, rendered_input, rendered_expected = case
         try:
-            rendered_input = param_source.render_input_text(test_case)
-            case_id = ("{0:0" + str(param_source.precision()) + "d}").format(i + 1)
-            input_filename = f"{case_id}-input{suffix}"
-            input_pathname = os.path.join(dest_dir, input_filename)
-            os.makedirs(os.path.dirname(input_pathname), exist_ok=True)
-            with open(input_pathname, 'w') as ofile:
-                ofile.write(rendered_input)
-            expected_filename = f"{case_id}-expected{suffix}"
-            expected_pathname = os.path.join(dest_dir, expected_filename)
-            os.makedirs(os.path.dirname(expected_pathname), exist_ok=True)
-            with open(expected_pathname, 'w') as ofile:
-                ofile.write(param_source.render_expected_text(test_case))
-            nsuccesses += 1
+            written = []
+            for filename, text in [(f"{case_id}-input{suffix}", rendered_input), (f"{case_id}-expected{suffix}", rendered_expected)]:
+                write_text_if_changed(os.path.join(dest_dir, filename), text, filename in existing)
+                written.append(filename)
+            return written
         except Exception:
             if onerror == 'raise':
                 raise
@@ -123,8 +564,73 @@ def write_cases(param_source: ParameterSource, dest_dir: str, suffix=".txt", one
             _log.debug("writing cases: exception traceback:\n%s", "".join(info).strip())
             e = exc_info[1]
             _log.warning("failed to write cases to %s: %s, %s", dest_dir, type(e), e)
-            continue
-    _log.debug("%s of %s test cases generated in %s", nsuccesses, len(param_source.test_cases), dest_dir) 
+            return []
+
+    def collect(futures: List[concurrent.futures.Future]) -> int:
+        written = [future.result() for future in futures]
+        for filenames in written:
+            owned.update(filenames)
+        return sum(1 for filenames in written if filenames)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=_MAX_WRITER_THREADS) as executor:
+        pending: List[concurrent.futures.Future] = []
+        for batch in hwsuite.oracle.batches(param_source.render_all(on_error), _WRITE_BATCH_SIZE):
+            nsuccesses += collect(pending)
+            pending = [executor.submit(write_case, case) for case in batch]
+        nsuccesses += collect(pending)
+    _prune(dest_dir, existing, owned, suffix)
+    _write_manifest(dest_dir, list(owned))
+    _log.debug("%s of %s test cases generated in %s", nsuccesses, param_source.count(), dest_dir)
+    return nsuccesses
+
+
+def write_corpus(param_source: ParameterSource, corpus_file: str, onerror='continue') -> int:
+    """Writes every test case into a corpus file. Returns the number of test cases written."""
+    def on_error(_, e: Exception):
+        if onerror == 'raise':
+            raise e
+        _log.warning("failed to render case for %s: %s, %s", corpus_file, type(e), e)
+    nsuccesses = 0
+    with CorpusWriter(corpus_file) as writer:
+        for case_id, rendered_input, rendered_expected in param_source.render_all(on_error):
+            writer.add(case_id, rendered_input, rendered_expected)
+            nsuccesses += 1
+    _log.debug("%s of %s test cases packed in %s", nsuccesses, param_source.count(), corpus_file)
+    return nsuccesses
+
+
+def output_pathname(root_dir: str, dest_dirname: str, layout: str) -> str:
+    """Returns the pathname of the directory or corpus file that generated test cases are written to."""
+    dest = os.path.join(root_dir, dest_dirname)
+    return dest + CORPUS_SUFFIX if layout == 'corpus' else dest
+
+
+def _remove_other_layouts(root_dir: str, dest_dirname: str, layout: str):
+    dest_dir = os.path.join(root_dir, dest_dirname)
+    if layout != 'corpus':
+        try:
+            os.remove(dest_dir + CORPUS_SUFFIX)
+            _log.debug("removed corpus %s replaced by files", dest_dir + CORPUS_SUFFIX)
+        except FileNotFoundError:
+            pass
+    elif read_manifest(dest_dir) is not None:
+        _prune(dest_dir, frozenset(), set(), ".txt")
+        os.remove(os.path.join(dest_dir, MANIFEST_BASENAME))
+        try:
+            os.rmdir(dest_dir)
+        except OSError:
+            pass
+
+
+def write_output(param_source: ParameterSource, root_dir: str, dest_dirname: str, onerror='continue') -> int:
+    """Writes test cases in the layout the definitions specify and removes test cases generated in the other layout.
+    Returns the number of test cases written."""
+    pathname = output_pathname(root_dir, dest_dirname, param_source.layout)
+    if param_source.layout == 'corpus':
+        nsuccesses = write_corpus(param_source, pathname, onerror)
+    else:
+        nsuccesses = write_cases(param_source, pathname, onerror=onerror)
+    _remove_other_layouts(root_dir, dest_dirname, param_source.layout)
+    return nsuccesses
 
 
 def is_skel_file(pathname, proj_dir):
@@ -144,33 +650,206 @@ def find_all_definitions_files(top_dir: str, filename: str) -> List[str]:
     return defs_files
 
 
-def produce_from_defs(defs_file: str, dest_dirname: str = 'test-cases', onerror='continue') -> ParameterSource:
+def load_definitions(defs_file: str) -> ParameterSource:
     with open(defs_file, 'r') as ifile:
         model = json.load(ifile)
-    param_source = ParameterSource.load(model, os.path.dirname(defs_file))
-    dest_dir = os.path.join(os.path.dirname(defs_file), dest_dirname)
-    write_cases(param_source, dest_dir, onerror=onerror)
+    return ParameterSource.load(model, os.path.dirname(defs_file))
+
+
+def open_definitions(defs_file: str) -> ParameterSource:
+    """Returns the parameter source of a definitions file, shared by all callers in this process
+    and loaded again if the file has changed."""
+    st = os.stat(defs_file)
+    key = st.st_mtime_ns, st.st_size
+    with _definitions_lock:
+        cached = _definitions.get(defs_file, None)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+    param_source = load_definitions(defs_file)
+    with _definitions_lock:
+        _definitions[defs_file] = key, param_source
+    return param_source
+
+
+_RENDERING_KEYS = frozenset(['input', 'input_file', 'expected', 'expected_file', 'reference', 'test_cases', 'generators'])
+
+
+def defines_rendered_cases(model: Dict[str, Any]) -> bool:
+    """Returns False for definitions that only list stress test cases, which are not rendered.
+
+    Definitions that list no stress test cases are assumed to define rendered ones,
+    so that loading them reports what is missing, such as a misspelled 'input'."""
+    return 'stress' not in model or not _RENDERING_KEYS.isdisjoint(model.keys())
+
+
+def produce_from_defs(defs_file: str, dest_dirname: str = 'test-cases', onerror='continue') -> Optional[ParameterSource]:
+    with open(defs_file, 'r') as ifile:
+        if not defines_rendered_cases(json.load(ifile)):
+            return None
+    param_source = load_definitions(defs_file)
+    write_output(param_source, os.path.dirname(defs_file), dest_dirname, onerror=onerror)
     return param_source
 
 
-def produce_files(subdirs: Optional[List[str]], definitions_filename: str, dest_dirname: str, proj_dir: str=None):
+def _generation_record_pathname(defs_file: str, dest_dirname: str) -> str:
+    return os.path.join(os.path.dirname(defs_file), hwsuite.CACHE_DIR_BASENAME, f"generated-{dest_dirname}.json")
+
+
+def _stat_key(pathname: str) -> Optional[List[int]]:
+    try:
+        st = os.stat(pathname)
+    except FileNotFoundError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def _fingerprint(defs_file: str, template_files: List[str], dest_dirname: str) -> str:
+    h = hashlib.sha256(f"{GENERATOR_VERSION}\n{dest_dirname}\n".encode('utf8'))
+    for pathname in [defs_file] + template_files:
+        with open(pathname, 'rb') as ifile:
+            data = ifile.read()
+        h.update(f"{os.path.basename(pathname)}\n{len(data)}\n".encode('utf8'))
+        h.update(data)
+    return h.hexdigest()
+
+
+class GenerationRecord(NamedTuple):
+    """Record of the last generation of test case files from a definitions file.
+
+    Stats are modification times and sizes of the definitions file, the template
+    files, and the destination directory, keyed by pathname relative to the
+    definitions file's directory. As long as they are unchanged, generation is
+    skipped without reading anything. The fingerprint is a digest of the inputs
+    to generation, which lets generation be skipped when a file is touched but
+    not changed."""
+
+    version: int
+    fingerprint: str
+    stats: Dict[str, Optional[List[int]]]
+
+    def is_current(self, root_dir: str) -> bool:
+        if self.version != GENERATOR_VERSION:
+            return False
+        for relpath, stat_key in self.stats.items():
+            if _stat_key(os.path.join(root_dir, relpath)) != stat_key:
+                return False
+        return True
+
+    @staticmethod
+    def create(fingerprint: str, root_dir: str, pathnames: List[str]) -> 'GenerationRecord':
+        stats = {os.path.relpath(p, root_dir): _stat_key(p) for p in pathnames}
+        return GenerationRecord(GENERATOR_VERSION, fingerprint, stats)
+
+    @staticmethod
+    def load(pathname: str) -> Optional['GenerationRecord']:
+        try:
+            with open(pathname, 'r') as ifile:
+                model = json.load(ifile)
+            return GenerationRecord(model['version'], model['fingerprint'], model['stats'])
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError) as e:
+            _log.debug("ignoring unreadable generation record %s: %s", pathname, e)
+            return None
+
+    def save(self, pathname: str):
+        try:
+            os.makedirs(os.path.dirname(pathname), exist_ok=True)
+            fd, temp_file = tempfile.mkstemp(prefix=os.path.basename(pathname), dir=os.path.dirname(pathname))
+            with os.fdopen(fd, 'w') as ofile:
+                json.dump(self._asdict(), ofile)
+            os.replace(temp_file, pathname)
+        except OSError as e:
+            _log.debug("failed to save generation record %s: %s", pathname, e)
+
+
+def produce_if_changed(defs_file: str, dest_dirname: str = _DEFAULT_TEST_CASES_DIRNAME, onerror='continue') -> bool:
+    """Produces test case files from a definitions file unless they are up to date. Returns True if files were produced.
+
+    Generation is skipped if the definitions file, the templates it references,
+    the generator version, and the destination directory or corpus are unchanged since
+    the last generation recorded in the cache directory beside the definitions file."""
+    root_dir = os.path.dirname(defs_file)
+    dest_dir = os.path.join(root_dir, dest_dirname)
+    record_file = _generation_record_pathname(defs_file, dest_dirname)
+    record = GenerationRecord.load(record_file)
+    if record is not None and record.is_current(root_dir):
+        _log.debug("test cases in %s are up to date", dest_dir)
+        return False
+    with open(defs_file, 'r') as ifile:
+        model = json.load(ifile)
+    if not defines_rendered_cases(model):
+        _log.debug("%s defines no test cases to render", defs_file)
+        return False
+    template_files = _template_files(model, root_dir)
+    fingerprint = _fingerprint(defs_file, template_files, dest_dirname)
+    output = output_pathname(root_dir, dest_dirname, model.get('layout', LAYOUTS[0]))
+    if record is not None and record.fingerprint == fingerprint and record.stats.get(os.path.relpath(output, root_dir)) == _stat_key(output):
+        _log.debug("definitions for %s were touched but not changed", dest_dir)
+        produced = False
+    else:
+        param_source = ParameterSource.load(model, root_dir)
+        nsuccesses = write_output(param_source, root_dir, dest_dirname, onerror=onerror)
+        if nsuccesses < param_source.count():
+            return True
+        produced = True
+    GenerationRecord.create(fingerprint, root_dir, [defs_file] + template_files + [output]).save(record_file)
+    return produced
+
+
+def _produce(defs_file: str, dest_dirname: str, force: bool, onerror: str):
+    if force:
+        produce_from_defs(defs_file, dest_dirname, onerror=onerror)
+    else:
+        produce_if_changed(defs_file, dest_dirname, onerror=onerror)
+
+
+def produce_all(defs_files: Sequence[str], dest_dirname: str=_DEFAULT_TEST_CASES_DIRNAME, force: bool=False,
+                onerror: str='continue', max_workers: Optional[int]=None) -> int:
+    """Produces test case files from several definitions files at once. Returns the number of definitions files processed without error.
+
+    Each definitions file is rendered in its own process, because rendering is
+    bound by the interpreter rather than by the disk. If onerror is 'raise', the
+    first failure in the order of defs_files is raised once all files are done;
+    otherwise failures are logged."""
+    max_workers = min(max_workers or os.cpu_count() or 1, len(defs_files))
+    if max_workers <= 1:
+        outcomes = []
+        for defs_file in defs_files:
+            try:
+                _produce(defs_file, dest_dirname, force, onerror)
+                outcomes.append(None)
+            except Exception as e:
+                outcomes.append(e)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_produce, defs_file, dest_dirname, force, onerror) for defs_file in defs_files]
+            concurrent.futures.wait(futures)
+        outcomes = [future.exception() for future in futures]
+    if onerror == 'raise':
+        for e in outcomes:
+            if e is not None:
+                raise e
+    nsuccesses = 0
+    for defs_file, e in zip(defs_files, outcomes):
+        if e is None:
+            nsuccesses += 1
+        else:
+            info = traceback.format_exception(type(e), e, e.__traceback__)
+            _log.debug("exception info:\n%s", "".join(info).strip())
+            _log.warning("failure to load model and write cases from %s: %s, %s", defs_file, type(e), e)
+    return nsuccesses
+
+
+def produce_files(subdirs: Optional[List[str]], definitions_filename: str, dest_dirname: str, proj_dir: str=None,
+                  force: bool=False, max_workers: Optional[int]=None):
     proj_dir = os.path.abspath(proj_dir or hwsuite.find_proj_root())
     if not subdirs:
         defs_files = find_all_definitions_files(proj_dir, definitions_filename)
     else:
         defs_files = map(lambda d: os.path.join(d, definitions_filename), subdirs)
         defs_files = list(filter(os.path.exists, defs_files))
-    nsuccesses = 0
-    for defs_file in defs_files:
-        try:
-            produce_from_defs(defs_file, dest_dirname)
-            nsuccesses += 1
-        except Exception:
-            exc_info = sys.exc_info()
-            info = traceback.format_exception(*exc_info)
-            _log.debug("exception info:\n%s", "".join(info).strip())
-            e = exc_info[1]
-            _log.warning("failure to load model and write cases from %s: %s, %s", defs_file, type(e), e)
+    nsuccesses = produce_all(defs_files, dest_dirname, force, max_workers=max_workers)
     _log.debug("test cases generated from %s of %s definitions files", nsuccesses, len(defs_files))
     if nsuccesses == 0:
         _log.error("test case generation did not succeed for any of %s definitions files", len(defs_files))
@@ -182,11 +861,13 @@ def main():
     parser.add_argument("subdirs", nargs='*', metavar="DIR", help="subdirectory containing 'test-cases.json` file")
     parser.add_argument("--definitions-filename", metavar="BASENAME", default=_DEFAULT_DEFINITIONS_FILENAME, help="test cases definitions filename to search for, if not 'test-cases.json'")
     parser.add_argument("--dest-dirname", default="test-cases", metavar="BASENAME", help="destination directory name (relative to definitions file location)")
+    parser.add_argument("--force", action='store_true', help="generate files even if definitions are unchanged since they were last generated")
+    parser.add_argument("-j", "--jobs", type=int, metavar="N", help="number of definitions files to process at once; default is cpu count")
     hwsuite.add_logging_options(parser)
     args = parser.parse_args()
     hwsuite.configure_logging(args)
     try:
-        nsuccesses = produce_files(args.subdirs, args.definitions_filename, args.dest_dirname)
+        nsuccesses = produce_files(args.subdirs, args.definitions_filename, args.dest_dirname, force=args.force, max_workers=args.jobs)
         return 0 if nsuccesses > 0 else 2
     except hwsuite.MessageworthyException as ex:
         print(f"{__name__}: {type(ex).__name__}: {ex}", file=sys.stderr)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import io
+import json
+import os
+import tempfile
+from unittest import TestCase
+from hwsuite import bench
+from hwsuite.bench import BenchConfig
+import hwsuite.tests
+
+hwsuite.tests.configure_logging()
+
+
+class ModuleTest(TestCase):
+
+    def test_percentile(self):
+        values = [0.5, 0.1, 0.4, 0.2, 0.3]
+        self.assertEqual(0.3, bench.percentile(values, 50))
+        self.assertEqual(0.5, bench.percentile(values, 95))
+        self.assertEqual(0.1, bench.percentile(values, 0))
+        self.assertEqual(0.0, bench.percentile([], 50))
+
+    def test_generate_project(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            q_dirs = bench.generate_project(tempdir, 4, 3, interactive_ratio=0.5)
+            self.assertListEqual(['q1', 'q2', 'q3', 'q4'], list(map(os.path.basename, q_dirs)))
+            for q_dir in q_dirs[:2]:
+                with open(os.path.join(q_dir, 'test-cases.json'), 'r') as ifile:
+                    model = json.load(ifile)
+                self.assertEqual(3, len(model['test_cases']))
+            for q_dir in q_dirs[2:]:
+                self.assertFalse(os.path.exists(os.path.join(q_dir, 'test-cases.json')))
+                cases_dir = os.path.join(q_dir, 'test-cases')
+                self.assertSetEqual({'1-args.txt', '1-expected.txt', '2-args.txt', '2-expected.txt', '3-args.txt', '3-expected.txt'},
+                                    set(os.listdir(cases_dir)))
+            bench.generate_project(tempdir, 4, 3, interactive_ratio=0.5)
+            with open(os.path.join(tempdir, 'CMakeLists.txt'), 'r') as ifile:
+                self.assertEqual(4, ifile.read().count('add_subdirectory'), "expect regeneration does not add subdirectories again")
+
+    def test_compare_to_baseline(self):
+        results = {'a': {'cases_per_second': 20.0, 'p50_ms': 5.0}}
+        baseline = {'a': {'cases_per_second': 10.0, 'p50_ms': 10.0}}
+        buffer = io.StringIO()
+        bench.compare_to_baseline(results, baseline, ('cases_per_second', 'p50_ms'), ofile=buffer)
+        self.assertEqual("a: cases_per_second=20.0 (+100.0%)  p50_ms=5.0 (-50.0%)\n", buffer.getvalue())
+
+    def test_baseline_roundtrip(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            pathname = os.path.join(tempdir, 'baseline.json')
+            self.assertDictEqual({}, bench.load_baseline(pathname))
+            results = {'threads=1,pause=0.1,backend=never': {'cases_per_second': 3.5}}
+            bench.store_baseline(results, pathname)
+            self.assertDictEqual(results, bench.load_baseline(pathname))
+
+    def test_run_config(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            proj_dir = os.path.join(tempdir, 'bench')
+            bench.generate_project(proj_dir, 1, 3, interactive_ratio=0.0)
+            result = bench.run_config(proj_dir, BenchConfig(2, 0.05, 'never'))
+        self.assertEqual(0, result.exit_code)
+        self.assertEqual(3, result.num_cases)
+        summary = result.summary()
+        self.assertGreater(summary['cases_per_second'], 0)
+        self.assertLessEqual(summary['p50_ms'], summary['p95_ms'])
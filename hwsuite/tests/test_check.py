@@ -1,8 +1,13 @@
 #!/usr/bin/env python3
 import argparse
+import io
+import json
 import logging
 import os
+import sys
 import tempfile
+import threading
+import time
 from pathlib import Path
 from typing import Sequence, List, Dict
 from unittest import TestCase
@@ -10,9 +15,17 @@ from hwsuite import check
 import hwsuite.init
 import hwsuite.question
 import hwsuite.build
+import hwsuite.corpus
+import hwsuite.testcases
 import hwsuite.tests
 from hwsuite.check import StuffConfig, Throttle, ConcurrencyManager, TestCaseRunner, TestCaseOutcome, CppChecker
 from hwsuite.check import TestCaseRunnerFactory, TestCasesConfig, ValgrindConfig, Result, ScreenRunnable
+from hwsuite.check import QuestionSettings, OutcomeSpool, SpooledText
+from hwsuite.history import RunHistory, TimeoutPolicy
+from hwsuite.resources import UsageLimits
+from hwsuite.sandbox import SandboxPool
+from hwsuite.shard import Shard
+from hwsuite.tracing import Tracer
 
 hwsuite.tests.configure_logging()
 
@@ -46,6 +59,147 @@ class ModuleTest(TestCase):
             self.assertIsNone(test_case.env)
             self.assertTupleEqual(tuple(), test_case.args)
 
+    def test_detect_test_case_files_indexed(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            cases_dir = os.path.join(q_dir, 'test-cases')
+            os.makedirs(cases_dir)
+            hwsuite.tests.write_text_file("1\n", os.path.join(cases_dir, '01-input.txt'))
+            hwsuite.tests.write_text_file("one\n", os.path.join(cases_dir, '01-expected.txt'))
+            hwsuite.tests.write_text_file("-v\n", os.path.join(cases_dir, '01-args.txt'))
+            hwsuite.tests.write_text_file("FOO=bar\n", os.path.join(cases_dir, '01-env.txt'))
+            scanned = check.detect_test_case_files(q_dir, use_index=False)
+            indexed = check.detect_test_case_files(q_dir)
+            self.assertListEqual(scanned, indexed)
+            self.assertTrue(os.path.isfile(check._discovery_index_pathname(q_dir)))
+            self.assertListEqual(scanned, check.detect_test_case_files(q_dir))
+            # new files change the directory modification time
+            hwsuite.tests.write_text_file("two\n", os.path.join(cases_dir, '02-expected.txt'))
+            self.assertEqual(2, len(check.detect_test_case_files(q_dir)))
+            # edits to parsed files are detected by their own modification times
+            args_file = os.path.join(cases_dir, '01-args.txt')
+            hwsuite.tests.write_text_file("-q\n", args_file)
+            st = os.stat(args_file)
+            os.utime(args_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+            test_cases = check.detect_test_case_files(q_dir)
+            self.assertTupleEqual(('-q',), test_cases[0].args)
+            self.assertDictEqual({'FOO': 'bar'}, test_cases[0].env_dict())
+
+    def test_detect_test_case_files_ignores_corrupt_index(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            hwsuite.tests.write_text_file("one\n", os.path.join(q_dir, 'expected.txt'))
+            index_file = check._discovery_index_pathname(q_dir)
+            os.makedirs(os.path.dirname(index_file))
+            hwsuite.tests.write_text_file("{", index_file)
+            self.assertEqual(1, len(check.detect_test_case_files(q_dir)))
+
+    def test_store_discovery_index_failure(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            hwsuite.tests.write_text_file("one\n", os.path.join(q_dir, 'expected.txt'))
+            index_file = check._discovery_index_pathname(q_dir)
+            os.makedirs(os.path.join(index_file, 'occupied'))
+            check._store_discovery_index(check.DiscoveryIndex.build(q_dir), q_dir)
+            self.assertListEqual([os.path.basename(index_file)], os.listdir(os.path.dirname(index_file)))
+
+    def test_detect_test_case_files_fixtures(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            cases_dir = os.path.join(q_dir, 'test-cases')
+            for d in ('fixtures', 'test-cases/01-fixtures', 'test-cases/fixtures-output-b', 'extra-fixtures', 'cmake-build-tests'):
+                os.makedirs(os.path.join(q_dir, d))
+            hwsuite.tests.write_text_file("decoy\n", os.path.join(q_dir, 'test-cases/01-fixtures/expected.txt'))
+            for basename in ('01-expected.txt', '02-expected.txt', 'expected-output-b.txt'):
+                hwsuite.tests.write_text_file("x\n", os.path.join(cases_dir, basename))
+            hwsuite.tests.write_text_file("y\n", os.path.join(q_dir, 'extra-fixtures', '03-expected.txt'))
+            hwsuite.tests.write_text_file("z\n", os.path.join(q_dir, 'cmake-build-tests', '04-expected.txt'))
+            for use_index in (False, True, True):
+                test_cases = check.detect_test_case_files(q_dir, use_index)
+                self.assertListEqual([
+                    ('fixtures',),
+                    ('fixtures',),
+                    ('fixtures', 'test-cases/01-fixtures'),
+                    ('fixtures',),
+                    ('fixtures', 'test-cases/fixtures-output-b'),
+                ], [tuple(os.path.relpath(d, q_dir) for d in tc.fixtures) for tc in test_cases])
+
+    def test_detect_test_case_files_manifest(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            cases_dir = os.path.join(q_dir, 'test-cases')
+            os.makedirs(cases_dir)
+            hwsuite.tests.write_text_file("stale\n", os.path.join(cases_dir, '02-expected.txt'))
+            hwsuite.tests.write_text_file("one\n", os.path.join(cases_dir, '1-expected.txt'))
+            hwsuite.tests.write_text_file(json.dumps({'version': 1, 'files': ['1-expected.txt']}),
+                                          os.path.join(cases_dir, hwsuite.testcases.MANIFEST_BASENAME))
+            for use_index in (False, True, True):
+                test_cases = check.detect_test_case_files(q_dir, use_index)
+                self.assertListEqual(['1-expected.txt'], [os.path.basename(tc.expected_file) for tc in test_cases])
+
+    def test_detect_test_case_files_packed(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            os.makedirs(os.path.join(q_dir, '02-fixtures'))
+            with hwsuite.corpus.CorpusWriter(os.path.join(q_dir, 'test-cases.corpus')) as writer:
+                writer.add('01', "1\n", "one\n", {'FOO': 'bar'}, ['-v'], 1)
+                writer.add('02', None, "two\n")
+            hwsuite.tests.write_text_file("three\n", os.path.join(q_dir, 'expected.txt'))
+            for use_index in (False, True, True):
+                test_cases = check.detect_test_case_files(q_dir, use_index)
+                self.assertListEqual(['', '01', '02'], [tc.label() for tc in test_cases])
+                packed = test_cases[1]
+                self.assertTrue(packed.has_input())
+                self.assertEqual("one\n", packed.read_expected_text())
+                self.assertEqual(['1\n'], list(packed.input_lines()))
+                self.assertDictEqual({'FOO': 'bar'}, packed.env_dict())
+                self.assertTupleEqual(('-v',), packed.args)
+                self.assertEqual(1, packed.exit_code)
+                self.assertFalse(test_cases[2].has_input())
+                self.assertTupleEqual((os.path.join(q_dir, '02-fixtures'),), test_cases[2].fixtures)
+
+    def test_create_virtual_test_cases(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            defs_file = hwsuite.tests.write_text_file(json.dumps({
+                'input': "{a}\n",
+                'expected': "{a}{a}\n",
+                'param_names': ['a'],
+                'test_cases': [['x'], ['y']],
+            }), os.path.join(q_dir, 'test-cases.json'))
+            os.makedirs(os.path.join(q_dir, 'test-cases', '2-fixtures'))
+            test_cases = check.create_virtual_test_cases(defs_file)
+            self.assertListEqual(['1', '2'], [tc.label() for tc in test_cases])
+            self.assertIsNone(test_cases[1].input_text)
+            self.assertEqual("y\n", test_cases[1].embedded_input_text())
+            self.assertEqual("yy\n", test_cases[1].read_expected_text())
+            self.assertListEqual(["x\n"], list(test_cases[0].input_lines()))
+            self.assertTupleEqual((), test_cases[0].fixtures)
+            self.assertTupleEqual((os.path.join(q_dir, 'test-cases', '2-fixtures'),), test_cases[1].fixtures)
+            self.assertListEqual(['2-fixtures'], os.listdir(os.path.join(q_dir, 'test-cases')))
+            self.assertTrue(check.TestCasesConfig.create(filter_pattern='2').matches(test_cases[1]))
+            self.assertFalse(check.TestCasesConfig.create(filter_pattern='2').matches(test_cases[0]))
+
+    def test_select_shard(self):
+        selections = []
+        for q_name in ('q1', 'q2'):
+            cases = [check.TestCase.create(None, f"/proj/{q_name}/test-cases/{i}-expected.txt") for i in range(1, 6)]
+            selections.append((f"/proj/{q_name}/main.cpp", cases))
+        shards = [check.select_shard(selections, Shard(index, 3)) for index in (1, 2, 3)]
+        all_selected = []
+        for selected in shards:
+            self.assertListEqual([cpp_file for cpp_file, _ in selections], [cpp_file for cpp_file, _ in selected])
+            all_selected += [tc for _, test_cases in selected for tc in test_cases]
+        self.assertEqual(10, len(all_selected))
+        self.assertEqual(10, len(set(all_selected)))
+        moved = [(f"/elsewhere/{os.path.basename(os.path.dirname(cpp))}/main.cpp", [tc._replace(expected_file=tc.expected_file.replace('/proj/', '/elsewhere/')) for tc in cases])
+                 for cpp, cases in selections]
+        moved_shard = check.select_shard(moved, Shard(2, 3))
+        self.assertListEqual([len(cases) for _, cases in shards[1]], [len(cases) for _, cases in moved_shard])
+
+    def test_select_shard_runtime(self):
+        cases = [check.TestCase.create(None, f"/proj/q1/{i}-expected.txt") for i in range(1, 5)]
+        cases.append(check.TestCase.create(None, "/proj/q1/more/1-expected.txt"))
+        history = RunHistory()
+        for test_case, seconds in zip(cases, (9.0, 1.0, 4.0, 4.0, 0.0)):
+            history.record_runtime('q1', check.case_identifier('/proj/q1', test_case), seconds)
+        selected = check.select_shard([('/proj/q1/main.cpp', cases)], Shard(1, 2), 'runtime', history)
+        self.assertEqual(cases[0], selected[0][1][0])
+        self.assertEqual(9.0, sum(history.mean_runtime('q1', check.case_identifier('/proj/q1', tc)) for tc in selected[0][1]))
+
     def test__read_env(self):
         with tempfile.TemporaryDirectory() as tempdir:
             env_file = os.path.join(tempdir, 'env.txt')
@@ -115,6 +269,86 @@ Please enter a line of text:
                 self.assertTupleEqual((inbase, envbase, argsbase), (filenames.input, filenames.env, filenames.args))
 
 
+class QuestionSettingsTest(TestCase):
+
+    def test_from_model(self):
+        settings = QuestionSettings.from_model({
+            'limits': {'max_cpu_ms': 500},
+            'case_limits': {'03': {'max_rss_kb': 1024}, '04': {'max_cpu_ms': 900}},
+        })
+        self.assertEqual(UsageLimits(500, None), settings.limits_for(check.TestCase.create(None, '/q1/01-expected.txt')))
+        self.assertEqual(UsageLimits(500, 1024), settings.limits_for(check.TestCase.create(None, '/q1/03-expected.txt')))
+        self.assertEqual(UsageLimits(900, None), settings.limits_for(check.TestCase.create(None, '/q1/04-expected.txt')))
+
+    def test_load_missing(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            settings = QuestionSettings.load(q_dir)
+        self.assertEqual(QuestionSettings.default(), settings)
+
+    def test_processing_timeout(self):
+        test_case = check.TestCase.create(None, '/q1/01-expected.txt')
+        history = RunHistory()
+        policy = TimeoutPolicy(multiplier=2.0, floor=0.1, ceiling=10.0, min_samples=2)
+        runner = TestCaseRunner('/q1/cmake-build/q1', Throttle.default(), StuffConfig.default(), history=history, timeout_policy=policy)
+        self.assertEqual(Throttle.default().processing_timeout, runner.processing_timeout_for(test_case))
+        history.record('q1', '01', 0.25)
+        history.record('q1', '01', 0.75)
+        self.assertEqual(1.5, runner.processing_timeout_for(test_case))
+        runner.settings = QuestionSettings.from_model({'processing_timeout': 12})
+        self.assertEqual(12, runner.processing_timeout_for(test_case))
+
+    def test_input_mode(self):
+        runner = TestCaseRunner('/q1/cmake-build/q1', Throttle.default(), StuffConfig.default())
+        self.assertEqual('screen', runner.input_mode_for())
+        runner.input_mode = 'stdin'
+        self.assertEqual('stdin', runner.input_mode_for())
+        runner.input_mode = 'screen'
+        runner.settings = QuestionSettings.from_model({'input_mode': 'stdin'})
+        self.assertEqual('stdin', runner.input_mode_for())
+        with self.assertRaises(hwsuite.testcases.DefinitionsException):
+            QuestionSettings.from_model({'input_mode': 'keyboard'})
+        with tempfile.TemporaryDirectory() as q_dir:
+            defs_file = os.path.join(q_dir, 'test-cases.json')
+            hwsuite.tests.write_text_file(json.dumps({'input_mode': 'keyboard'}), defs_file)
+            with self.assertRaises(hwsuite.MessageworthyException) as cm:
+                QuestionSettings.load(q_dir)
+            self.assertIn(defs_file, str(cm.exception))
+
+
+class OutcomeSpoolTest(TestCase):
+
+    def test_compact(self):
+        test_case = check.TestCase.create(None, '/q1/01-expected.txt')
+        with OutcomeSpool() as spool:
+            passed = spool.compact(TestCaseOutcome(True, 'q1', test_case, "a\n", "a\n", 'ok'))
+            self.assertIsInstance(passed.actual_text, SpooledText)
+            self.assertIsNone(passed.actual_text.pathname)
+            self.assertEqual(2, passed.actual_text.size)
+            self.assertEqual(passed.expected_text.digest, passed.actual_text.digest)
+            failed = spool.compact(TestCaseOutcome(False, 'q1', test_case, "a\n", "b\n", 'diff'))
+            self.assertEqual("a\n", failed.read_expected_text())
+            self.assertEqual("b\n", failed.read_actual_text())
+            buffer = io.StringIO()
+            check.report([failed], 'repr', ofile=buffer)
+            self.assertIn("actual: 'b\\n'", buffer.getvalue())
+            directory = spool.directory
+        self.assertFalse(os.path.exists(directory))
+
+    def test_compact_no_expected(self):
+        test_case = check.TestCase.create(None, None)
+        with OutcomeSpool() as spool:
+            outcome = spool.compact(TestCaseOutcome(False, 'q1', test_case, None, "", 'exit_code'))
+            self.assertIsNone(outcome.read_expected_text())
+            self.assertEqual("", outcome.read_actual_text())
+
+    def test_stream_file_lines(self):
+        self.assertListEqual([], list(check.stream_file_lines(None)))
+        with tempfile.TemporaryDirectory() as tempdir:
+            pathname = hwsuite.tests.write_text_file("a\nb\n", os.path.join(tempdir, 'input.txt'))
+            self.assertListEqual(["a\n", "b\n"], list(check.stream_file_lines(pathname)))
+            self.assertListEqual(["a", "b"], list(check.stream_file_lines(pathname, rstrip="\n")))
+
+
 class UnitTestConcurrencyManager(ConcurrencyManager):
 
     def _run_test_case(self, test_case: TestCase) -> TestCaseOutcome:
@@ -140,6 +374,37 @@ class ConcurrencyManagerTest(TestCase):
         for outcome in outcomes.values():
             self.assertEqual('fake', outcome.message)
 
+    def test_perform_spooled(self):
+        runner = TestCaseRunner('true', Throttle.default(), StuffConfig.default())
+        with OutcomeSpool() as spool:
+            runner.spool = spool
+            mgr = UnitTestConcurrencyManager(runner, 2)
+            outcomes = {}
+            mgr.perform(check.TestCase.create('foo', 'bar'), outcomes)
+            outcome = list(outcomes.values())[0]
+            self.assertIsInstance(outcome.actual_text, SpooledText)
+            self.assertEqual(SpooledText.digest_of('hello, world'), (outcome.actual_text.digest, outcome.actual_text.size))
+
+    def test_perform_traced(self):
+        tracer = Tracer()
+        runner = TestCaseRunner('true', Throttle.default(), StuffConfig.default(), tracer=tracer)
+        mgr = UnitTestConcurrencyManager(runner, 2)
+        outcomes = {}
+        threads = []
+        for name in ('foo', 'bar', 'baz', 'gaw'):
+            test_case = check.TestCase.create(None, f"{name}-expected.txt")
+            t = threading.Thread(target=mgr.perform, args=(test_case, outcomes, 'q1'))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+        case_events = [e for e in tracer.events if e['name'] == 'case']
+        self.assertEqual(4, len(case_events))
+        self.assertSetEqual({'foo', 'bar', 'baz', 'gaw'}, set(e['args']['case'] for e in case_events))
+        self.assertTrue(set(e['tid'] for e in case_events).issubset({1, 2}), "expect one track per worker slot")
+        for e in case_events:
+            self.assertEqual('q1', e['args']['question'])
+
 class TestCaseRunnerTest(TestCase):
 
     def test_run_test_case_pass(self):
@@ -197,6 +462,125 @@ class TestCaseRunnerTest(TestCase):
         print(outcome)
         self.assertTrue(outcome.passed)
 
+    def test_run_test_case_traced(self):
+        tracer = Tracer()
+        with tempfile.TemporaryDirectory() as tempdir:
+            expected_file = os.path.join(tempdir, '7-expected.txt')
+            hwsuite.tests.write_text_file("bar\n", expected_file)
+            t = check.TestCaseRunner('echo', Throttle.default(), StuffConfig.default(), tracer=tracer)
+            outcome = t.run_test_case(check.TestCase.create(None, expected_file, args=['bar']))
+        self.assertTrue(outcome.passed)
+        self.assertListEqual(['spawn', 'wait', 'compare'], [e['name'] for e in tracer.events])
+        for e in tracer.events:
+            self.assertEqual('echo', e['args']['question'])
+            self.assertEqual('7', e['args']['case'])
+
+    def test_run_test_case_usage(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            expected_file = os.path.join(tempdir, 'expected.txt')
+            hwsuite.tests.write_text_file("done\n", expected_file)
+            t = check.TestCaseRunner(sys.executable, Throttle.default(), StuffConfig.default())
+            script = 'x = bytearray(16 * 1024 * 1024); print("done")'
+            outcome = t.run_test_case(check.TestCase.create(None, expected_file, args=['-c', script]))
+            self.assertTrue(outcome.passed)
+            self.assertIsNotNone(outcome.usage)
+            self.assertGreater(outcome.usage.max_rss_kb, 16 * 1024)
+            t.settings = QuestionSettings.from_model({'limits': {'max_rss_kb': 1024}})
+            outcome = t.run_test_case(check.TestCase.create(None, expected_file, args=['-c', script]))
+            self.assertFalse(outcome.passed)
+            self.assertTrue(outcome.message.startswith("memory limit exceeded"), outcome.message)
+
+    def test_run_test_case_timeout(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            expected_file = os.path.join(tempdir, 'expected.txt')
+            hwsuite.tests.write_text_file("done\n", expected_file)
+            t = check.TestCaseRunner(sys.executable, Throttle.default(), StuffConfig.default())
+            t.settings = QuestionSettings.default(UsageLimits(timeout=0.5))
+            script = 'import subprocess, time; subprocess.Popen(["sleep", "60"]); time.sleep(60)'
+            start = time.perf_counter()
+            outcome = t.run_test_case(check.TestCase.create(None, expected_file, args=['-c', script]))
+            self.assertLess(time.perf_counter() - start, 30)
+            self.assertFalse(outcome.passed)
+            self.assertEqual("timeout after 0.5 seconds", outcome.message)
+
+    def test_run_test_case_rlimit_fsize(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            expected_file = os.path.join(tempdir, 'expected.txt')
+            hwsuite.tests.write_text_file("done\n", expected_file)
+            t = check.TestCaseRunner(sys.executable, Throttle.default(), StuffConfig.default())
+            t.settings = QuestionSettings.from_model({'limits': {'rlimit_fsize_kb': 64}})
+            script = 'import signal; signal.signal(signal.SIGXFSZ, signal.SIG_DFL); open("big", "wb").write(bytes(1024 * 1024)); print("done")'
+            outcome = t.run_test_case(check.TestCase.create(None, expected_file, args=['-c', script]))
+            self.assertFalse(outcome.passed)
+            self.assertEqual("file size rlimit exceeded", outcome.message)
+
+    def test_run_test_case_sandbox_pool(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            expected_file = os.path.join(tempdir, '1-expected.txt')
+            hwsuite.tests.write_text_file("created\n", expected_file)
+            t = check.TestCaseRunner('bash', Throttle.default(), StuffConfig.default())
+            with SandboxPool(tempdir, keep_failed=True) as pool:
+                t.sandbox_pool = pool
+                script = 'test -e out.txt && exit 1; echo created | tee out.txt'
+                for _ in range(2):
+                    outcome = t.run_test_case(check.TestCase.create(None, expected_file, args=['-c', script]))
+                    self.assertTrue(outcome.passed, outcome.message)
+                self.assertEqual(1, pool.num_created)
+                outcome = t.run_test_case(check.TestCase.create(None, expected_file, args=['-c', 'echo failed > out.txt']))
+                self.assertFalse(outcome.passed)
+                self.assertEqual(1, len(pool.kept))
+                self.assertTrue(os.path.basename(pool.kept[0]).startswith('bash-1'))
+                self.assertEqual("failed\n", Path(pool.kept[0], 'out.txt').read_text())
+
+    def test_run_test_case_fixtures(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            for relpath, text in [('fixtures/data.txt', "shared\n"), ('fixtures/sub/other.txt', "other\n"), ('01-fixtures/data.txt', "own\n")]:
+                os.makedirs(os.path.dirname(os.path.join(tempdir, relpath)), exist_ok=True)
+                hwsuite.tests.write_text_file(text, os.path.join(tempdir, relpath))
+            expected_file = os.path.join(tempdir, '01-expected.txt')
+            hwsuite.tests.write_text_file("own\nother\n", expected_file)
+            t = check.TestCaseRunner('cat', Throttle.default(), StuffConfig.default())
+            fixtures = [os.path.join(tempdir, 'fixtures'), os.path.join(tempdir, '01-fixtures')]
+            outcome = t.run_test_case(check.TestCase.create(None, expected_file, args=['data.txt', 'sub/other.txt'], fixtures=fixtures))
+            self.assertTrue(outcome.passed, outcome.message)
+
+    def test_run_test_case_stdin(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            input_file = os.path.join(tempdir, '01-input.txt')
+            hwsuite.tests.write_text_file("3\n4\n", input_file)
+            expected_file = os.path.join(tempdir, '01-expected.txt')
+            hwsuite.tests.write_text_file("7\n", expected_file)
+            t = check.TestCaseRunner('bash', Throttle.default(), StuffConfig.default(), require_screen='always')
+            t.settings = QuestionSettings.from_model({'input_mode': 'stdin'})
+            script = 'read a; read b; echo $((a + b))'
+            outcome = t.run_test_case(check.TestCase.create(input_file, expected_file, args=['-c', script]))
+            self.assertTrue(outcome.passed, outcome.message)
+            outcome = t.run_test_case(check.TestCase.create(None, expected_file, args=['-c', script]))
+            self.assertEqual("0\n", outcome.read_actual_text())
+
+    def test_run_test_case_virtual(self):
+        t = check.TestCaseRunner('bash', Throttle.default(), StuffConfig.default())
+        t.input_mode = 'stdin'
+        script = 'read a; read b; echo $((a + b))'
+        outcome = t.run_test_case(check.TestCase.create_virtual('01', "3\n4\n", "7\n", args=['-c', script]))
+        self.assertTrue(outcome.passed, outcome.message)
+        outcome = t.run_test_case(check.TestCase.create_virtual('02', "3\n4\n", "8\n", args=['-c', script]))
+        self.assertFalse(outcome.passed)
+        self.assertEqual("8\n", outcome.read_expected_text())
+
+    def test_run_test_case_packed(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            corpus_file = os.path.join(tempdir, 'test-cases.corpus')
+            with hwsuite.corpus.CorpusWriter(corpus_file) as writer:
+                writer.add('01', "3\n4\n", "7\n")
+                writer.add('02', None, "0\n")
+            t = check.TestCaseRunner('bash', Throttle.default(), StuffConfig.default())
+            t.input_mode = 'stdin'
+            script = 'read a; read b; echo $((a + b))'
+            for name in ('01', '02'):
+                outcome = t.run_test_case(check.TestCase.create_packed(corpus_file, name, args=['-c', script]))
+                self.assertTrue(outcome.passed, outcome.message)
+
     def test_run_test_case_no_expected(self):
         t = check.TestCaseRunner('true', Throttle.default(), StuffConfig.default())
         outcome = t.run_test_case(check.TestCase.create(None, None))
@@ -256,6 +640,141 @@ class CppCheckerTest(TestCase):
         self.assertIsNone(test_case.expected_file, "expected")
         self.assertEqual(0, test_case.exit_code, "exit code")
 
+    def test_detect_virtual_test_cases(self):
+        runner_factory = TestCaseRunnerFactory(Throttle.default(), StuffConfig.default())
+        with tempfile.TemporaryDirectory() as q_dir:
+            hwsuite.tests.write_text_file(json.dumps({'input': "{a}\n", 'expected': "{a}\n", 'param_names': ['a'], 'test_cases': [[1], [2]]}),
+                                          os.path.join(q_dir, 'test-cases.json'))
+            os.makedirs(os.path.join(q_dir, 'test-cases'))
+            hwsuite.tests.write_text_file("stale\n", os.path.join(q_dir, 'test-cases', '1-expected.txt'))
+            hwsuite.tests.write_text_file("extra\n", os.path.join(q_dir, 'extra-expected.txt'))
+            detected = CppChecker(runner_factory, 1, virtual=True)._detect_test_cases(q_dir)
+            self.assertListEqual(['1', '2', 'extra'], sorted(tc.label() for tc in detected))
+            self.assertListEqual(['1', '2'], [tc.label() for tc in detected if tc.is_virtual()])
+
+    def test_exit_first(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            executable = hwsuite.tests.write_text_file("#!/bin/sh\nsleep \"$1\"\necho done\n", os.path.join(q_dir, 'q1'))
+            os.chmod(executable, 0o700)
+            test_cases = []
+            for i, seconds in enumerate(('0', '30', '30', '30')):
+                expected_file = hwsuite.tests.write_text_file("done\n" if i > 0 else "other\n", os.path.join(q_dir, f"{i + 1}-expected.txt"))
+                test_cases.append(check.TestCase.create(None, expected_file, args=[seconds]))
+
+            class ScriptChecker(CppChecker):
+
+                def _resolve_executable(self, q_dir_: str) -> str:
+                    return executable
+
+            runner_factory = TestCaseRunnerFactory(Throttle.default(), StuffConfig.default(), 'never')
+            checker = ScriptChecker(runner_factory, 2, schedule='sorted', exit_first=True)
+            start = time.perf_counter()
+            outcomes = checker.check_cpp(os.path.join(q_dir, 'main.cpp'), TestCasesConfig.create(), test_cases)
+            self.assertLess(time.perf_counter() - start, 20)
+        self.assertListEqual([test_cases[0]], list(outcomes.keys()))
+        self.assertEqual('diff', outcomes[test_cases[0]].message)
+
+    def test_dedup(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            executable = hwsuite.tests.write_text_file("#!/bin/sh\necho \"$1\"\n", os.path.join(q_dir, 'q1'))
+            os.chmod(executable, 0o700)
+            test_cases = []
+            for i, arg in enumerate(('a', 'b', 'a', 'a')):
+                expected_file = hwsuite.tests.write_text_file("a\n", os.path.join(q_dir, f"{i + 1}-expected.txt"))
+                test_cases.append(check.TestCase.create(None, expected_file, args=[arg]))
+            test_cases.append(check.TestCase.create_virtual('v', None, "a\n", args=['a']))
+            distinct, aliases = check.group_duplicates(test_cases)
+            self.assertListEqual(test_cases[:2], distinct)
+            self.assertDictEqual({test_cases[0]: [test_cases[2], test_cases[3], test_cases[4]]}, aliases)
+            case_limits = {test_cases[3].label(): UsageLimits(timeout=1.0)}
+            distinct, aliases = check.group_duplicates(test_cases, lambda tc: case_limits.get(tc.label(), UsageLimits()))
+            self.assertListEqual(test_cases[:2] + [test_cases[3]], distinct)
+            self.assertDictEqual({test_cases[0]: [test_cases[2], test_cases[4]]}, aliases)
+            started = []
+
+            class RecordingRunner(TestCaseRunner):
+
+                def run_test_case(self, test_case):
+                    started.append(test_case.label())
+                    return super().run_test_case(test_case)
+
+            class RecordingFactory(TestCaseRunnerFactory):
+
+                def create(self, executable_):
+                    return RecordingRunner(executable_, self.throttle, self.stuff_config, 'never')
+
+            class ScriptChecker(CppChecker):
+
+                def _resolve_executable(self, q_dir_: str) -> str:
+                    return executable
+
+            for dedup, expected_runs in [(True, 2), (False, 5)]:
+                started.clear()
+                checker = ScriptChecker(RecordingFactory(Throttle.default(), StuffConfig.default()), 2, schedule='sorted', dedup=dedup)
+                outcomes = checker.check_cpp(os.path.join(q_dir, 'main.cpp'), TestCasesConfig.create(), test_cases)
+                self.assertEqual(expected_runs, len(started))
+                self.assertSetEqual(set(test_cases), set(outcomes.keys()))
+                self.assertListEqual([True, False, True, True, True], [outcomes[tc].passed for tc in test_cases])
+                self.assertTrue(all(outcomes[tc].test_case == tc for tc in test_cases))
+
+    def test_dedup_without_rendering(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            runs_file = os.path.join(q_dir, 'runs.txt')
+            reference = hwsuite.tests.write_text_file(f"#!/bin/sh\necho run >> \"{runs_file}\"\ncat\n", os.path.join(q_dir, 'reference.sh'))
+            os.chmod(reference, 0o700)
+            defs_file = os.path.join(q_dir, 'test-cases.json')
+            with open(defs_file, 'w') as ofile:
+                json.dump({'input': "{n}\n", 'reference': 'reference.sh', 'param_names': ['n'], 'test_cases': [[1], [2], [1]]}, ofile)
+            test_cases = [check.TestCase.create_rendered(defs_file, str(i + 1)) for i in range(3)]
+            distinct, aliases = check.group_duplicates(test_cases)
+            self.assertListEqual(test_cases[:2], distinct)
+            self.assertDictEqual({test_cases[0]: [test_cases[2]]}, aliases)
+            self.assertFalse(os.path.exists(runs_file))
+            expected_files = [hwsuite.tests.write_text_file(text, os.path.join(q_dir, f"{i + 1}-expected.txt")) for i, text in enumerate(["ab\n", "cd\n", "ab\n"])]
+            test_cases = [check.TestCase.create(None, expected_file) for expected_file in expected_files]
+            distinct, aliases = check.group_duplicates(test_cases)
+            self.assertListEqual(test_cases[:2], distinct)
+            self.assertDictEqual({test_cases[0]: [test_cases[2]]}, aliases)
+
+    def test_schedule_history(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            executable = hwsuite.tests.write_text_file("#!/bin/sh\necho \"$1\"\n", os.path.join(q_dir, 'q1'))
+            os.chmod(executable, 0o700)
+            test_cases = []
+            for i in range(3):
+                expected_file = hwsuite.tests.write_text_file(f"{i}\n", os.path.join(q_dir, f"{i + 1}-expected.txt"))
+                test_cases.append(check.TestCase.create(None, expected_file, args=[str(i)]))
+            history = RunHistory()
+            history.record_result('q1', '1-expected.txt', True)
+            history.record_runtime('q1', '1-expected.txt', 1.0)
+            history.record_result('q1', '2-expected.txt', True)
+            history.record_runtime('q1', '2-expected.txt', 2.0)
+            history.record_result('q1', '3-expected.txt', False)
+            history.record_runtime('q1', '3-expected.txt', 0.5)
+            started = []
+
+            class RecordingRunner(TestCaseRunner):
+
+                def run_test_case(self, test_case):
+                    started.append(test_case.label())
+                    return super().run_test_case(test_case)
+
+            class RecordingFactory(TestCaseRunnerFactory):
+
+                def create(self, executable_):
+                    return RecordingRunner(executable_, self.throttle, self.stuff_config, 'never', history=self.history)
+
+            class ScriptChecker(CppChecker):
+
+                def _resolve_executable(self, q_dir_: str) -> str:
+                    return executable
+
+            checker = ScriptChecker(RecordingFactory(Throttle.default(), StuffConfig.default(), history=history), 1)
+            outcomes = checker.check_cpp(os.path.join(q_dir, 'main.cpp'), TestCasesConfig.create(), test_cases)
+        self.assertListEqual(['3', '2', '1'], started)
+        self.assertTrue(all(o.passed for o in outcomes.values()))
+        self.assertTrue(history.last_passed('q1', '3-expected.txt'))
+
     def test_valgrind_error(self):
         with tempfile.TemporaryDirectory() as proj_dir:
             hwsuite.init.do_init(proj_dir, hwsuite.init._DEFAULT_SAFETY_MODE, {})
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+from unittest import TestCase
+
+import hwsuite.tests
+from hwsuite import corpus
+
+hwsuite.tests.configure_logging()
+
+
+class CorpusTest(TestCase):
+
+    def test_write_and_read(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            corpus_file = os.path.join(tempdir, 'test-cases.corpus')
+            with corpus.CorpusWriter(corpus_file) as writer:
+                writer.add('01', "1\n2\n", "3\n")
+                writer.add('02', None, "résumé\n", {'FOO': 'bar'}, ['-v'], 2)
+                with self.assertRaises(ValueError):
+                    writer.add('01', "", "")
+            with corpus.Corpus(corpus_file) as c:
+                self.assertListEqual(['01', '02'], c.names())
+                self.assertEqual("résumé\n", c.read_expected('02'))
+                self.assertIsNone(c.read_input('02'))
+                self.assertEqual("1\n2\n", c.read_input('01'))
+                entry = c.entry('02')
+                self.assertDictEqual({'FOO': 'bar'}, entry.env)
+                self.assertTupleEqual(('-v',), entry.args)
+                self.assertEqual(2, entry.exit_code)
+                with self.assertRaises(corpus.CorpusException):
+                    c.entry('03')
+            self.assertIs(corpus.open_corpus(corpus_file), corpus.open_corpus(corpus_file))
+
+    def test_abort(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            with self.assertRaises(RuntimeError):
+                with corpus.CorpusWriter(os.path.join(tempdir, 'x.corpus')) as writer:
+                    writer.add('01', "", "")
+                    raise RuntimeError()
+            self.assertListEqual([], os.listdir(tempdir))
+
+    def test_not_a_corpus(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            for content in ("", "not a corpus at all, but long enough to have a footer"):
+                with self.subTest(content=content):
+                    pathname = hwsuite.tests.write_text_file(content, os.path.join(tempdir, 'bad.corpus'))
+                    with self.assertRaises(corpus.CorpusException):
+                        corpus.Corpus(pathname)
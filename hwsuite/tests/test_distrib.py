@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+import multiprocessing
+import os
+import socket
+import stat
+import tempfile
+import threading
+from unittest import TestCase
+from hwsuite import distrib
+from hwsuite.check import StuffConfig, Throttle, TestCaseRunnerFactory, TestCaseOutcome
+from hwsuite.distrib import Coordinator, Task, Worker
+import hwsuite.check
+import hwsuite.tests
+
+hwsuite.tests.configure_logging()
+
+_ECHO_ARGS_SCRIPT = """\
+#!/bin/sh
+for arg in "$@"; do
+  echo "$arg"
+done
+"""
+
+
+def _create_project(proj_dir: str, num_cases: int):
+    """Creates a question whose executable is a script that prints its arguments; the last case fails."""
+    q_dir = os.path.join(proj_dir, 'q1')
+    executable = os.path.join(q_dir, 'cmake-build', 'q1')
+    os.makedirs(os.path.dirname(executable))
+    hwsuite.tests.write_text_file(_ECHO_ARGS_SCRIPT, executable)
+    os.chmod(executable, stat.S_IRWXU)
+    tasks = []
+    for i in range(num_cases):
+        expected_file = os.path.join(q_dir, f"{i + 1:02d}-expected.txt")
+        hwsuite.tests.write_text_file(f"{i}\n" if i < num_cases - 1 else "wrong\n", expected_file)
+        test_case = hwsuite.check.TestCase.create(None, expected_file, args=[str(i)])
+        tasks.append(Task(i, q_dir, executable, test_case))
+    return tasks
+
+
+def _work(address_spec: str, proj_dir):
+    factory = TestCaseRunnerFactory(Throttle.default(), StuffConfig.default(), 'never')
+    worker = Worker(address_spec, factory, proj_dir)
+    try:
+        result = worker.work_concurrently(2)
+    finally:
+        worker.close()
+    if result.failures:
+        raise result.failures[0]
+
+
+class ModuleTest(TestCase):
+
+    def test_parse_address(self):
+        self.assertEqual((socket.AF_UNIX, '/tmp/x.sock'), distrib.parse_address('unix:/tmp/x.sock'))
+        self.assertEqual((socket.AF_INET, ('127.0.0.1', 8000)), distrib.parse_address('8000'))
+        self.assertEqual((socket.AF_INET, ('0.0.0.0', 8000)), distrib.parse_address('0.0.0.0:8000'))
+        with self.assertRaises(distrib.AddressException):
+            distrib.parse_address('localhost')
+
+    def test_outcome_model(self):
+        test_case = hwsuite.check.TestCase.create(None, '/p/q1/01-expected.txt')
+        task = Task(0, '/p/q1', '/p/q1/cmake-build/q1', test_case)
+        failed = TestCaseOutcome(False, 'x', test_case, "a\n", "b\n", 'diff')
+        restored = distrib.outcome_from_model(distrib.outcome_to_model(0, failed), task)
+        self.assertEqual(failed._replace(executable=task.executable), restored)
+        passed = TestCaseOutcome(True, 'x', test_case, "a\n", "a\n", 'ok')
+        restored = distrib.outcome_from_model(distrib.outcome_to_model(0, passed), task)
+        self.assertEqual(2, restored.actual_text.size)
+
+    def test_task_model_fixtures(self):
+        with tempfile.TemporaryDirectory() as proj_dir:
+            fixtures_dir = os.path.join(proj_dir, 'q1', 'fixtures')
+            os.makedirs(os.path.join(fixtures_dir, 'sub'))
+            hwsuite.tests.write_text_file("x\n", os.path.join(fixtures_dir, 'sub', 'data.txt'))
+            test_case = hwsuite.check.TestCase.create(None, None, fixtures=[fixtures_dir])
+            task = Task(0, os.path.join(proj_dir, 'q1'), os.path.join(proj_dir, 'q1', 'q1'), test_case)
+            model = task.to_model(proj_dir)
+            self.assertListEqual(['q1/fixtures'], model['case']['fixtures'])
+            self.assertListEqual(['q1/fixtures/sub/data.txt'], model['case']['fixture_files'])
+            self.assertIn('q1/fixtures/sub/data.txt', Coordinator(proj_dir, [task]).servable_files)
+
+
+class CoordinatorTest(TestCase):
+
+    def test_release_requeues(self):
+        test_case = hwsuite.check.TestCase.create(None, None)
+        coordinator = Coordinator('/p', [Task(0, '/p/q1', '/p/q1/cmake-build/q1', test_case)])
+        status, task = coordinator.checkout()
+        self.assertEqual('task', status)
+        self.assertEqual(('wait', None), coordinator.checkout())
+        coordinator.release({task.task_id})
+        self.assertEqual('task', coordinator.checkout()[0])
+        coordinator.complete(task.task_id, TestCaseOutcome(True, task.executable, test_case, None, '', 'ok'))
+        self.assertEqual(('done', None), coordinator.checkout())
+        self.assertTrue(coordinator.wait(0))
+
+    def test_release_gives_up(self):
+        test_case = hwsuite.check.TestCase.create(None, None)
+        coordinator = Coordinator('/p', [Task(0, '/p/q1', '/p/q1/cmake-build/q1', test_case)])
+        for _ in range(distrib._MAX_TASK_ATTEMPTS):
+            status, task = coordinator.checkout()
+            self.assertEqual('task', status)
+            coordinator.release({task.task_id})
+        self.assertEqual(('done', None), coordinator.checkout())
+        outcome = coordinator.outcomes_by_question()['/p/q1'][test_case]
+        self.assertFalse(outcome.passed)
+
+    def test_wait_idle(self):
+        test_case = hwsuite.check.TestCase.create(None, None)
+        coordinator = Coordinator('/p', [Task(0, '/p/q1', '/p/q1/cmake-build/q1', test_case)])
+        self.assertFalse(coordinator.wait(idle_timeout=0.01))
+        coordinator.connect()
+        self.assertFalse(coordinator.wait(timeout=0.01, idle_timeout=0.01))
+        coordinator.disconnect()
+        coordinator.abandon("no workers")
+        self.assertTrue(coordinator.wait(0))
+        self.assertEqual("no workers", coordinator.outcomes_by_question()['/p/q1'][test_case].message)
+
+    def test_read_file_restricted(self):
+        coordinator = Coordinator('/p', [])
+        with self.assertRaises(distrib.ProtocolException):
+            coordinator.read_file('../etc/passwd')
+
+    def _do_test_workers(self, address_spec: str, proj_dir: str, worker_proj_dirs):
+        tasks = _create_project(proj_dir, 6)
+        coordinator = Coordinator(proj_dir, tasks)
+        coordinator.serve(address_spec)
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_work, args=(address_spec, worker_proj_dir)) for worker_proj_dir in worker_proj_dirs]
+        try:
+            for w in workers:
+                w.start()
+            self.assertTrue(coordinator.wait(60), "outcomes not received")
+        finally:
+            for w in workers:
+                w.join(30)
+            coordinator.shutdown()
+        outcomes = coordinator.outcomes_by_question()[tasks[0].q_dir]
+        self.assertEqual(len(tasks), len(outcomes))
+        failures = [o for o in outcomes.values() if not o.passed]
+        self.assertEqual(1, len(failures), str(failures))
+        self.assertEqual("5\n", failures[0].read_actual_text())
+        self.assertTrue(all(w.exitcode == 0 for w in workers))
+
+    def test_unix_workers_shared_and_fetching(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            proj_dir = os.path.join(tempdir, 'proj')
+            self._do_test_workers(f"unix:{tempdir}/coordinator.sock", proj_dir, [proj_dir, None])
+
+    def test_unservable_file(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            proj_dir = os.path.join(tempdir, 'proj')
+            address_spec = f"unix:{tempdir}/coordinator.sock"
+            tasks = _create_project(proj_dir, 2)
+            os.remove(tasks[0].test_case.expected_file)
+            coordinator = Coordinator(proj_dir, tasks)
+            coordinator.serve(address_spec)
+            worker = Worker(address_spec, TestCaseRunnerFactory(Throttle.default(), StuffConfig.default(), 'never'))
+            try:
+                result = worker.work_concurrently(1)
+            finally:
+                worker.close()
+                coordinator.shutdown()
+            self.assertListEqual([], result.failures)
+            self.assertEqual(2, result.num_run)
+            outcome = coordinator.outcomes_by_question()[tasks[0].q_dir][tasks[0].test_case]
+            self.assertFalse(outcome.passed)
+            self.assertIn("files unavailable", outcome.message)
+
+    def test_tcp_workers(self):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        with tempfile.TemporaryDirectory() as tempdir:
+            proj_dir = os.path.join(tempdir, 'proj')
+            self._do_test_workers(f"127.0.0.1:{port}", proj_dir, [None, None, None])
+
+
+class WorkerTest(TestCase):
+
+    def _worker(self, address_spec: str) -> Worker:
+        return Worker(address_spec, TestCaseRunnerFactory(Throttle.default(), StuffConfig.default(), 'never'), '/p')
+
+    def test_connection_refused(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            result = self._worker(f"unix:{tempdir}/absent.sock").work_concurrently(2)
+        self.assertEqual(0, result.num_run)
+        self.assertEqual(2, len(result.failures))
+        self.assertTrue(all(isinstance(e, OSError) for e in result.failures))
+
+    def test_coordinator_disappears(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            sock_path = os.path.join(tempdir, 'coordinator.sock')
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+                server.bind(sock_path)
+                server.listen(1)
+                results = []
+                worker_thread = threading.Thread(target=lambda: results.append(self._worker(f"unix:{sock_path}").work_concurrently(1)))
+                worker_thread.start()
+                conn, _ = server.accept()
+                with conn, conn.makefile('rb') as rfile:
+                    rfile.readline()
+                worker_thread.join(10)
+        self.assertEqual(1, len(results[0].failures))
+        self.assertIsInstance(results[0].failures[0], distrib.ProtocolException)
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+from unittest import TestCase
+from hwsuite.expressions import Expression, ExpressionException
+import hwsuite.tests
+
+hwsuite.tests.configure_logging()
+
+
+class ExpressionTest(TestCase):
+
+    def test_evaluate(self):
+        self.assertEqual(7, Expression("a + b").evaluate({'a': 3, 'b': 4}))
+        self.assertEqual('big', Expression("'big' if max(a, b) > 10 else 'small'").evaluate({'a': 3, 'b': 40}))
+        self.assertEqual(2, Expression("xs[1] // 2").evaluate({'xs': [1, 5]}))
+        self.assertEqual('ab', Expression("s[:2]").evaluate({'s': 'abc'}))
+
+    def test_rejected(self):
+        for source in ("a.__class__", "__import__('os')", "[x for x in a]", "lambda: 1", "open('f')", "a +", "max(a, key=b)"):
+            with self.subTest(source=source):
+                with self.assertRaises(ExpressionException):
+                    Expression(source)
+
+    def test_bounded(self):
+        self.assertEqual(2 ** 100, Expression("a ** 100").evaluate({'a': 2}))
+        self.assertEqual(0.25, Expression("a ** -2").evaluate({'a': 2}))
+        self.assertEqual("xxx", Expression("'x' * a").evaluate({'a': 3}))
+        self.assertEqual([0, 0], Expression("a * [0]").evaluate({'a': 2}))
+        self.assertEqual(12, Expression("a * 3 << 1").evaluate({'a': 2}))
+        self.assertEqual(1, Expression("a % 3").evaluate({'a': 7}))
+        self.assertEqual("007 x", Expression("'%03d %s' % (a, 'x')").evaluate({'a': 7}))
+        for source in ("9 ** 9 ** 9", "'x' * 10 ** 10", "[0] * a", "1 << a", "(2 ** 60000) * (2 ** 60000)",
+                       "'%0100000000d' % a", "'%.100000000d' % a", "'%*d' % (a, 1)", "'%s' * 1000 % (('x' * 1000000,) * 1000)"):
+            with self.subTest(source=source):
+                with self.assertRaises(ExpressionException):
+                    Expression(source).evaluate({'a': 10 ** 10})
+
+    def test_undefined_name(self):
+        with self.assertRaises(ExpressionException):
+            Expression("a + c").evaluate({'a': 1})
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+import json
+import os
+import tempfile
+from unittest import TestCase
+from hwsuite import history
+from hwsuite.history import RunHistory, TimeoutPolicy
+import hwsuite.tests
+
+hwsuite.tests.configure_logging()
+
+
+class ModuleTest(TestCase):
+
+    def test_percentile(self):
+        values = [0.5, 0.1, 0.4, 0.2, 0.3]
+        self.assertEqual(0.3, history.percentile(values, 50))
+        self.assertEqual(0.5, history.percentile(values, 99))
+        self.assertEqual(0.0, history.percentile([], 50))
+
+
+class TimeoutPolicyTest(TestCase):
+
+    def test_derive(self):
+        policy = TimeoutPolicy(multiplier=3.0, floor=0.5, ceiling=30.0, min_samples=3)
+        self.assertEqual(5.0, policy.derive([0.01, 0.02], 5.0))
+        self.assertEqual(0.5, policy.derive([0.01, 0.02, 0.03], 5.0))
+        self.assertAlmostEqual(6.0, policy.derive([1.0, 2.0, 1.5], 5.0))
+        self.assertEqual(30.0, policy.derive([20.0, 20.0, 20.0], 5.0))
+
+    def test_censored(self):
+        policy = TimeoutPolicy(multiplier=3.0, floor=0.5, ceiling=30.0, min_samples=3)
+        self.assertEqual(6.0, policy.censored(2.0))
+        self.assertEqual(30.0, policy.censored(20.0))
+        self.assertEqual(40.0, policy.censored(40.0))
+
+
+class RunHistoryTest(TestCase):
+
+    def test_record_bounded(self):
+        h = RunHistory(max_samples=3)
+        for i in range(5):
+            h.record('q1', '01', float(i))
+        self.assertListEqual([2.0, 3.0, 4.0], h.samples('q1', '01'))
+        self.assertListEqual([], h.samples('q1', '02'))
+        self.assertListEqual([], h.samples('q2'))
+
+    def test_timeout_falls_back_on_question(self):
+        h = RunHistory()
+        policy = TimeoutPolicy(multiplier=2.0, floor=0.1, ceiling=10.0, min_samples=2)
+        self.assertEqual(5.0, h.timeout('q1', '01', 5.0, policy))
+        h.record('q1', '02', 1.0)
+        h.record('q1', '03', 2.0)
+        self.assertEqual(4.0, h.timeout('q1', '01', 5.0, policy))
+        h.record('q1', '01', 0.25)
+        h.record('q1', '01', 0.5)
+        self.assertEqual(1.0, h.timeout('q1', '01', 5.0, policy))
+
+    def test_timeouts_grow_timeout(self):
+        h = RunHistory()
+        policy = TimeoutPolicy(multiplier=2.0, floor=0.1, ceiling=10.0, min_samples=2)
+        h.record('q1', '01', 0.5)
+        h.record('q1', '01', 0.5)
+        timeout = h.timeout('q1', '01', 5.0, policy)
+        self.assertEqual(1.0, timeout)
+        h.record_timeout('q1', '01', timeout, policy)
+        timeout = h.timeout('q1', '01', 5.0, policy)
+        self.assertEqual(4.0, timeout)
+        h.record_timeout('q1', '01', timeout, policy)
+        self.assertEqual(10.0, h.timeout('q1', '01', 5.0, policy))
+
+    def test_save_load(self):
+        h = RunHistory()
+        h.record('q1', '01', 0.125)
+        with tempfile.TemporaryDirectory() as tempdir:
+            pathname = os.path.join(tempdir, history.HISTORY_BASENAME)
+            h.save(pathname)
+            self.assertListEqual([history.HISTORY_BASENAME], os.listdir(tempdir))
+            loaded = RunHistory.load(pathname)
+            self.assertListEqual([0.125], loaded.samples('q1', '01'))
+
+    def test_load_missing_or_corrupt(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            pathname = os.path.join(tempdir, history.HISTORY_BASENAME)
+            self.assertDictEqual({}, RunHistory.load(pathname).durations)
+            with open(pathname, 'w') as ofile:
+                ofile.write("{not json")
+            self.assertDictEqual({}, RunHistory.load(pathname).durations)
+            with open(pathname, 'w') as ofile:
+                json.dump([1, 2], ofile)
+            self.assertDictEqual({}, RunHistory.load(pathname).durations)
+
+    def test_runtimes(self):
+        h = RunHistory()
+        self.assertIsNone(h.mean_runtime('q1', '01'))
+        h.record_runtime('q1', '01', 1.0)
+        h.record_runtime('q1', '01', 2.0)
+        self.assertEqual(1.5, h.mean_runtime('q1', '01'))
+        with tempfile.TemporaryDirectory() as tempdir:
+            pathname = os.path.join(tempdir, history.HISTORY_BASENAME)
+            h.save(pathname)
+            self.assertEqual(1.5, RunHistory.load(pathname).mean_runtime('q1', '01'))
+
+    def test_schedule(self):
+        h = RunHistory()
+        h.record_result('q1', 'fast', True)
+        h.record_runtime('q1', 'fast', 0.1)
+        h.record_result('q1', 'slow', True)
+        h.record_runtime('q1', 'slow', 3.0)
+        h.record_result('q1', 'broken', False)
+        h.record_runtime('q1', 'broken', 0.2)
+        labels = ['fast', 'new', 'slow', 'broken']
+        self.assertListEqual(['broken', 'new', 'slow', 'fast'], [labels[i] for i in h.schedule('q1', labels)])
+        self.assertListEqual([0, 1], RunHistory().schedule('q1', ['a', 'b']))
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+import io
+from unittest import TestCase
+from hwsuite import merge
+from hwsuite.shard import Shard, CaseResult
+import hwsuite.tests
+
+hwsuite.tests.configure_logging()
+
+
+def _loaded(shard, *results):
+    return {'shard': shard, 'results': list(results)}
+
+
+class ModuleTest(TestCase):
+
+    def test_merge_results(self):
+        merged = merge.merge_results([
+            _loaded(Shard(2, 2), CaseResult('q1', '02', False, 'diff')),
+            _loaded(Shard(1, 2), CaseResult('q1', '01', True, 'ok'), CaseResult('q2', '01', True, 'ok')),
+        ])
+        self.assertListEqual(['q1/01', 'q1/02', 'q2/01'], [r.key() for r in merged])
+        buffer = io.StringIO()
+        self.assertEqual(1, merge.summarize(merged, buffer))
+        self.assertIn("q1: 02: diff", buffer.getvalue())
+        self.assertIn("q2: 0 failures among 1 test cases", buffer.getvalue())
+
+    def test_merge_results_incomplete(self):
+        shard1 = _loaded(Shard(1, 3), CaseResult('q1', '01', True, 'ok'))
+        with self.assertRaises(merge.IncompleteShardsException):
+            merge.merge_results([shard1])
+        with self.assertRaises(merge.IncompleteShardsException):
+            merge.merge_results([shard1, shard1, _loaded(Shard(2, 3)), _loaded(Shard(3, 3))])
+        self.assertEqual(1, len(merge.merge_results([shard1], allow_partial=True)))
+
+    def test_merge_results_failure_wins(self):
+        merged = merge.merge_results([
+            _loaded(None, CaseResult('q1', '01', True, 'ok')),
+            _loaded(None, CaseResult('q1', '01', False, 'diff')),
+        ])
+        self.assertListEqual([False], [r.passed for r in merged])
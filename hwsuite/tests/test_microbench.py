@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+import tempfile
+from unittest import TestCase
+from hwsuite import microbench, check, stage
+import hwsuite.tests
+
+hwsuite.tests.configure_logging()
+
+
+class ModuleTest(TestCase):
+
+    def test_synthesize_cpp_lines(self):
+        lines = microbench.synthesize_cpp_lines(100)
+        self.assertEqual(100, len(lines))
+        staged = stage._transfer_lines(lines)
+        self.assertLess(len(staged), len(lines))
+        self.assertFalse(any('stage:' in line for line in staged))
+
+    def test_synthesize_cpp_lines_partial_block(self):
+        lines = microbench.synthesize_cpp_lines(1001)
+        self.assertEqual(1000, len(lines))
+        stage._transfer_lines(lines)
+
+    def test_synthesize_input_line(self):
+        line = microbench.synthesize_input_line(500)
+        self.assertEqual(500, len(line))
+        self.assertTrue(check.StuffConfig.has_special_chars(line))
+
+    def test_synthesize_test_case_files(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            q_dir = microbench.synthesize_test_case_files(tempdir, 25)
+            test_cases = check.detect_test_case_files(q_dir)
+        self.assertEqual(25, len(test_cases))
+        self.assertEqual(3, len([tc for tc in test_cases if tc.args]))
+
+    def test_run_all(self):
+        results = microbench.run_all([10, 20], repeat=1)
+        expected_keys = set()
+        for m in microbench.MICROBENCHMARKS:
+            expected_keys.update({f"{m.name}[10]", f"{m.name}[20]"})
+        self.assertSetEqual(expected_keys, set(results.keys()))
+        for result in results.values():
+            self.assertGreaterEqual(result['ms'], 0)
+
+    def test_run_all_named(self):
+        results = microbench.run_all([10], names=['render'], repeat=1)
+        self.assertListEqual(['render[10]'], list(results.keys()))
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import os
+import stat
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import hwsuite.tests
+from hwsuite import oracle, testcases
+
+hwsuite.tests.configure_logging()
+
+# reference that doubles the number on its input and counts its runs
+_REFERENCE_SCRIPT = """#!/bin/sh
+echo run >> "{count_file}"
+read n
+echo "$((n * 2))"
+"""
+
+
+def _write_reference(tempdir: str) -> str:
+    pathname = os.path.join(tempdir, 'reference.sh')
+    hwsuite.tests.write_text_file(_REFERENCE_SCRIPT.format(count_file=os.path.join(tempdir, 'runs.txt')), pathname)
+    os.chmod(pathname, os.stat(pathname).st_mode | stat.S_IXUSR)
+    return pathname
+
+
+def _count_runs(tempdir: str) -> int:
+    try:
+        with open(os.path.join(tempdir, 'runs.txt'), 'r') as ifile:
+            return len(ifile.readlines())
+    except FileNotFoundError:
+        return 0
+
+
+class OracleTest(TestCase):
+
+    def test_expected_outputs(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            _write_reference(tempdir)
+            o = oracle.Oracle('reference.sh', root_dir=tempdir, max_workers=2)
+            self.assertListEqual(["2\n", "4\n", "2\n"], o.expected_outputs(["1\n", "2\n", "1\n"]))
+            self.assertEqual(2, _count_runs(tempdir))
+            o.save()
+            o = oracle.Oracle('reference.sh', root_dir=tempdir)
+            self.assertListEqual(["4\n", "6\n"], o.expected_outputs(["2\n", "3\n"]))
+            self.assertEqual(3, _count_runs(tempdir))
+
+    def test_changed_reference_invalidates_cache(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            pathname = _write_reference(tempdir)
+            o = oracle.Oracle('reference.sh', root_dir=tempdir)
+            o.expected_outputs(["1\n"])
+            o.save()
+            with open(pathname, 'a') as ofile:
+                ofile.write("echo more\n")
+            o = oracle.Oracle('reference.sh', root_dir=tempdir)
+            self.assertListEqual(["2\nmore\n"], o.expected_outputs(["1\n"]))
+            o.save()
+            cache_files = os.listdir(os.path.join(tempdir, hwsuite.CACHE_DIR_BASENAME))
+            self.assertListEqual([os.path.basename(o.cache_pathname())], cache_files)
+
+    def test_failure(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            hwsuite.tests.write_text_file("#!/bin/sh\nexit 3\n", os.path.join(tempdir, 'fail.sh'))
+            os.chmod(os.path.join(tempdir, 'fail.sh'), 0o755)
+            o = oracle.Oracle.from_model({'executable': 'fail.sh'}, tempdir)
+            with self.assertRaises(oracle.OracleException):
+                o.expected_outputs(["x\n"])
+            with self.assertRaises(oracle.OracleException):
+                oracle.Oracle('not-a-reference-executable', root_dir=tempdir)
+
+    def test_failure_per_input(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            hwsuite.tests.write_text_file("#!/bin/sh\nread n\n[ \"$n\" = 2 ] && printf '\\377\\n'\necho \"$n\"\n", os.path.join(tempdir, 'binary.sh'))
+            os.chmod(os.path.join(tempdir, 'binary.sh'), 0o755)
+            hwsuite.tests.write_text_file("not executable\n", os.path.join(tempdir, 'plain.txt'))
+            errors = []
+            o = oracle.Oracle('binary.sh', root_dir=tempdir)
+            self.assertListEqual(["1\n", None], o.expected_outputs(["1\n", "2\n"], lambda i, e: errors.append((i, e))))
+            o = oracle.Oracle('plain.txt', root_dir=tempdir)
+            self.assertListEqual([None], o.expected_outputs(["1\n"], lambda i, e: errors.append((i, e))))
+            self.assertListEqual([1, 0], [i for i, _ in errors])
+            self.assertTrue(all(isinstance(e, oracle.OracleException) for _, e in errors))
+
+    def test_save_prune(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            _write_reference(tempdir)
+            o = oracle.Oracle('reference.sh', root_dir=tempdir)
+            o.expected_outputs(["1\n", "2\n"])
+            o.save()
+            o = oracle.Oracle('reference.sh', root_dir=tempdir)
+            o.expected_outputs(["2\n"])
+            o.save()
+            o = oracle.Oracle('reference.sh', root_dir=tempdir)
+            o.load()
+            self.assertEqual(2, len(o.outputs))
+            o.expected_outputs(["2\n"])
+            o.save(prune=True)
+            o = oracle.Oracle('reference.sh', root_dir=tempdir)
+            o.load()
+            self.assertListEqual([oracle.input_digest("2\n")], list(o.outputs.keys()))
+            self.assertEqual(2, _count_runs(tempdir))
+
+    def test_batches(self):
+        self.assertListEqual([[0, 1], [2, 3], [4]], list(oracle.batches(range(5), 2)))
+        self.assertListEqual([], list(oracle.batches([], 2)))
+
+    def test_write_cases_with_reference(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            _write_reference(tempdir)
+            model = {
+                'input': "{n}\n",
+                'reference': 'reference.sh',
+                'param_names': ['n'],
+                'test_cases': [[1], [5], [7]],
+            }
+            param_source = testcases.ParameterSource.load(model, tempdir)
+            self.assertEqual(3, testcases.write_cases(param_source, os.path.join(tempdir, 'test-cases'), onerror='raise'))
+            self.assertEqual("10\n", Path(tempdir, 'test-cases', '2-expected.txt').read_text())
+            self.assertEqual(3, _count_runs(tempdir))
+            self.assertIn(os.path.join(tempdir, 'reference.sh'), testcases._template_files(model, tempdir))
+
+    def test_file_args_resolved(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            hwsuite.tests.write_text_file("read n\necho \"$((n + 1))\"\n", os.path.join(tempdir, 'ref.sh'))
+            o = oracle.Oracle.from_model({'executable': 'sh', 'args': ['ref.sh']}, tempdir)
+            self.assertListEqual(["2\n"], o.expected_outputs(["1\n"]))
+
+    def test_write_cases_with_failing_input(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            hwsuite.tests.write_text_file("#!/bin/sh\nread n\n[ \"$n\" = 2 ] && exit 1\necho \"$n\"\n", os.path.join(tempdir, 'ref.sh'))
+            os.chmod(os.path.join(tempdir, 'ref.sh'), 0o755)
+            model = {
+                'input': "{n}\n",
+                'reference': 'ref.sh',
+                'param_names': ['n'],
+                'test_cases': [[1], [2], [3]],
+            }
+            param_source = testcases.ParameterSource.load(model, tempdir)
+            dest_dir = os.path.join(tempdir, 'test-cases')
+            self.assertEqual(2, testcases.write_cases(param_source, dest_dir, onerror='continue'))
+            self.assertEqual("3\n", Path(dest_dir, '3-expected.txt').read_text())
+            self.assertFalse(os.path.exists(os.path.join(dest_dir, '2-expected.txt')))
+            with self.assertRaises(oracle.OracleException):
+                testcases.write_cases(param_source, dest_dir, onerror='raise')
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+
+import hwsuite.tests
+from hwsuite import pack, check
+from hwsuite.corpus import Corpus, CorpusWriter, CorpusException
+
+hwsuite.tests.configure_logging()
+
+
+class ModuleTest(TestCase):
+
+    def test_pack_unpack(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            src_dir = os.path.join(tempdir, 'src')
+            os.makedirs(os.path.join(src_dir, 'sub'))
+            hwsuite.tests.write_text_file("1\n", os.path.join(src_dir, '01-input.txt'))
+            hwsuite.tests.write_text_file("one\n", os.path.join(src_dir, '01-expected.txt'))
+            hwsuite.tests.write_text_file("-v\n", os.path.join(src_dir, '01-args.txt'))
+            hwsuite.tests.write_text_file("FOO=bar\n", os.path.join(src_dir, '01-env.txt'))
+            hwsuite.tests.write_text_file("two\n", os.path.join(src_dir, 'sub', '02-expected.txt'))
+            corpus_file = os.path.join(tempdir, 'cases.corpus')
+            self.assertEqual(2, pack.pack(src_dir, corpus_file))
+            with Corpus(corpus_file) as c:
+                self.assertListEqual(['01', os.path.join('sub', '02')], c.names())
+            dest_dir = os.path.join(tempdir, 'dest')
+            self.assertEqual(2, pack.unpack(corpus_file, dest_dir))
+            for relpath in ('01-input.txt', '01-expected.txt', '01-args.txt', '01-env.txt', 'sub/02-expected.txt'):
+                self.assertEqual(Path(src_dir, relpath).read_text(), Path(dest_dir, relpath).read_text())
+            self.assertListEqual(check.detect_test_case_files(src_dir, use_index=False),
+                                 [tc._replace(input_file=tc.input_file and tc.input_file.replace(dest_dir, src_dir),
+                                              expected_file=tc.expected_file.replace(dest_dir, src_dir))
+                                  for tc in check.detect_test_case_files(dest_dir, use_index=False)])
+
+    def test_unpack_unsafe_name(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            dest_dir = os.path.join(tempdir, 'dest')
+            for name in ('../escaped', 'sub/../../escaped', os.path.join(tempdir, 'escaped')):
+                with self.subTest(name=name):
+                    corpus_file = os.path.join(tempdir, 'cases.corpus')
+                    with CorpusWriter(corpus_file) as writer:
+                        writer.add('01', None, "one\n")
+                        writer.add(name, None, "escaped\n")
+                    with self.assertRaises(CorpusException):
+                        pack.unpack(corpus_file, dest_dir)
+                    self.assertListEqual(['cases.corpus'], os.listdir(tempdir))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import signal
+import subprocess
+import sys
+import time
+from subprocess import PIPE
+from unittest import TestCase
+from hwsuite import resources
+from hwsuite.resources import ResourceUsage, UsageLimits
+import hwsuite.tests
+
+hwsuite.tests.configure_logging()
+
+
+class ModuleTest(TestCase):
+
+    def test_communicate_measured(self):
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, '-c', 'import sys; x = bytearray(32 * 1024 * 1024); print("out"); print("err", file=sys.stderr); sys.exit(3)'],
+                                stdout=PIPE, stderr=PIPE)
+        stdout, stderr, usage = resources.communicate_measured(proc, started)
+        self.assertEqual(b"out\n", stdout)
+        self.assertEqual(b"err\n", stderr)
+        self.assertEqual(3, proc.returncode)
+        self.assertIsNotNone(usage)
+        self.assertGreater(usage.max_rss_kb, 32 * 1024)
+        self.assertGreater(usage.wall_ms, 0)
+        self.assertGreaterEqual(usage.cpu_ms(), 0)
+
+    def test_wait_measured_timeout(self):
+        started = time.perf_counter()
+        proc = subprocess.Popen(['sleep', '5'])
+        try:
+            usage = resources.wait_measured(proc, started, timeout=0.05)
+            self.assertIsNone(usage)
+            self.assertIsNone(proc.returncode)
+        finally:
+            proc.kill()
+        usage = resources.wait_measured(proc, started)
+        self.assertIsNotNone(usage)
+        self.assertEqual(-9, proc.returncode)
+
+    def test_usage_limits(self):
+        usage = ResourceUsage(80.0, 30.0, 200.0, 4096)
+        self.assertIsNone(UsageLimits().violation(usage))
+        self.assertIsNone(UsageLimits(max_cpu_ms=110, max_rss_kb=4096).violation(usage))
+        self.assertTrue(UsageLimits(max_cpu_ms=100).violation(usage).startswith("cpu limit exceeded"))
+        self.assertTrue(UsageLimits(max_rss_kb=1024).violation(usage).startswith("memory limit exceeded"))
+        self.assertIsNone(UsageLimits(max_cpu_ms=1).violation(None))
+
+    def test_usage_limits_update(self):
+        limits = UsageLimits(max_cpu_ms=100).update({'max_rss_kb': 2048})
+        self.assertEqual(UsageLimits(100, 2048), limits)
+        self.assertEqual(UsageLimits(50, 2048), limits.update({'max_cpu_ms': 50}))
+
+    def test_rlimit_cpu(self):
+        limits = UsageLimits(rlimit_cpu_seconds=1)
+        proc = subprocess.Popen(limits.wrap_command([sys.executable, '-c', 'while True: pass']))
+        proc.wait(timeout=30)
+        self.assertEqual("cpu rlimit exceeded", resources.describe_signal_exit(proc.returncode))
+
+    def test_wrap_command(self):
+        cmd = [sys.executable, '-c', 'import resource; print(resource.getrlimit(resource.RLIMIT_FSIZE)[0])']
+        self.assertListEqual(cmd, UsageLimits(max_cpu_ms=100).wrap_command(cmd))
+        wrapped = UsageLimits(rlimit_fsize_kb=64).wrap_command(cmd)
+        self.assertEqual(str(64 * 1024), subprocess.check_output(wrapped).decode('utf8').strip())
+        missing = UsageLimits(rlimit_fsize_kb=64).wrap_command(['/nonexistent/program'])
+        self.assertEqual(127, subprocess.run(missing, stderr=subprocess.DEVNULL).returncode)
+
+    def test_kill_process_groups(self):
+        # the child spawns a grandchild in its own session, like screen does
+        script = 'import subprocess, sys, time; subprocess.Popen(["sleep", "60"], start_new_session=True); print("ok", flush=True); time.sleep(60)'
+        proc = subprocess.Popen([sys.executable, '-c', script], stdout=PIPE, start_new_session=True)
+        self.assertEqual(b"ok\n", proc.stdout.readline())
+        grandchildren = resources._child_pids(proc.pid)
+        self.assertEqual(1, len(grandchildren))
+        pgids = resources.kill_process_groups(proc.pid)
+        self.assertEqual(2, len(pgids))
+        proc.wait(timeout=10)
+        proc.stdout.close()
+        self.assertEqual(-signal.SIGKILL, proc.returncode)
+
+    def test_watchdog(self):
+        proc = subprocess.Popen(['sleep', '60'], start_new_session=True)
+        started = time.perf_counter()
+        with resources.Watchdog(lambda: resources.kill_process_groups(proc.pid), 0.25) as watchdog:
+            proc.wait(timeout=10)
+        self.assertTrue(watchdog.expired)
+        self.assertLess(time.perf_counter() - started, 10)
+        with resources.Watchdog(self.fail, 10) as watchdog:
+            pass
+        self.assertFalse(watchdog.expired)
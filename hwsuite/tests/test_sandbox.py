@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from hwsuite import sandbox
+from hwsuite.sandbox import SandboxPool
+import hwsuite.tests
+
+hwsuite.tests.configure_logging()
+
+
+class SandboxPoolTest(TestCase):
+
+    def test_reuse(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            with SandboxPool(tempdir) as pool:
+                with pool.sandbox() as sandbox:
+                    first = sandbox.path
+                    Path(first, 'a.txt').write_text("a")
+                    os.makedirs(os.path.join(first, 'sub', 'dir'))
+                    os.symlink(tempdir, os.path.join(first, 'link'))
+                with pool.sandbox() as sandbox:
+                    self.assertEqual(first, sandbox.path)
+                    self.assertListEqual([], os.listdir(sandbox.path))
+                    with pool.sandbox() as other:
+                        self.assertNotEqual(first, other.path)
+                self.assertEqual(2, pool.num_created)
+                root = pool.root
+            self.assertFalse(os.path.exists(root))
+            self.assertListEqual([], os.listdir(tempdir))
+
+    def test_keep_failed(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            with SandboxPool(tempdir, keep_failed=True) as pool:
+                with pool.sandbox('q1-02') as sandbox:
+                    Path(sandbox.path, 'out.txt').write_text("x")
+                    sandbox.keep = True
+                with self.assertRaises(ValueError):
+                    with pool.sandbox('q1/03'):
+                        raise ValueError()
+                with pool.sandbox() as sandbox:
+                    self.assertEqual(3, pool.num_created)
+            self.assertListEqual(['q1-02-1', 'q1_03-2'], sorted(map(os.path.basename, pool.kept)))
+            self.assertEqual("x", Path(pool.kept[0], 'out.txt').read_text())
+
+    def test_keep_ignored_unless_keep_failed(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            with SandboxPool(tempdir) as pool:
+                with pool.sandbox() as sandbox:
+                    sandbox.keep = True
+                self.assertListEqual([sandbox.path], pool.available)
+            self.assertListEqual([], pool.kept)
+
+
+class ModuleTest(TestCase):
+
+    def test_stage_file(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            src = os.path.join(tempdir, 'src.txt')
+            Path(src).write_text("data")
+            os.chmod(src, 0o444)
+            for n in range(2):
+                dst = os.path.join(tempdir, f"dst{n}.txt")
+                method = sandbox.stage_file(src, dst)
+                self.assertIn(method, sandbox.STAGE_METHODS)
+                self.assertEqual("data", Path(dst).read_text())
+            if method == 'hardlink':
+                self.assertTrue(os.path.samefile(src, dst))
+
+    def test_stage_file_writable(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            src = os.path.join(tempdir, 'src.txt')
+            Path(src).write_text("data")
+            dst = os.path.join(tempdir, 'dst.txt')
+            self.assertNotEqual('hardlink', sandbox.stage_file(src, dst))
+            with open(dst, 'a') as ofile:
+                ofile.write(" appended by program")
+            self.assertEqual("data", Path(src).read_text())
+
+    def test_stage_fixtures(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            general, specific, dest = [os.path.join(tempdir, d) for d in ('general', 'specific', 'dest')]
+            os.makedirs(os.path.join(general, 'sub'))
+            os.makedirs(specific)
+            os.makedirs(dest)
+            Path(general, 'a.txt').write_text("general a")
+            Path(general, 'sub', 'b.txt').write_text("general b")
+            Path(specific, 'a.txt').write_text("specific a")
+            missing = os.path.join(tempdir, 'missing')
+            self.assertEqual(2, sandbox.stage_fixtures([general, specific, missing], dest))
+            self.assertEqual("specific a", Path(dest, 'a.txt').read_text())
+            self.assertEqual("general b", Path(dest, 'sub', 'b.txt').read_text())
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+import os
+import tempfile
+from unittest import TestCase
+from hwsuite import shard
+from hwsuite.shard import Shard, CaseResult
+import hwsuite.tests
+
+hwsuite.tests.configure_logging()
+
+
+class ShardTest(TestCase):
+
+    def test_parse(self):
+        self.assertEqual(Shard(2, 3), Shard.parse('2/3'))
+        self.assertEqual('2/3', str(Shard(2, 3)))
+        for bad in ('0/3', '4/3', '1', '1/0', 'a/b', '1/2/3'):
+            with self.subTest(bad=bad):
+                with self.assertRaises(ValueError):
+                    Shard.parse(bad)
+
+
+class ModuleTest(TestCase):
+
+    def test_assign_round_robin(self):
+        keys = [f"q{q}/{c:02d}-expected.txt" for q in (1, 2) for c in range(1, 6)]
+        assignments = shard.assign(list(reversed(keys)), 3)
+        self.assertSetEqual(set(keys), set(assignments.keys()))
+        sizes = [list(assignments.values()).count(n) for n in range(3)]
+        self.assertListEqual([4, 3, 3], sizes)
+        self.assertDictEqual(assignments, shard.assign(keys, 3))
+
+    def test_assign_runtime(self):
+        runtimes = {'q1/a': 8.0, 'q1/b': 1.0, 'q1/c': 1.0, 'q1/d': 3.0, 'q1/e': 3.0, 'q1/f': None}
+        assignments = shard.assign(list(runtimes.keys()), 2, runtimes)
+        loads = [0.0, 0.0]
+        for key, n in assignments.items():
+            loads[n] += runtimes[key] if runtimes[key] is not None else 3.0
+        self.assertEqual(assignments['q1/a'], 0)
+        self.assertLessEqual(abs(loads[0] - loads[1]), 2.0)
+
+    def test_write_load_results(self):
+        results = [
+            CaseResult('q2', '01-expected.txt', False, 'diff', 12.5, 3.0),
+            CaseResult('q1', '01-expected.txt', True, 'ok'),
+        ]
+        with tempfile.TemporaryDirectory() as tempdir:
+            pathname = os.path.join(tempdir, 'results.json')
+            shard.write_results(pathname, results, Shard(1, 2))
+            loaded = shard.load_results(pathname)
+        self.assertEqual(Shard(1, 2), loaded['shard'])
+        self.assertListEqual(sorted(results, key=CaseResult.key), loaded['results'])
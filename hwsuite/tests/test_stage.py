@@ -228,6 +228,27 @@ int main()
         actual = "\n".join(actual_lines)
         self.assertEqual(expected, actual)
 
+    def test__transfer_lines_unbalanced(self):
+        for lines, exception_type, lineno in [
+            (["a", "// stage: cut start", "b"], stage.UnstoppedCutException, 2),
+            (["a", "// stage: cut start", "b", "// stage: cut start", "// stage: cut stop"], stage.UnstoppedCutException, 4),
+            (["a", "b // stage: cut", "// stage: cut stop"], stage.UnstartedCutException, 3),
+        ]:
+            with self.subTest(lines=lines):
+                with self.assertRaises(exception_type) as cm:
+                    stage._transfer_lines(lines)
+                self.assertIn(f"line {lineno}", str(cm.exception))
+
+    def test_stage_unbalanced(self):
+        with tempfile.TemporaryDirectory() as tempdir:
+            os.makedirs(os.path.join(tempdir, 'q1'))
+            hwsuite.tests.write_text_file("int main() {\n// stage: cut start\n", os.path.join(tempdir, 'q1', 'main.cpp'))
+            with self.assertRaises(stage.UnstoppedCutException) as cm:
+                Stager(tempdir).stage('abc123_hw_')
+            self.assertIn('main.cpp', str(cm.exception))
+            self.assertIsInstance(cm.exception.__cause__, stage.UnstoppedCutException)
+            self.assertListEqual([], os.listdir(os.path.join(tempdir, 'stage')))
+
     def test_suggest_prefix_git(self):
         with tempfile.TemporaryDirectory() as proj_root:
             hwsuite.tests.touch_all(proj_root, ['.git/config'])
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+import hwsuite.tests
+from hwsuite import stress, check
+from hwsuite.check import Throttle, StuffConfig
+from hwsuite.testcases import DefinitionsException
+
+hwsuite.tests.configure_logging()
+
+_SUM_SCRIPT = 'read n; s=0; while read x; do s=$((s + x)); done; echo $n; echo $s'
+
+
+class StressSpecTest(TestCase):
+
+    def test_generate_chunks(self):
+        spec = stress.StressSpec.parse({
+            'input': {'header': "5\n", 'line': "{x}\n", 'count': 5, 'fields': {'y': "i * 2", 'x': "y + 1"}, 'footer': "end\n"},
+            'expect': {'predicate': "lines == 1"},
+        }, '.')
+        expected = b"5\n1\n3\n5\n7\n9\nend\n"
+        self.assertEqual(expected, b''.join(stress.generate_chunks(spec)))
+        chunks = list(stress.generate_chunks(spec, chunk_size=4))
+        self.assertEqual(expected, b''.join(chunks))
+        self.assertGreater(len(chunks), 1)
+
+    def test_parse_invalid(self):
+        for model in [
+            {'input': {'line': "{i}\n"}},
+            {'input': {'line': "{i}\n", 'command': ['cat']}, 'expect': {'sha256': ''}},
+            {'input': {'line': "{z}\n"}, 'expect': {'sha256': ''}},
+            {'input': {'line': "{i}\n", 'fields': {'x': "y"}}, 'expect': {'sha256': ''}},
+            {'input': {'line': "{i}\n"}, 'expect': {'predicate': "total > 0"}},
+            {'input': {'line': "{i}\n"}, 'expect': {}},
+        ]:
+            with self.subTest(model=model):
+                with self.assertRaises(DefinitionsException):
+                    stress.StressSpec.parse(model, '.')
+
+    def test_summary(self):
+        summary = stress.OutputSummary()
+        for chunk in (b"a\nb", b"c\nlast", b""):
+            summary.update(chunk)
+        values = summary.values()
+        self.assertEqual(hashlib.sha256(b"a\nbc\nlast").hexdigest(), values['sha256'])
+        self.assertEqual(3, values['lines'])
+        self.assertEqual("last", values['last_line'])
+        summary.update(b"\n")
+        self.assertEqual(3, summary.values()['lines'])
+        self.assertEqual("last", summary.values()['last_line'])
+        spec = stress.StressSpec(predicate="lines == 3 and last_line == 'last'")
+        self.assertIsNone(summary.check(spec))
+        self.assertEqual("sha256", summary.check(spec._replace(sha256="0" * 64)))
+        self.assertEqual("predicate", summary.check(spec._replace(predicate="size < 3")))
+
+    def test_round_trip(self):
+        spec = stress.StressSpec(('gen', '1'), None, 0, (('x', 'i'),), '', '', None, "lines > 0")
+        self.assertEqual(spec, stress.StressSpec.from_model(json.loads(json.dumps(spec.to_model()))))
+
+
+class StressRunTest(TestCase):
+
+    def _run(self, test_case: check.TestCase) -> check.TestCaseOutcome:
+        runner = check.TestCaseRunner('bash', Throttle.default(), StuffConfig.default())
+        return runner.run_test_case(test_case)
+
+    def test_line_template(self):
+        spec = stress.StressSpec.parse({
+            'input': {'header': "20000\n", 'line': "{x}\n", 'count': 20000, 'fields': {'x': "i * 7 % 1000"}},
+            'expect': {'predicate': "lines == 2 and last_line == '9990000'"},
+        }, '.')
+        outcome = self._run(check.TestCase.create_stress('sum', spec, args=['-c', _SUM_SCRIPT]))
+        self.assertTrue(outcome.passed, outcome.message)
+        outcome = self._run(check.TestCase.create_stress('sum', spec._replace(predicate="lines == 3"), args=['-c', _SUM_SCRIPT]))
+        self.assertFalse(outcome.passed)
+        self.assertEqual("predicate", outcome.message)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            generator = hwsuite.tests.write_text_file("#!/bin/sh\necho 3\nseq 1 3\n", os.path.join(q_dir, 'gen.sh'))
+            os.chmod(generator, 0o755)
+            defs_file = hwsuite.tests.write_text_file(json.dumps({'stress': [{
+                'name': 'gen',
+                'input': {'command': ['./gen.sh']},
+                'expect': {'sha256': hashlib.sha256(b"3\n6\n").hexdigest()},
+                'args': ['-c', _SUM_SCRIPT],
+            }]}), os.path.join(q_dir, 'test-cases.json'))
+            test_cases = check.create_stress_test_cases(defs_file)
+            self.assertEqual(1, len(test_cases))
+            outcome = self._run(test_cases[0])
+            self.assertTrue(outcome.passed, outcome.message)
+
+    def test_program_stops_reading(self):
+        spec = stress.StressSpec(line="{i}\n", count=1000000, predicate="last_line == '0'")
+        outcome = self._run(check.TestCase.create_stress('head', spec, args=['-c', 'read x; echo $x']))
+        self.assertTrue(outcome.passed, outcome.message)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from unittest import TestCase
+from hwsuite import testcases, corpus
+import hwsuite.tests
+
+hwsuite.tests.configure_logging()
+
+
+def _write_definitions(q_dir: str, cases) -> str:
+    model = {
+        'input_file': 'input-template.txt',
+        'expected': "{a} + {b} = {c}\n",
+        'param_names': ['a', 'b', 'c'],
+        'test_cases': cases,
+    }
+    hwsuite.tests.write_text_file("{a}\n{b}\n", os.path.join(q_dir, 'input-template.txt'))
+    return hwsuite.tests.write_text_file(json.dumps(model), os.path.join(q_dir, 'test-cases.json'))
+
+
+class CompiledTemplateTest(TestCase):
+
+    def test_render(self):
+        params = {'a': 3, 'b': 'x', 'xs': [1, 2], 'w': 5}
+        for template in ("{a} + {a} = {b}\n", "{{literal}} {a:03d}|{b!r}|{xs[1]}|{a:>{w}}", "no fields", "", "{b}"):
+            with self.subTest(template=template):
+                compiled = testcases.CompiledTemplate(template)
+                self.assertEqual(template.format(**params), compiled.render(params))
+        self.assertEqual(frozenset(['a', 'xs', 'w']), testcases.CompiledTemplate("{a:>{w}} {xs[0]}").fields)
+
+    def test_invalid(self):
+        for template in ("{}", "{0}", "{a", "a}"):
+            with self.subTest(template=template):
+                with self.assertRaises(testcases.DefinitionsException):
+                    testcases.CompiledTemplate(template)
+
+
+class ModuleTest(TestCase):
+
+    def test_produce_if_changed(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            defs_file = _write_definitions(q_dir, [[1, 2, 3], [2, 2, 4]])
+            cases_dir = os.path.join(q_dir, 'test-cases')
+            self.assertTrue(testcases.produce_if_changed(defs_file))
+            self.assertEqual("2 + 2 = 4\n", Path(cases_dir, '2-expected.txt').read_text())
+            mtimes = {f: os.stat(os.path.join(cases_dir, f)).st_mtime_ns for f in os.listdir(cases_dir)}
+            self.assertFalse(testcases.produce_if_changed(defs_file))
+            # touched but unchanged
+            st = os.stat(defs_file)
+            os.utime(defs_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+            self.assertFalse(testcases.produce_if_changed(defs_file))
+            self.assertFalse(testcases.produce_if_changed(defs_file))
+            # changed case rewrites only the files whose content changed
+            _write_definitions(q_dir, [[1, 2, 3], [2, 3, 5]])
+            os.utime(defs_file, ns=(st.st_atime_ns, st.st_mtime_ns + 2000000000))
+            self.assertTrue(testcases.produce_if_changed(defs_file))
+            self.assertEqual("2 + 3 = 5\n", Path(cases_dir, '2-expected.txt').read_text())
+            self.assertEqual(mtimes['1-expected.txt'], os.stat(os.path.join(cases_dir, '1-expected.txt')).st_mtime_ns)
+            self.assertEqual(mtimes['1-input.txt'], os.stat(os.path.join(cases_dir, '1-input.txt')).st_mtime_ns)
+            # deleted output is regenerated
+            os.remove(os.path.join(cases_dir, '1-input.txt'))
+            self.assertTrue(testcases.produce_if_changed(defs_file))
+            self.assertEqual("1\n2\n", Path(cases_dir, '1-input.txt').read_text())
+
+    def test_defines_rendered_cases(self):
+        self.assertFalse(testcases.defines_rendered_cases({'stress': []}))
+        self.assertTrue(testcases.defines_rendered_cases({'stress': [], 'expected': "", 'test_cases': []}))
+        with tempfile.TemporaryDirectory() as q_dir:
+            defs_file = hwsuite.tests.write_text_file(json.dumps({'inputs': "{a}\n", 'expected': "{a}\n", 'test_cases': [{'a': 1}]}),
+                                                      os.path.join(q_dir, 'test-cases.json'))
+            with self.assertRaises(ValueError):
+                testcases.produce_if_changed(defs_file)
+
+    def test_produce_if_changed_template(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            defs_file = _write_definitions(q_dir, [[1, 2, 3]])
+            self.assertTrue(testcases.produce_if_changed(defs_file))
+            template_file = os.path.join(q_dir, 'input-template.txt')
+            hwsuite.tests.write_text_file("{a} {b}\n", template_file)
+            st = os.stat(template_file)
+            os.utime(template_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+            self.assertTrue(testcases.produce_if_changed(defs_file))
+            self.assertEqual("1 2\n", Path(q_dir, 'test-cases', '1-input.txt').read_text())
+
+    def test_generators(self):
+        param_source = testcases.ParameterSource.load({
+            'input': "{a} {b}\n",
+            'expected': "{c}\n",
+            'test_cases': [{'a': 0, 'b': 0}],
+            'generators': [
+                {'product': {'a': {'range': [1, 4]}, 'b': [10, 20]}},
+                {'random': {'a': {'randint': [1, 9]}, 'b': ['x', 'y']}, 'count': 3, 'seed': 7},
+            ],
+            'computed': {'c': "str(a) + str(b)"},
+        }, '.')
+        self.assertEqual(10, param_source.count())
+        self.assertEqual(2, param_source.precision())
+        rendered = list(param_source.render_all())
+        self.assertListEqual([('01', "0 0\n", "00\n"), ('02', "1 10\n", "110\n"), ('03', "1 20\n", "120\n")], rendered[:3])
+        self.assertEqual(('07', "3 20\n", "320\n"), rendered[6])
+        self.assertListEqual(rendered, list(param_source.render_all()))
+        for _, input_text, _ in rendered[7:]:
+            a, b = input_text.split()
+            self.assertIn(int(a), range(1, 10))
+            self.assertIn(b, ('x', 'y'))
+
+    def test_generators_lazy(self):
+        param_source = testcases.ParameterSource.load({
+            'input': "{n}\n",
+            'expected': "{square}\n",
+            'generators': [{'product': {'n': {'range': [0, 100000]}}}],
+            'computed': {'square': "n * n"},
+        }, '.')
+        self.assertEqual(100000, param_source.count())
+        self.assertEqual(6, param_source.precision())
+        rendered = param_source.render_all()
+        self.assertEqual(('000001', "0\n", "0\n"), next(rendered))
+        self.assertEqual(('000002', "1\n", "1\n"), next(rendered))
+
+    def test_render_at_index(self):
+        param_source = testcases.ParameterSource.load({
+            'input': "{a} {b}\n",
+            'expected': "{c}\n",
+            'test_cases': [{'a': 0, 'b': 0}],
+            'generators': [
+                {'product': {'a': {'range': [1, 4]}, 'b': [10, 20]}},
+                {'random': {'a': {'randint': [1, 999]}, 'b': {'uniform': [0, 1]}}, 'count': 3000, 'seed': 7},
+            ],
+            'computed': {'c': "str(a) + str(b)"},
+        }, '.')
+        rendered = list(param_source.render_all())
+        for index in (2900, 5, 0, 2500, 1024 + 7, 1024 + 6, 1024 + 7, 2048 + 7, 1):
+            with self.subTest(index=index):
+                _, input_text, expected_text = rendered[index]
+                self.assertEqual(input_text, param_source.input_text_at(index))
+                self.assertEqual(expected_text, param_source.expected_text_at(index))
+        with self.assertRaises(IndexError):
+            param_source.params_at(param_source.count())
+
+    def test_generators_invalid(self):
+        for generator in ({'random': {'a': [1]}}, {'zip': {}}, {'product': {'a': 3}}):
+            with self.subTest(generator=generator):
+                with self.assertRaises(ValueError):
+                    testcases.ParameterSource.load({'input': "", 'expected': "", 'generators': [generator]}, '.')
+
+    def test_validate(self):
+        with self.assertRaises(testcases.DefinitionsException) as cm:
+            testcases.ParameterSource.load({'input': "{a}", 'expected': "{b}", 'test_cases': [{'a': 1, 'b': 2}, {'a': 1}]}, '.')
+        self.assertIn("test case 2", str(cm.exception))
+        with self.assertRaises(testcases.DefinitionsException):
+            testcases.ParameterSource.load({'input': "{a}", 'expected': "{c}", 'generators': [{'product': {'a': [1]}}]}, '.')
+        with self.assertRaises(testcases.DefinitionsException):
+            testcases.ParameterSource.load({'input': "{a}", 'expected': "{c}", 'generators': [{'product': {'a': [1]}}],
+                                            'computed': {'c': "a + b"}}, '.')
+
+    def test_validate_before_writing(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            defs_file = _write_definitions(q_dir, [[1, 2, 3], [2, 2]])
+            with self.assertRaises(testcases.DefinitionsException):
+                testcases.produce_if_changed(defs_file, onerror='raise')
+            self.assertFalse(os.path.exists(os.path.join(q_dir, 'test-cases')))
+
+    def test_produce_all(self):
+        with tempfile.TemporaryDirectory() as proj_dir:
+            defs_files = []
+            for i in range(3):
+                q_dir = os.path.join(proj_dir, f"q{i}")
+                os.makedirs(q_dir)
+                defs_files.append(_write_definitions(q_dir, [[i, i, 2 * i]] if i != 1 else [[1, 1, 2], [1]]))
+            self.assertEqual(2, testcases.produce_all(defs_files, max_workers=2))
+            self.assertEqual("2 + 2 = 4\n", Path(proj_dir, 'q2', 'test-cases', '1-expected.txt').read_text())
+            self.assertFalse(os.path.exists(os.path.join(proj_dir, 'q1', 'test-cases')))
+            for max_workers in (2, 1):
+                with self.subTest(max_workers=max_workers):
+                    shutil.rmtree(os.path.join(proj_dir, 'q2', 'test-cases'))
+                    with self.assertRaises(testcases.DefinitionsException):
+                        testcases.produce_all(defs_files, force=True, onerror='raise', max_workers=max_workers)
+                    self.assertTrue(os.path.exists(os.path.join(proj_dir, 'q2', 'test-cases', '1-expected.txt')))
+
+    def test_write_cases_prunes_stale(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            cases_dir = os.path.join(q_dir, 'test-cases')
+            os.makedirs(cases_dir)
+            hwsuite.tests.write_text_file("legacy\n", os.path.join(cases_dir, '7-expected.txt'))
+            hwsuite.tests.write_text_file("hand-written\n", os.path.join(cases_dir, 'extra-expected.txt'))
+            model = {'input': "{a}\n", 'expected': "{a}\n", 'generators': [{'product': {'a': list(range(12))}}]}
+            testcases.write_cases(testcases.ParameterSource.load(model, q_dir), cases_dir)
+            self.assertIn('12-expected.txt', testcases.read_manifest(cases_dir))
+            self.assertEqual("6\n", Path(cases_dir, '07-expected.txt').read_text())
+            self.assertEqual("legacy\n", Path(cases_dir, '7-expected.txt').read_text())
+            model['generators'] = [{'product': {'a': [0, 1, 2]}}]
+            self.assertEqual(3, testcases.write_cases(testcases.ParameterSource.load(model, q_dir), cases_dir))
+            expected = ['1-expected.txt', '1-input.txt', '2-expected.txt', '2-input.txt', '3-expected.txt', '3-input.txt']
+            self.assertListEqual(expected, testcases.read_manifest(cases_dir))
+            self.assertListEqual(sorted(expected + [testcases.MANIFEST_BASENAME, '7-expected.txt', 'extra-expected.txt']), sorted(os.listdir(cases_dir)))
+
+    def test_produce_corpus_layout(self):
+        with tempfile.TemporaryDirectory() as q_dir:
+            defs_file = _write_definitions(q_dir, [[1, 2, 3], [2, 2, 4]])
+            self.assertTrue(testcases.produce_if_changed(defs_file))
+            self.assertTrue(os.path.isdir(os.path.join(q_dir, 'test-cases')))
+            model = json.loads(Path(defs_file).read_text())
+            model['layout'] = 'corpus'
+            hwsuite.tests.write_text_file(json.dumps(model), defs_file)
+            st = os.stat(defs_file)
+            os.utime(defs_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+            self.assertTrue(testcases.produce_if_changed(defs_file))
+            self.assertFalse(testcases.produce_if_changed(defs_file))
+            self.assertFalse(os.path.exists(os.path.join(q_dir, 'test-cases')))
+            with corpus.Corpus(os.path.join(q_dir, 'test-cases.corpus')) as c:
+                self.assertListEqual(['1', '2'], c.names())
+                self.assertEqual("2 + 2 = 4\n", c.read_expected('2'))
+                self.assertEqual("1\n2\n", c.read_input('1'))
+            with self.assertRaises(testcases.DefinitionsException):
+                testcases.ParameterSource.load({'input': "", 'expected': "", 'layout': 'zip'}, q_dir)
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+import json
+import os
+import tempfile
+import threading
+from unittest import TestCase
+from hwsuite import tracing
+from hwsuite.tracing import Tracer
+import hwsuite.tests
+
+hwsuite.tests.configure_logging()
+
+
+class TracerTest(TestCase):
+
+    def test_span(self):
+        tracer = Tracer()
+        with tracer.span('build', project='hw1') as span_args:
+            span_args['extra'] = 1
+        self.assertEqual(1, len(tracer.events))
+        event = tracer.events[0]
+        self.assertEqual('build', event['name'])
+        self.assertEqual('X', event['ph'])
+        self.assertEqual(tracing.MAIN_TRACK, event['tid'])
+        self.assertDictEqual({'project': 'hw1', 'extra': 1}, event['args'])
+        self.assertGreaterEqual(event['dur'], 0)
+
+    def test_tracks(self):
+        tracer = Tracer()
+
+        def work(track: int):
+            tracer.bind_track(track, f"worker {track}")
+            with tracer.span('case', case=str(track)):
+                pass
+        threads = [threading.Thread(target=work, args=(track,)) for track in (1, 2, 3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertSetEqual({1, 2, 3}, set(e['tid'] for e in tracer.events))
+        trace = tracer.to_dict()
+        thread_names = [e['args']['name'] for e in trace['traceEvents'] if e['name'] == 'thread_name']
+        self.assertListEqual(['main', 'worker 1', 'worker 2', 'worker 3'], thread_names)
+
+    def test_write(self):
+        tracer = Tracer()
+        with tracer.span('generate', question='q1'):
+            with tracer.span('render'):
+                pass
+        with tempfile.TemporaryDirectory() as tempdir:
+            pathname = os.path.join(tempdir, 'trace.json')
+            tracer.write(pathname)
+            with open(pathname, 'r') as ifile:
+                trace = json.load(ifile)
+        spans = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+        self.assertListEqual(['generate', 'render'], [e['name'] for e in spans])
+
+    def test_null_tracer(self):
+        tracer = tracing.NULL_TRACER
+        with tracer.span('case', question='q1') as span_args:
+            span_args['passed'] = True
+        self.assertFalse(tracer.enabled())
+        self.assertListEqual([], tracer.events)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+
+"""
+    tracing.py records spans of work and exports them in Chrome trace-event format.
+
+    The exported file can be opened with chrome://tracing or https://ui.perfetto.dev.
+"""
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+_log = logging.getLogger(__name__)
+MAIN_TRACK = 0
+
+
+class Tracer(object):
+    """Collects complete-duration events from any number of threads.
+
+    Each thread reports its spans on a track. Threads are on the main track
+    unless they bind to another track, which is how test case worker slots
+    get one track each regardless of which thread runs the case."""
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.origin = clock()
+        self.pid = os.getpid()
+        self.events: List[Dict[str, Any]] = []
+        self.track_names: Dict[int, str] = {MAIN_TRACK: 'main'}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enabled(self) -> bool:
+        return True
+
+    def bind_track(self, track: int, name: Optional[str]=None):
+        """Binds the current thread to a track, so that subsequent spans are reported there."""
+        self._local.track = track
+        if name is not None:
+            with self._lock:
+                self.track_names[track] = name
+
+    def current_track(self) -> int:
+        return getattr(self._local, 'track', MAIN_TRACK)
+
+    def _micros(self, t: float) -> float:
+        return round((t - self.origin) * 1000000, 3)
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str='check', **args):
+        """Context manager that records a span covering the body of the with-statement.
+
+        The yielded dictionary holds the span arguments; entries may be added to it
+        inside the body, e.g. to annotate the span with a result."""
+        start = self.clock()
+        try:
+            yield args
+        finally:
+            end = self.clock()
+            event = {
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': self._micros(start),
+                'dur': round((end - start) * 1000000, 3),
+                'pid': self.pid,
+                'tid': self.current_track(),
+                'args': args,
+            }
+            with self._lock:
+                self.events.append(event)
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            events = list(self.events)
+            track_names = dict(self.track_names)
+        metadata = [{
+            'name': 'process_name',
+            'ph': 'M',
+            'pid': self.pid,
+            'args': {'name': 'hwsuite'},
+        }]
+        for track, track_name in sorted(track_names.items()):
+            metadata.append({
+                'name': 'thread_name',
+                'ph': 'M',
+                'pid': self.pid,
+                'tid': track,
+                'args': {'name': track_name},
+            })
+            metadata.append({
+                'name': 'thread_sort_index',
+                'ph': 'M',
+                'pid': self.pid,
+                'tid': track,
+                'args': {'sort_index': track},
+            })
+        return {
+            'traceEvents': metadata + sorted(events, key=lambda e: e['ts']),
+            'displayTimeUnit': 'ms',
+        }
+
+    def write(self, pathname: str):
+        with open(pathname, 'w') as ofile:
+            json.dump(self.to_dict(), ofile)
+        _log.debug("%s trace events written to %s", len(self.events), pathname)
+
+
+class NullTracer(Tracer):
+    """Tracer that records nothing."""
+
+    def enabled(self) -> bool:
+        return False
+
+    def bind_track(self, track: int, name: Optional[str]=None):
+        pass
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str='check', **args):
+        yield args
+
+
+NULL_TRACER = NullTracer()